@@ -0,0 +1,111 @@
+"""
+    vectorized backtest of a Strategy over a full candle history
+"""
+import numpy as np
+from pandas import DataFrame
+
+from indicators import _kernel
+
+# BitMEX taker fee
+TAKER_FEE = 0.00075
+
+
+@_kernel
+def _simulate(signal, price, mark, qty, fee):
+    """
+    replays Trader.execute_trade on the XBTUSD inverse contract
+
+    buy closes a short and then buys qty contracts, sell closes a long and then sells
+    qty contracts, take profit closes any position. Profit and fees are in XBT.
+    """
+    n = signal.shape[0]
+    position = np.zeros(n)
+    equity = np.zeros(n)
+    fees = np.zeros(n)
+
+    pos = 0.0
+    cost = 0.0  # sum of contracts / entry price of the open position
+    realized = 0.0
+    paid = 0.0
+
+    for i in range(n):
+        s = signal[i]
+        p = price[i]
+
+        if s != 0:
+            close = (s == 1 and pos < 0) or (s == 2 and pos > 0) or (s == 3 and pos != 0)
+            if close:
+                realized += cost - pos / p
+                paid += abs(pos) / p * fee
+                pos = 0.0
+                cost = 0.0
+
+            if s == 1 or s == 2:
+                delta = qty if s == 1 else -qty
+                pos += delta
+                cost += delta / p
+                paid += qty / p * fee
+
+        position[i] = pos
+        fees[i] = paid
+        equity[i] = realized + cost - pos / mark[i] - paid
+
+    return position, equity, fees
+
+
+def backtest(df, strategy, money_to_trade=100, leverage=5, fee=TAKER_FEE, signals=None) -> DataFrame:
+    """
+    runs the strategy over every bar of df at once
+
+    Orders are filled at the open of the bar after the signal, which is when the live
+    bot sends them; a signal on the last bar fills at its close.
+
+    :param df: dataframe containing date/open/high/low/close/volume
+    :param strategy: object with signals(df) like Strategy
+    :param money_to_trade: same meaning as in Trader
+    :param leverage: same meaning as in Trader
+    :param fee: fee rate charged on the notional of every fill
+    :param signals: precomputed predictions, computed from strategy if None
+    :return: DataFrame with signal, position (contracts), fees and equity (XBT) per bar
+    """
+    if signals is None:
+        signals = strategy.signals(df)
+
+    close = np.ascontiguousarray(df['close'], dtype=np.float64)
+    fill = np.empty_like(close)
+    fill[:-1] = df['open'].values[1:]
+    fill[-1:] = close[-1:]
+
+    position, equity, fees = _simulate(np.asarray(signals, dtype=np.int8), fill, close,
+                                       float(money_to_trade * leverage), float(fee))
+
+    result = DataFrame({
+        'signal': signals,
+        'position': position,
+        'fees': fees,
+        'equity': equity,
+    }, index=df.index)
+    if 'date' in df:
+        result.insert(0, 'date', df['date'].values)
+
+    return result
+
+
+def summary(result) -> dict:
+    """
+    :param result: output of backtest
+    :return: dict with the headline numbers of a backtest
+    """
+    equity = result['equity'].values
+    position = result['position'].values
+
+    changes = np.count_nonzero(np.diff(position, prepend=0.0))
+    drawdown = np.maximum.accumulate(np.maximum(equity, 0.0)) - equity
+
+    return {
+        'bars': len(result),
+        'trades': int(changes),
+        'profit': float(equity[-1]) if len(equity) else 0.0,
+        'fees': float(result['fees'].values[-1]) if len(equity) else 0.0,
+        'max_drawdown': float(drawdown.max()) if len(equity) else 0.0,
+    }
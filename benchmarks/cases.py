@@ -0,0 +1,95 @@
+"""
+    one benchmark case per public function of indicators.py and util.py
+"""
+import inspect
+
+import indicators
+import util
+
+MODULES = (indicators, util)
+
+
+class Case():
+    """
+    :param func: function under test
+    :param setup: callable(df) -> positional arguments of func, run outside the timing
+    :param max_rows: larger inputs are skipped, for functions that never see them in practice
+    """
+
+    def __init__(self, func, setup=None, max_rows=None):
+        self.func = func
+        self.name = '{}.{}'.format(func.__module__, func.__name__)
+        self.setup = setup or (lambda df: (df,))
+        self.max_rows = max_rows
+
+
+def _copy(df):
+    # for functions that add their result columns to the input frame
+    return (df.copy(),)
+
+
+def _payload(df):
+    # the /trade/bucketed format as the bravado client returns it
+    return ([{'timestamp': date.to_pydatetime(), 'symbol': 'XBTUSD', 'open': o, 'high': h, 'low': l,
+              'close': c, 'trades': 1, 'volume': v, 'vwap': c, 'lastSize': 1, 'turnover': 1,
+              'homeNotional': 1.0, 'foreignNotional': 1.0}
+             for date, o, h, l, c, v in zip(df['date'], df['open'], df['high'], df['low'], df['close'],
+                                            df['volume'])],)
+
+
+CASES = [
+    Case(indicators.heikinashi),
+    Case(indicators.crossed, lambda df: (df['close'], df['open'])),
+    Case(indicators.crossed_above, lambda df: (df['close'], df['open'])),
+    Case(indicators.crossed_below, lambda df: (df['close'], df['open'])),
+    Case(indicators.aroon, _copy),
+    Case(indicators.atr, lambda df: (df, 14)),
+    Case(indicators.atr_percent, lambda df: (df, 14)),
+    Case(indicators.bollinger_bands, _copy),
+    Case(indicators.cmf),
+    Case(indicators.accumulation_distribution),
+    Case(indicators.osc),
+    Case(indicators.cmo, lambda df: (df, 14)),
+    Case(indicators.hull_moving_average, lambda df: (df, 14)),
+    Case(indicators.cci, lambda df: (df, 14)),
+    Case(indicators.vfi),
+    Case(indicators.mmar),
+    Case(indicators.madrid_sqz),
+    Case(indicators.stc, _copy),
+    Case(indicators.laguerre),
+    Case(indicators.ichimoku),
+    Case(indicators.ema, lambda df: (df, 14)),
+    Case(indicators.tema, lambda df: (df, 14)),
+    Case(indicators.sma, lambda df: (df, 14)),
+    Case(indicators.vpcii),
+    Case(indicators.vpci),
+    Case(indicators.williams_percent),
+    Case(indicators.momentum),
+    Case(indicators.vwma, lambda df: (df, 14)),
+    Case(indicators.ultimate_oscilator),
+
+    # the API returns 1000 bins per page, a million row payload is never parsed at once
+    Case(util.parse_dataframe, _payload, max_rows=100000),
+    Case(util.resample_to_interval, lambda df: (df, '1h')),
+    Case(util.resampled_merge, lambda df: (df, util.resample_to_interval(df, '1h'))),
+    Case(util.compute_interval),
+    Case(util.synthetic_ohlcv, lambda df: (len(df),)),
+]
+
+
+def public_functions() -> list:
+    """
+    :return: names of every public function defined in MODULES
+    """
+    return ['{}.{}'.format(module.__name__, name)
+            for module in MODULES
+            for name, func in inspect.getmembers(module, inspect.isfunction)
+            if not name.startswith('_') and func.__module__ == module.__name__]
+
+
+def uncovered() -> list:
+    """
+    :return: public functions without a case, a new function has to be added to CASES
+    """
+    covered = {case.name for case in CASES}
+    return [name for name in public_functions() if name not in covered]
@@ -0,0 +1,63 @@
+"""
+    times cache.IndicatorCache hits and one bar extensions against recomputing the indicator
+
+    python -m benchmarks.indicator_cache
+    python -m benchmarks.indicator_cache --rows 1000,1000000 --kernel laguerre
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from cache import IndicatorCache
+from util import synthetic_ohlcv
+
+PARAMS = {'ema': {'period': 14}, 'sma': {'period': 14}, 'laguerre': {'gamma': 0.75}}
+
+
+def _best(func, repeat=20) -> float:
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - started)
+    return min(times)
+
+
+def measure(kernel, n, repeat=20) -> dict:
+    """
+    :return: best seconds of recompute, hit and extend by one bar, with and without a source id
+    """
+    values = synthetic_ohlcv(n + repeat + 1, seed=0)['close'].to_numpy()
+    params = PARAMS[kernel]
+    compute = IndicatorCache()._kernels[kernel][0]
+    results = {'recompute': _best(lambda: compute(values[:n], **params), repeat)}
+
+    for mode, source in (('hashed', None), ('source', 'bench')):
+        cache = IndicatorCache()
+        cache.get(kernel, values[:n], source=source, **params)
+        results[mode + ' hit'] = _best(lambda: cache.get(kernel, values[:n], source=source, **params), repeat)
+
+        bars = iter(range(n + 1, n + repeat + 2))
+        results[mode + ' extend'] = _best(lambda: cache.get(kernel, values[:next(bars)], source=source, **params),
+                                          repeat)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='IndicatorCache hit and extension against recompute')
+    parser.add_argument('--rows', default='1000,10000,100000,1000000', help='comma separated input sizes')
+    parser.add_argument('--kernel', default='ema', choices=sorted(PARAMS))
+    args = parser.parse_args(argv)
+
+    measure(args.kernel, 200, repeat=2)  # JIT compilation is not timed
+    for n in (int(float(r)) for r in args.rows.split(',')):
+        results = measure(args.kernel, n)
+        print('{:<9} {:>8} '.format(args.kernel, n) + '  '.join(
+            '{} {:.3f}ms'.format(name, seconds * 1000) for name, seconds in results.items()))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,91 @@
+"""
+    offline tick-to-signal latency: candles replayed by a LocalBitmexServer through a MarketDataFeed into a Strategy
+
+    python -m benchmarks.latency                  # 500 candles after a 1000 bin warm-up
+    python -m benchmarks.latency --candles 2000 --timeframe 5m
+"""
+import argparse
+import asyncio
+import sys
+import time
+
+import numpy as np
+
+from candles import timestamp_ms
+from configuration import TICKER_INTERVAL_MINUTES
+from feed import LocalBitmexServer, MarketDataFeed
+from strategy import Strategy
+from util import synthetic_ohlcv
+
+
+def bucketed(df, symbol='XBTUSD') -> list:
+    """
+    :return: the rows of a synthetic_ohlcv frame as /trade/bucketed dicts, timestamps as ISO strings like the websocket sends them
+    """
+    return [{'timestamp': date.strftime('%Y-%m-%dT%H:%M:%S.000Z'), 'symbol': symbol, 'open': o, 'high': h, 'low': l,
+             'close': c, 'volume': v}
+            for date, o, h, l, c, v in zip(df['date'], df['open'], df['high'], df['low'], df['close'],
+                                           df['volume'])]
+
+
+async def measure(strategy, candles, timeout=5.0) -> list:
+    """
+    publishes the candles one at a time and waits for each signal before sending the next,
+    so every sample is the time from the server sending a candle to predict() returning
+    on it, without queueing behind the previous one
+
+    :param strategy: Strategy with its candle buffer already filled, predict runs without refresh
+    :param candles: /trade/bucketed dicts newer than the ones in the buffer
+    :return: list of seconds, one per candle
+    """
+    timeframe = strategy.timeframe
+    server = await LocalBitmexServer().start()
+    feed = MarketDataFeed(symbols=[strategy.symbol], timeframes=[timeframe], url=server.url, trades=False)
+    latencies = []
+    signalled = asyncio.Event()
+
+    def on_candle(symbol, tf, candle):
+        strategy.on_candle(candle)
+        strategy.predict(refresh=False)
+        now = time.perf_counter()
+        latencies.append(now - server.sent_at[(symbol, tf, timestamp_ms(candle['timestamp']))])
+        signalled.set()
+
+    feed.on_candle(on_candle)
+    task = asyncio.create_task(feed.run())
+    try:
+        while not any(server._clients.values()):
+            await asyncio.sleep(0.01)
+
+        for candle in candles:
+            signalled.clear()
+            await server.publish_candle(timeframe, candle)
+            await asyncio.wait_for(signalled.wait(), timeout)
+    finally:
+        await feed.stop()
+        await task
+        await server.close()
+    return latencies
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='offline tick-to-signal latency of the streaming strategy')
+    parser.add_argument('--candles', type=int, default=500, help='candles to measure')
+    parser.add_argument('--history', type=int, default=1000, help='bins in the buffer before the first one')
+    parser.add_argument('--timeframe', default='1m')
+    args = parser.parse_args(argv)
+
+    rows = bucketed(synthetic_ohlcv(args.history + args.candles, seed=0,
+                                    interval=TICKER_INTERVAL_MINUTES[args.timeframe]))
+    strategy = Strategy(client=None, timeframe=args.timeframe, history=args.history)
+    strategy.candles.extend(rows[:args.history])
+    strategy.predict(refresh=False)  # JIT compilation is not timed
+
+    latencies = np.array(asyncio.run(measure(strategy, rows[args.history:]))) * 1000
+    print('{} candles, tick-to-signal ms: p50 {:.2f} p95 {:.2f} p99 {:.2f} max {:.2f}'.format(
+        len(latencies), *np.percentile(latencies, [50, 95, 99]), latencies.max()))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
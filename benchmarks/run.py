@@ -0,0 +1,184 @@
+"""
+    times every case of benchmarks/cases.py on synthetic candles and compares with a saved baseline
+
+    python -m benchmarks.run                  # run and compare with benchmarks/baseline.json
+    python -m benchmarks.run --save           # run and store the results as the new baseline
+    python -m benchmarks.run --rows 1000,10000 --only mmar,vfi
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas
+
+from benchmarks.cases import CASES, uncovered
+from util import synthetic_ohlcv
+
+ROWS = (1000, 10000, 100000, 1000000)
+BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+
+def measure(case, df, min_time=0.2, max_repeat=5) -> dict:
+    """
+    best time of up to max_repeat calls (stopping once min_time is spent) and the peak
+    allocation traced by tracemalloc (Python and NumPy, not numba internals) of one more call
+
+    :return: dict with status, seconds, median, repeats and peak_bytes
+    """
+    times = []
+    try:
+        while len(times) < max_repeat and sum(times) < min_time:
+            args = case.setup(df)
+            started = time.perf_counter()
+            case.func(*args)
+            times.append(time.perf_counter() - started)
+
+        args = case.setup(df)
+        gc.collect()
+        tracemalloc.start()
+        try:
+            case.func(*args)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    except Exception as e:
+        return {'status': 'error', 'error': repr(e)[:200]}
+
+    return {'status': 'ok', 'seconds': min(times), 'median': statistics.median(times),
+            'repeats': len(times), 'peak_bytes': peak}
+
+
+def run(rows=ROWS, only=None, budget=10.0, out=sys.stdout) -> dict:
+    """
+    :param rows: input sizes, ascending
+    :param only: case names (or their suffixes) to run, all if None
+    :param budget: a case slower than this many seconds per call is not run at larger sizes
+    :return: results in the baseline format
+    """
+    cases = [c for c in CASES if only is None or any(c.name == o or c.name.endswith('.' + o) for o in only)]
+    results = {case.name: {} for case in cases}
+    stopped = {}
+
+    # one untimed call on a small frame first, so JIT compilation is not timed
+    small = synthetic_ohlcv(200, seed=0)
+    for case in cases:
+        try:
+            case.func(*case.setup(small))
+        except Exception:
+            pass
+
+    for n in rows:
+        df = synthetic_ohlcv(n, seed=0)
+        for case in cases:
+            if case.name in stopped:
+                result = {'status': 'skipped', 'reason': stopped[case.name]}
+            elif case.max_rows is not None and n > case.max_rows:
+                result = {'status': 'skipped', 'reason': 'over max_rows {}'.format(case.max_rows)}
+            else:
+                result = measure(case, df)
+                if result['status'] == 'error':
+                    stopped[case.name] = 'error at {} rows'.format(n)
+                elif result['seconds'] > budget:
+                    stopped[case.name] = 'over budget at {} rows'.format(n)
+            results[case.name][str(n)] = result
+            print(_line(case.name, n, result), file=out, flush=True)
+
+    return {
+        'meta': {
+            'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pandas': pandas.__version__,
+            'machine': platform.machine(),
+            'processor': platform.processor(),
+        },
+        'results': results,
+    }
+
+
+def compare(results, baseline, threshold=0.25, min_delta=0.0005) -> list:
+    """
+    :param threshold: relative slowdown or memory growth flagged as a regression
+    :param min_delta: time differences below this many seconds are noise
+    :return: list of (case, rows, description) of every regression
+    """
+    regressions = []
+    for name, sizes in results['results'].items():
+        for n, result in sizes.items():
+            base = baseline.get('results', {}).get(name, {}).get(n)
+            if base is None or base['status'] != 'ok':
+                continue
+            if result['status'] == 'error':
+                regressions.append((name, n, 'now fails: {}'.format(result['error'])))
+            if result['status'] != 'ok':
+                continue
+            if result['seconds'] > base['seconds'] * (1 + threshold) and \
+                    result['seconds'] - base['seconds'] > min_delta:
+                regressions.append((name, n, 'time {:.4f}s -> {:.4f}s'.format(base['seconds'], result['seconds'])))
+            if result['peak_bytes'] > base['peak_bytes'] * (1 + threshold) and \
+                    result['peak_bytes'] - base['peak_bytes'] > 1024 * 1024:
+                regressions.append((name, n, 'peak memory {:.1f}MB -> {:.1f}MB'.format(
+                    base['peak_bytes'] / 1e6, result['peak_bytes'] / 1e6)))
+    return regressions
+
+
+def _line(name, n, result) -> str:
+    if result['status'] == 'ok':
+        detail = '{:>10.2f}ms {:>9.1f}MB'.format(result['seconds'] * 1000, result['peak_bytes'] / 1e6)
+    else:
+        detail = '{} ({})'.format(result['status'], result.get('error') or result.get('reason'))
+    return '{:<36} {:>8} {}'.format(name, n, detail)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='benchmarks every public function of indicators.py and util.py')
+    parser.add_argument('--rows', default=','.join(str(n) for n in ROWS), help='comma separated input sizes')
+    parser.add_argument('--only', default=None, help='comma separated function names')
+    parser.add_argument('--budget', type=float, default=10.0,
+                        help='seconds per call above which larger sizes are skipped')
+    parser.add_argument('--baseline', default=BASELINE, help='baseline file to compare with or save to')
+    parser.add_argument('--save', action='store_true', help='store the results as the new baseline')
+    parser.add_argument('--output', default=None, help='also write the results to this file')
+    parser.add_argument('--threshold', type=float, default=0.25, help='relative slowdown flagged as regression')
+    args = parser.parse_args(argv)
+
+    missing = uncovered()
+    if missing:
+        print('No benchmark case for: {}'.format(', '.join(missing)))
+
+    rows = sorted(int(float(n)) for n in args.rows.split(','))
+    results = run(rows, args.only.split(',') if args.only else None, args.budget)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+
+    if args.save:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+        print('Baseline written to {}'.format(args.baseline))
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print('No baseline at {}, run with --save to create one'.format(args.baseline))
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.threshold)
+    for name, n, description in regressions:
+        print('REGRESSION {} at {} rows: {}'.format(name, n, description))
+    print('{} regressions against {}'.format(len(regressions), args.baseline))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,293 @@
+"""
+    content-addressed memoization of indicator results with LRU eviction
+"""
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+from pandas import DataFrame, Series
+
+from frames import ArrayFrame
+from indicators import _ema_kernel, LaguerreState
+
+
+def fingerprint(*columns) -> str:
+    """
+    hash of every value of the columns, about 10ms per 1e6 rows
+
+    :param columns: 1D arrays or Series of the same length
+    :return: hex digest
+    """
+    h = hashlib.blake2b(digest_size=16)
+    for column in columns:
+        values = np.ascontiguousarray(column, dtype=np.float64)
+        h.update(values.shape[0].to_bytes(8, 'little'))
+        h.update(values.tobytes())
+    return h.hexdigest()
+
+
+def _key(value):
+    """
+    hashable stand-in of an indicator argument, lists and dicts become tuples, arrays
+    their fingerprint
+    """
+    if isinstance(value, (np.ndarray, Series)):
+        return 'array', fingerprint(value)
+    if isinstance(value, (list, tuple)):
+        return tuple(_key(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, _key(v)) for k, v in value.items()))
+    try:
+        hash(value)
+    except TypeError:
+        return 'repr', repr(value)
+    return value
+
+
+def _copy(result):
+    """
+    pandas results are copied each way, the cached one is then never the frame an
+    indicator added its columns to nor one a caller modifies
+    """
+    if isinstance(result, (DataFrame, Series)):
+        return result.copy()
+    if isinstance(result, ArrayFrame):
+        return ArrayFrame(dict(result.items()), dtype=result.dtype)  # read-only columns, new container
+    if isinstance(result, tuple):
+        return tuple(_copy(r) for r in result)
+    return result
+
+
+def _freeze(result):
+    """
+    :return: result to cache, arrays become read-only copies like the results of get
+    """
+    if isinstance(result, np.ndarray):
+        result = result.copy()
+        result.flags.writeable = False
+        return result
+    if isinstance(result, ArrayFrame):
+        return ArrayFrame({name: _freeze(values) for name, values in result.items()}, dtype=result.dtype)
+    if isinstance(result, tuple):
+        return tuple(_freeze(r) for r in result)
+    return _copy(result)
+
+
+def _nbytes(value) -> int:
+    if isinstance(value, ArrayFrame):
+        return sum(v.nbytes for v in value.to_dict().values())
+    if isinstance(value, (tuple, list)):
+        return sum(_nbytes(v) for v in value)
+    if isinstance(value, dict):
+        return sum(_nbytes(v) for v in value.values())
+    nbytes = getattr(value, 'nbytes', None)
+    if nbytes is None and hasattr(value, 'memory_usage'):
+        nbytes = value.memory_usage(deep=False)
+        nbytes = int(nbytes.sum()) if hasattr(nbytes, 'sum') else int(nbytes)
+    return int(nbytes or 64)
+
+
+def _ema_compute(values, period):
+    state = np.zeros(3)
+    return _ema_kernel(values, period, state), state
+
+
+def _ema_extend(values, state, period):
+    state = state.copy()
+    return _ema_kernel(values, period, state), state
+
+
+def _sma_compute(values, period):
+    out = np.full(values.shape[0], np.nan)
+    if values.shape[0] >= period:
+        csum = np.concatenate(([0.0], np.cumsum(values)))
+        out[period - 1:] = (csum[period:] - csum[:-period]) / period
+    # the state is the tail of the input the next window needs
+    return out, values[-(period - 1):].copy() if period > 1 else values[:0].copy()
+
+
+def _sma_extend(values, state, period):
+    joined = np.concatenate((state, values))
+    out, tail = _sma_compute(joined, period)
+    return out[state.shape[0]:], tail
+
+
+def _laguerre_compute(values, gamma=0.75, smooth=1):
+    lrsi = LaguerreState(gamma, smooth)
+    return lrsi.run(values), lrsi
+
+
+def _laguerre_extend(values, state, gamma=0.75, smooth=1):
+    lrsi = LaguerreState(gamma, smooth)
+    lrsi.state = state.state.copy()
+    return lrsi.run(values), lrsi
+
+
+class _Buffer():
+    """
+    result array of a series with room to append to, the cached results of the series
+    are read-only views on its filled part
+    """
+
+    __slots__ = ('data', 'filled')
+
+    def __init__(self, capacity):
+        self.data = np.empty(capacity)
+        self.filled = 0
+
+
+def _append(buffer, result, new):
+    """
+    writes new after result in place when result ends where buffer is filled, else into a
+    buffer twice the size
+
+    :return: buffer holding result + new
+    """
+    m, k = result.shape[0], new.shape[0]
+    if buffer is None or buffer.filled != m or buffer.data.shape[0] < m + k:
+        buffer = _Buffer(max(2 * (m + k), 1024))
+        buffer.data[:m] = result
+    buffer.data[m:m + k] = new
+    buffer.filled = m + k
+    return buffer
+
+
+class IndicatorCache():
+    """
+    memoizes indicator results keyed by indicator name, parameters and a fingerprint of
+    the input columns, bounded by max_bytes with least recently used eviction
+
+    Kernels registered with an extend function are extended incrementally: when the
+    input is the longest cached input of the series plus new bars at the end, only the
+    new bars are computed from the saved state and appended in place to the cached
+    result. Without a `source` the input is still hashed once, a hit or an extension
+    costs O(n), more than recomputing a numba ema; with one nothing is hashed and an
+    extension costs O(new bars), see python -m benchmarks.indicator_cache.
+    Counters are in `stats`.
+    """
+
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.stats = {'hits': 0, 'misses': 0, 'extensions': 0, 'evictions': 0}
+
+        self._entries = OrderedDict()
+        self._latest = {}
+        self._kernels = {}
+
+        self.register('ema', _ema_compute, _ema_extend)
+        self.register('sma', _sma_compute, _sma_extend)
+        self.register('laguerre', _laguerre_compute, _laguerre_extend)
+
+    def register(self, name, compute, extend=None):
+        """
+        :param compute: callable(values, **params) -> (result array, state)
+        :param extend: callable(new_values, state, **params) -> (result of the new values, state)
+        """
+        self._kernels[name] = (compute, extend)
+
+    def get(self, name, values, source=None, **params) -> np.ndarray:
+        """
+        result of the registered kernel `name` over values, read-only
+
+        :param values: 1D input column
+        :param source: hashable id of an append-only series, e.g. (symbol, timeframe, first bin);
+            the values are then not hashed, the caller guarantees that the rows already
+            seen under this id never change
+        """
+        compute, extend = self._kernels[name]
+        values = np.ascontiguousarray(values, dtype=np.float64)
+        n = values.shape[0]
+        series = (name, tuple(sorted(params.items())), source)
+
+        latest = self._latest.get(series)
+        prev = self._entries.get(latest) if latest is not None else None
+        m = prev[2] if prev is not None else None
+
+        if source is not None:
+            key = series + (n, None)
+            extends = m is not None and m < n
+        else:
+            # one pass over the values: the prefix digest is compared on the way
+            h = hashlib.blake2b(digest_size=16)
+            extends = False
+            if m is not None and m < n:
+                h.update(values[:m])
+                extends = h.hexdigest() == latest[-1]
+                h.update(values[m:])
+            else:
+                h.update(values)
+            key = series + (n, h.hexdigest())
+
+        entry = self._lookup(key)
+        if entry is not None:
+            return entry[0]
+
+        if extend is not None and extends:
+            new, state = extend(values[m:], prev[1], **params)
+            buffer = _append(prev[3], prev[0], new)
+            self.stats['extensions'] += 1
+            return self._store(key, series, buffer.data[:n], state, n, buffer)
+
+        self.stats['misses'] += 1
+        result, state = compute(values, **params)
+        return self._store(key, series, result, state, n, None)
+
+    def call(self, func, dataframe, *args, columns=('open', 'high', 'low', 'close', 'volume'), source=None,
+             **kwargs):
+        """
+        memoizes any indicators.py function, e.g. cache.call(mmar, df, columns=('close',))
+
+        DataFrame and Series results are copies, arrays are shared read-only.
+
+        :param func: indicator function taking the dataframe as first argument
+        :param columns: the columns the function reads, only these are fingerprinted
+        :param source: hashable id of the rows of dataframe, which are then not hashed,
+            e.g. the name of a shared memory block that never changes
+        """
+        if source is None:
+            data = fingerprint(*(dataframe[c] for c in columns))
+        else:
+            data = (source, tuple(columns), len(dataframe))
+        key = (func.__module__, func.__qualname__, _key(args), _key(kwargs), data)
+
+        entry = self._lookup(key)
+        if entry is not None:
+            return _copy(entry[0])
+
+        self.stats['misses'] += 1
+        result = _freeze(func(dataframe, *args, **kwargs))
+        self._insert(key, (result, None, len(dataframe), None))
+        return _copy(result)
+
+    def clear(self):
+        self._entries.clear()
+        self._latest.clear()
+        self.bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self._entries.move_to_end(key)
+        self.stats['hits'] += 1
+        return entry
+
+    def _store(self, key, series, result, state, n, buffer):
+        result.flags.writeable = False
+        self._insert(key, (result, state, n, buffer))
+        self._latest[series] = key
+        return result
+
+    def _insert(self, key, entry):
+        size = _nbytes(entry[0]) + _nbytes(entry[1])
+        self._entries[key] = entry + (size,)
+        self.bytes += size
+
+        while self.bytes > self.max_bytes and len(self._entries) > 1:
+            _, evicted = self._entries.popitem(last=False)
+            self.bytes -= evicted[-1]
+            self.stats['evictions'] += 1
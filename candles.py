@@ -0,0 +1,227 @@
+"""
+    persistent OHLCV candle store used by the strategy instead of refetching the whole window every tick
+"""
+from datetime import datetime, timezone
+
+import numpy as np
+from pandas import DataFrame, to_datetime
+
+from configuration import TICKER_INTERVAL_MINUTES
+
+# maximum page size of the /trade/bucketed endpoint
+BUCKETED_PAGE_SIZE = 1000
+
+
+def timestamp_ms(value) -> int:
+    """
+    converts a bucket timestamp as returned by the API client to epoch milliseconds
+
+    :param value: datetime, ISO string or number of milliseconds
+    :return: int
+    """
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return int(round(value.timestamp() * 1000))
+    if isinstance(value, str):
+        return int(np.datetime64(value.rstrip('Z'), 'ms').astype(np.int64))
+    return int(value)
+
+
+class CandleBuffer():
+    """
+    fixed capacity OHLCV store backed by preallocated contiguous float64 arrays
+
+    Rows are appended in place; the backing arrays hold twice the capacity so the
+    live window is always one contiguous slice and every column can be handed out
+    as a zero-copy view. When the write position reaches the end, the last
+    `capacity` rows are moved to the front once, which keeps appends amortised O(1).
+    """
+
+    COLUMNS = ('open', 'high', 'low', 'close', 'volume')
+
+    def __init__(self, capacity=1000, timeframe='1m'):
+        """
+        :param timeframe: one of TICKER_INTERVAL_MINUTES, or a number of minutes for a buffer
+            that is never refreshed from the exchange
+        """
+        self.capacity = capacity
+        self.timeframe = timeframe
+        minutes = TICKER_INTERVAL_MINUTES[timeframe] if isinstance(timeframe, str) else timeframe
+        self.interval_ms = minutes * 60 * 1000
+
+        self._dates = np.zeros(2 * capacity, dtype=np.int64)
+        self._values = np.zeros((len(self.COLUMNS), 2 * capacity), dtype=np.float64)
+        self._start = 0
+        self._end = 0
+
+    def __len__(self):
+        return self._end - self._start
+
+    @property
+    def last_timestamp(self):
+        """
+        :return: epoch milliseconds of the newest stored bin or None when empty
+        """
+        if self._end == self._start:
+            return None
+        return int(self._dates[self._end - 1])
+
+    def append(self, timestamp, open, high, low, close, volume) -> bool:
+        """
+        appends a single closed bin, bins not newer than the last stored one are ignored
+
+        :return: True if the bin was stored
+        """
+        timestamp = timestamp_ms(timestamp)
+        last = self.last_timestamp
+        if last is not None and timestamp <= last:
+            return False
+
+        if self._end == self._dates.shape[0]:
+            keep = self.capacity - 1
+            self._dates[:keep] = self._dates[self._end - keep:self._end]
+            self._values[:, :keep] = self._values[:, self._end - keep:self._end]
+            self._start, self._end = 0, keep
+
+        i = self._end
+        self._dates[i] = timestamp
+        values = self._values
+        values[0, i] = open
+        values[1, i] = high
+        values[2, i] = low
+        values[3, i] = close
+        values[4, i] = volume
+        self._end += 1
+
+        if self._end - self._start > self.capacity:
+            self._start += 1
+
+        return True
+
+    def extend(self, ticker: list) -> int:
+        """
+        appends bins in the format of the /trade/bucketed API
+
+        :param ticker: list of bucket dicts, any order
+        :return: number of bins stored
+        """
+        stored = 0
+        for row in sorted(ticker, key=lambda r: timestamp_ms(r['timestamp'])):
+            if row['open'] is None:
+                continue  # bins without trades
+            stored += self.append(row['timestamp'], row['open'], row['high'],
+                                  row['low'], row['close'], row['volume'])
+        return stored
+
+    def dates(self) -> np.ndarray:
+        """
+        :return: view on the bin timestamps in epoch milliseconds
+        """
+        return self._dates[self._start:self._end]
+
+    def column(self, name) -> np.ndarray:
+        """
+        :param name: one of open/high/low/close/volume
+        :return: zero-copy view of the column over the live window
+        """
+        return self._values[self.COLUMNS.index(name), self._start:self._end]
+
+    def dataframe(self) -> DataFrame:
+        """
+        wraps the live window into a DataFrame shaped like util.parse_dataframe output,
+        the price columns are not copied
+
+        :return: DataFrame
+        """
+        data = {'date': to_datetime(self.dates(), unit='ms', utc=True)}
+        for name in self.COLUMNS:
+            data[name] = self.column(name)
+        return DataFrame(data, copy=False)
+
+    def frame(self, dtype=None):
+        """
+        the live window as a frames.ArrayFrame, date as datetime64[ms]
+
+        :param dtype: np.float32 for a converted copy, None for zero-copy float64 views
+        :return: ArrayFrame
+        """
+        from frames import ArrayFrame
+
+        data = {'date': self.dates().view('datetime64[ms]')}
+        for name in self.COLUMNS:
+            data[name] = self.column(name)
+        return ArrayFrame(data, dtype=dtype)
+
+    def snapshot(self) -> dict:
+        """
+        :return: copies of the live window, see restore
+        """
+        return {'timeframe': self.timeframe, 'dates': self.dates().copy(),
+                'values': self._values[:, self._start:self._end].copy()}
+
+    def restore(self, snapshot):
+        """
+        replaces the content with a snapshot, keeping its newest `capacity` bins
+
+        :return: self
+        """
+        dates = snapshot['dates'][-self.capacity:]
+        n = dates.shape[0]
+        self._dates[:n] = dates
+        self._values[:, :n] = snapshot['values'][:, snapshot['values'].shape[1] - n:]
+        self._start, self._end = 0, n
+        return self
+
+    def refresh(self, client, symbol='XBTUSD') -> int:
+        """
+        fetches only the bins that closed after the newest stored one, an empty buffer is
+        filled with the newest `capacity` bins, paging backwards from the exchange's latest bin
+
+        :param client: bitmex API client
+        :param symbol: instrument to fetch
+        :return: number of new bins
+        """
+        if self.last_timestamp is None:
+            return self._fill(client, symbol)
+
+        stored = 0
+        start = datetime.fromtimestamp((self.last_timestamp + self.interval_ms) / 1000, timezone.utc)
+        while True:
+            res = client.Trade.Trade_getBucketed(
+                binSize=self.timeframe,
+                symbol=symbol,
+                startTime=start,
+                count=BUCKETED_PAGE_SIZE,
+                partial=False
+            ).result()[0]
+
+            stored += self.extend(res)
+
+            if len(res) < BUCKETED_PAGE_SIZE:
+                return stored
+            newest = max(timestamp_ms(row['timestamp']) for row in res)
+            start = datetime.fromtimestamp((newest + self.interval_ms) / 1000, timezone.utc)
+
+    def _fill(self, client, symbol):
+        pages = []
+        end = None
+        wanted = self.capacity
+        while wanted > 0:
+            res = client.Trade.Trade_getBucketed(
+                binSize=self.timeframe,
+                symbol=symbol,
+                count=min(wanted, BUCKETED_PAGE_SIZE),
+                reverse=True,
+                partial=False,
+                **({'endTime': end} if end is not None else {})
+            ).result()[0]
+
+            pages.append(res)
+            wanted -= len(res)
+            if len(res) < BUCKETED_PAGE_SIZE:
+                break
+            oldest = min(timestamp_ms(row['timestamp']) for row in res)
+            end = datetime.fromtimestamp((oldest - self.interval_ms) / 1000, timezone.utc)
+
+        return self.extend([row for page in reversed(pages) for row in page])
@@ -0,0 +1,49 @@
+"""
+    warm-start checkpoints: candle buffers and streaming indicator state of every instrument
+"""
+import os
+import pickle
+import time
+
+VERSION = 1
+
+
+class Checkpoint():
+    """
+    one local file holding the state of every instrument of a Runtime, keyed by (symbol, timeframe)
+
+    The file is a pickle of numpy arrays and small dicts, a 1000 bin buffer takes about
+    50kB. It is replaced atomically, a crash while saving leaves the previous one.
+    """
+
+    def __init__(self, path='checkpoint.pkl'):
+        self.path = path
+
+    def save(self, states) -> int:
+        """
+        :param states: dict of (symbol, timeframe) to Instrument.snapshot()
+        :return: size of the file in bytes
+        """
+        tmp = self.path + '.tmp'
+        with open(tmp, 'wb') as f:
+            pickle.dump({'version': VERSION, 'saved': time.time(), 'instruments': states}, f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self.path)
+        return os.path.getsize(self.path)
+
+    def load(self) -> dict:
+        """
+        :return: dict of (symbol, timeframe) to instrument state, empty when there is no
+            usable checkpoint
+        """
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'rb') as f:
+                checkpoint = pickle.load(f)
+        except Exception as e:
+            print(f"Could not read checkpoint {self.path}: {e!r}")
+            return {}
+        if checkpoint.get('version') != VERSION:
+            return {}
+        return checkpoint['instruments']
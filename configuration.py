@@ -5,18 +5,55 @@ API_SECRET=''
 AMOUNT_MONEY_TO_TRADE = 100  #$
 LEVERAGE = 10
 
+# 'sequential' closes and then opens with blocking requests, 'netted' sends a single order per signal in the background
+EXECUTION = 'sequential'
+
 TIMEFRAME = '1m'
 
 PAIR = 'XBTUSD'
 
+# every (symbol, timeframe) traded by main.py, all share one client and one market data connection
+INSTRUMENTS = [
+    (PAIR, TIMEFRAME),
+]
+
+# number of closed candles kept in memory for the strategy
+CANDLE_BUFFER_SIZE = 1000
+
+# 'rest' polls /trade/bucketed on every candle close, 'websocket' streams tradeBin candles
+MARKET_DATA = 'rest'
+
+# seconds between REST reconciliations of the streamed position book (websocket mode with API keys)
+POSITION_RECONCILE_INTERVAL = 60
+
+# seconds to wait after a candle closes before asking for it, gives the exchange time to publish the bin
+CANDLE_CLOSE_OFFSET = 1
+
+# local port of the Prometheus /metrics and /summary endpoint, None disables it and the exchange call counters
+METRICS_PORT = 9100
+
+# seconds between printed latency summaries, None disables them
+METRICS_SUMMARY_INTERVAL = 300
+
+# requests per minute assumed until the exchange reports its limit in the x-ratelimit headers
+REST_RATE_LIMIT = 60
+
+# retries of a request answered 429 (rate limited) or 503 (overloaded), with jittered exponential backoff
+REST_MAX_RETRIES = 5
+
+# keep-alive connections per host, shared by every instrument and order thread
+REST_POOL_SIZE = 10
+
+# file the candle buffers and streaming indicator state are saved to and restored from on start,
+# positions are fetched from the exchange again; None disables it
+CHECKPOINT_PATH = 'checkpoint.pkl'
+
+# seconds between checkpoints, one is also written on shutdown
+CHECKPOINT_INTERVAL = 60
+
 TICKER_INTERVAL_MINUTES = {
     '1m': 1,
     '5m': 5,
     '1h': 60,
     '1d': 1440,
 }
-
-time_to_wait_new_trade = {'1m': 60,
-                          '5m': 60*5,
-                          '1h': 60*60,
-                          '1d': 60*60*24}
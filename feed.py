@@ -0,0 +1,300 @@
+"""
+    streaming market data from the BitMEX realtime websocket (tradeBin / trade tables, private tables on request)
+"""
+import asyncio
+import hashlib
+import hmac
+import json
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+from candles import BUCKETED_PAGE_SIZE, timestamp_ms
+from configuration import TICKER_INTERVAL_MINUTES
+
+BITMEX_WS_URL = 'wss://www.bitmex.com/realtime'
+BITMEX_TESTNET_WS_URL = 'wss://testnet.bitmex.com/realtime'
+
+
+class MarketDataFeed():
+    """
+    subscribes to tradeBin<timeframe> and trade for a set of symbols and pushes closed
+    candles to the registered callbacks
+
+    Candles are delivered once and in order per (symbol, timeframe). After a dropped
+    connection the feed reconnects with exponential backoff, resubscribes and, when a
+    REST client is given, backfills the bins that closed while it was offline before
+    dispatching live data again. A failed backfill drops the connection, so it is
+    retried with the next one; a message that cannot be handled is logged and skipped.
+
+    With api_key/api_secret the connection is authenticated and the private tables
+    (position, order, execution) can be subscribed through on_table.
+    """
+
+    def __init__(self, symbols=('XBTUSD',), timeframes=('1m',), url=BITMEX_TESTNET_WS_URL,
+                 client=None, trades=True, reconnect_delay=1, max_reconnect_delay=30,
+                 api_key=None, api_secret=None):
+        self.symbols = list(symbols)
+        self.timeframes = list(timeframes)
+        self.url = url
+        self.client = client
+        self.trades = trades
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.api_key = api_key
+        self.api_secret = api_secret
+
+        self.last_timestamp = {}
+        self.last_price = {}
+        self.latencies = deque(maxlen=1000)
+        self.reconnects = 0
+        self.errors = 0
+
+        self._candle_callbacks = []
+        self._trade_callbacks = []
+        self._table_callbacks = {}
+        self._disconnect_callbacks = []
+        self._ws = None
+        self._running = False
+
+    def on_candle(self, callback, symbol=None, timeframe=None):
+        """
+        registers callback(symbol, timeframe, candle) for closed candles
+
+        :param symbol: only deliver this symbol, all if None
+        :param timeframe: only deliver this timeframe, all if None
+        """
+        self._candle_callbacks.append((symbol, timeframe, callback))
+
+    def on_trade(self, callback):
+        """
+        registers callback(trade) for every trade of the subscribed symbols
+        """
+        self._trade_callbacks.append(callback)
+
+    def on_table(self, table, callback):
+        """
+        subscribes to any table, e.g. position, order or execution, callback(action, data)
+        receives every partial/insert/update/delete message of it
+        """
+        self._table_callbacks.setdefault(table, []).append(callback)
+
+    def on_disconnect(self, callback):
+        """
+        registers callback() for every lost or closed connection, subscriptions are
+        resent (and partials received again) on reconnect
+        """
+        self._disconnect_callbacks.append(callback)
+
+    def subscriptions(self) -> list:
+        topics = ['tradeBin{}:{}'.format(tf, s) for tf in self.timeframes for s in self.symbols]
+        if self.trades:
+            topics += ['trade:{}'.format(s) for s in self.symbols]
+        return topics + list(self._table_callbacks)
+
+    def auth_message(self, expires=None) -> dict:
+        """
+        authKeyExpires request, signed like the REST API with verb GET and path /realtime
+        """
+        expires = expires or int(time.time()) + 60
+        signature = hmac.new(self.api_secret.encode(), 'GET/realtime{}'.format(expires).encode(),
+                             hashlib.sha256).hexdigest()
+        return {'op': 'authKeyExpires', 'args': [self.api_key, expires, signature]}
+
+    async def run(self):
+        """
+        connects and dispatches messages until stop() is called
+        """
+        import websockets
+
+        self._running = True
+        delay = self.reconnect_delay
+        while self._running:
+            try:
+                async with websockets.connect(self.url) as ws:
+                    self._ws = ws
+                    if self.api_key:
+                        await ws.send(json.dumps(self.auth_message()))
+                    await ws.send(json.dumps({'op': 'subscribe', 'args': self.subscriptions()}))
+                    await self.backfill()
+                    delay = self.reconnect_delay
+                    async for message in ws:
+                        received = time.perf_counter()
+                        try:
+                            self.handle_message(message, received)
+                        except Exception as e:
+                            self.errors += 1
+                            print(f"Could not handle market data message: {e!r}")
+            except (OSError, asyncio.TimeoutError, websockets.ConnectionClosed) as e:
+                print(f"Market data connection lost: {e!r}")
+            except Exception as e:
+                # e.g. the REST backfill failed, nothing live was dispatched yet
+                self.errors += 1
+                print(f"Market data feed failed, reconnecting: {e!r}")
+            finally:
+                self._ws = None
+                for callback in self._disconnect_callbacks:
+                    callback()
+
+            if self._running:
+                self.reconnects += 1
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_reconnect_delay)
+
+    async def stop(self):
+        self._running = False
+        if self._ws is not None:
+            await self._ws.close()
+
+    async def backfill(self):
+        """
+        fetches over REST the bins that closed after the last delivered one, page by page
+        """
+        if self.client is None:
+            return
+
+        def fetch(symbol, timeframe, start):
+            return self.client.Trade.Trade_getBucketed(
+                binSize=timeframe,
+                symbol=symbol,
+                startTime=start,
+                count=BUCKETED_PAGE_SIZE,
+                partial=False
+            ).result()[0]
+
+        loop = asyncio.get_running_loop()
+        for (symbol, timeframe), last in list(self.last_timestamp.items()):
+            interval_ms = TICKER_INTERVAL_MINUTES[timeframe] * 60 * 1000
+            while True:
+                start = datetime.fromtimestamp((last + interval_ms) / 1000, timezone.utc)
+                res = await loop.run_in_executor(None, fetch, symbol, timeframe, start)
+
+                for candle in sorted(res, key=lambda r: timestamp_ms(r['timestamp'])):
+                    self.dispatch_candle(symbol, timeframe, candle)
+
+                if len(res) < BUCKETED_PAGE_SIZE:
+                    break
+                last = max(timestamp_ms(row['timestamp']) for row in res)
+
+    def handle_message(self, message, received=None):
+        """
+        :param message: raw text frame
+        :param received: perf_counter value when the frame arrived, used for latency stats
+        """
+        received = received or time.perf_counter()
+        msg = json.loads(message)
+
+        table = msg.get('table')
+        if table in self._table_callbacks:
+            for callback in self._table_callbacks[table]:
+                callback(msg['action'], msg['data'])
+
+        if table is None or msg.get('action') not in ('partial', 'insert'):
+            return
+
+        if table.startswith('tradeBin'):
+            timeframe = table[len('tradeBin'):]
+            for candle in msg['data']:
+                if self.dispatch_candle(candle['symbol'], timeframe, candle):
+                    self.latencies.append(time.perf_counter() - received)
+
+        elif table == 'trade':
+            for trade in msg['data']:
+                self.last_price[trade['symbol']] = trade['price']
+                for callback in self._trade_callbacks:
+                    callback(trade)
+
+    def dispatch_candle(self, symbol, timeframe, candle) -> bool:
+        """
+        delivers a candle unless it is not newer than the last one delivered
+
+        :return: True if delivered
+        """
+        key = (symbol, timeframe)
+        ts = timestamp_ms(candle['timestamp'])
+        if ts <= self.last_timestamp.get(key, -1):
+            return False
+        self.last_timestamp[key] = ts
+
+        for s, tf, callback in self._candle_callbacks:
+            if (s is None or s == symbol) and (tf is None or tf == timeframe):
+                callback(symbol, timeframe, candle)
+        return True
+
+
+class LocalBitmexServer():
+    """
+    stand-in for the BitMEX realtime endpoint, replays candles as tradeBin inserts
+
+    Used to run the feed offline: every published candle is stamped in `sent_at`
+    so tick-to-signal latency can be measured against the time the callback fired.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0):
+        self.host = host
+        self.port = port
+        self.sent_at = {}
+        self._server = None
+        self._clients = {}
+
+    @property
+    def url(self):
+        return 'ws://{}:{}/realtime'.format(self.host, self.port)
+
+    async def start(self):
+        import websockets
+
+        self._server = await websockets.serve(self._handler, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def close(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _handler(self, ws, *args):
+        self._clients[ws] = set()
+        try:
+            await ws.send(json.dumps({'info': 'Welcome to the local BitMEX stand-in'}))
+            async for message in ws:
+                if message == 'ping':
+                    await ws.send('pong')
+                    continue
+                req = json.loads(message)
+                if req.get('op') == 'authKeyExpires':
+                    await ws.send(json.dumps({'success': True, 'request': req}))
+                elif req.get('op') == 'subscribe':
+                    for topic in req['args']:
+                        self._clients[ws].add(topic)
+                        await ws.send(json.dumps({'success': True, 'subscribe': topic}))
+        except Exception:
+            pass
+        finally:
+            del self._clients[ws]
+
+    async def publish(self, table, symbol, data, action='insert'):
+        """
+        sends an action of table to every client subscribed to table:symbol or to the whole table
+        """
+        topic = '{}:{}'.format(table, symbol)
+        message = json.dumps({'table': table, 'action': action, 'data': data}, default=str)
+        for ws, topics in list(self._clients.items()):
+            if topic in topics or table in topics:
+                await ws.send(message)
+
+    async def publish_candle(self, timeframe, candle):
+        """
+        :param candle: dict in the /trade/bucketed format, timestamp as ISO string
+        """
+        self.sent_at[(candle['symbol'], timeframe, timestamp_ms(candle['timestamp']))] = time.perf_counter()
+        await self.publish('tradeBin' + timeframe, candle['symbol'], [candle])
+
+    async def publish_trade(self, trade):
+        await self.publish('trade', trade['symbol'], [trade])
+
+    async def drop_clients(self):
+        """
+        closes every client connection, to exercise reconnects
+        """
+        for ws in list(self._clients):
+            await ws.close()
@@ -0,0 +1,127 @@
+"""
+    lightweight column container over numpy arrays, used instead of a DataFrame on the per tick path
+"""
+import numpy as np
+from pandas import DataFrame, Series
+
+
+class ArrayFrame():
+    """
+    named 1D numpy arrays of one length, read and written like DataFrame columns
+
+    Columns are stored as they are given, getting one returns the array itself, so a
+    frame over CandleBuffer columns copies nothing. There is no index to align and no
+    blocks to consolidate: adding a column is a dict insert. With dtype set every float
+    column is stored in that dtype, e.g. np.float32 to halve the memory of a feature set;
+    integer and datetime columns are kept as they are. Indicators then compute in float32
+    too, cumulative ones (accumulation_distribution) and ratios of small differences (stc)
+    drift from their float64 values.
+
+    Indicators take an ArrayFrame wherever they take a DataFrame and then return numpy
+    arrays instead of Series.
+    """
+
+    __slots__ = ('_columns', '_length', 'dtype')
+
+    def __init__(self, columns=None, dtype=None):
+        """
+        :param columns: mapping of name to array-like, all of the same length
+        :param dtype: float dtype of the stored columns, None keeps the dtype of each array
+        """
+        self._columns = {}
+        self._length = None
+        self.dtype = None if dtype is None else np.dtype(dtype)
+        for name, values in (columns or {}).items():
+            self[name] = values
+
+    @classmethod
+    def from_dataframe(cls, dataframe, dtype=None):
+        return cls({name: dataframe[name].to_numpy() for name in dataframe.columns}, dtype=dtype)
+
+    def __len__(self):
+        return self._length or 0
+
+    def __contains__(self, name):
+        return name in self._columns
+
+    def __iter__(self):
+        return iter(self._columns)
+
+    def __getitem__(self, name):
+        """
+        :param name: column name, or a list of names for a frame of these columns
+        """
+        if isinstance(name, list):
+            return ArrayFrame({n: self._columns[n] for n in name}, dtype=self.dtype)
+        return self._columns[name]
+
+    def __setitem__(self, name, values):
+        if isinstance(values, Series):
+            values = values.to_numpy()
+        if np.ndim(values) == 0:
+            if self._length is None:
+                raise ValueError("Cannot broadcast a scalar into an empty ArrayFrame")
+            values = np.full(self._length, values)
+        values = np.asarray(values)
+        if values.ndim != 1:
+            raise ValueError("Columns are 1D, got shape {}".format(values.shape))
+        if self._length is not None and values.shape[0] != self._length:
+            raise ValueError("Column {} has {} rows, the frame has {}".format(name, values.shape[0], self._length))
+        if self.dtype is not None and values.dtype.kind == 'f' and values.dtype != self.dtype:
+            values = values.astype(self.dtype)
+        self._columns[name] = values
+        self._length = values.shape[0]
+
+    def __delitem__(self, name):
+        del self._columns[name]
+
+    @property
+    def columns(self) -> list:
+        return list(self._columns)
+
+    def keys(self):
+        return self._columns.keys()
+
+    def items(self):
+        return self._columns.items()
+
+    def copy(self):
+        return ArrayFrame({name: values.copy() for name, values in self._columns.items()}, dtype=self.dtype)
+
+    def tail(self, n=5):
+        """
+        :return: frame of views on the last n rows
+        """
+        start = max(len(self) - n, 0)
+        return ArrayFrame({name: values[start:] for name, values in self._columns.items()}, dtype=self.dtype)
+
+    def to_dict(self, dtype=None) -> dict:
+        """
+        :param dtype: cast every float column to it, talib needs np.float64
+        :return: dict of name to array, arrays already in dtype are not copied
+        """
+        if dtype is None:
+            return dict(self._columns)
+        return {name: values.astype(dtype, copy=False) if values.dtype.kind == 'f' else values
+                for name, values in self._columns.items()}
+
+    def to_dataframe(self) -> DataFrame:
+        return DataFrame(self._columns)
+
+    def __repr__(self):
+        return 'ArrayFrame({} rows: {})'.format(len(self), ', '.join(
+            '{} {}'.format(name, values.dtype) for name, values in self._columns.items()))
+
+
+def ffill(values) -> np.ndarray:
+    """
+    forward fills NaNs with the last valid value like Series.ffill, leading NaNs stay
+
+    :param values: 1D float array
+    :return: new array
+    """
+    values = np.asarray(values)
+    valid = ~np.isnan(values)
+    index = np.where(valid, np.arange(values.shape[0]), 0)
+    np.maximum.accumulate(index, out=index)
+    return values[index]
@@ -2,34 +2,189 @@
 This file contains a collection of common indicators, which are based on third party or custom libraries
 
 """
+import functools
+
 from numpy.core.records import ndarray
 from pandas import Series, DataFrame
 import pandas as pd
 import numpy as np
+
+from frames import ArrayFrame
 # from math import log
 
 
+try:
+    from numba import njit as _njit
+except ImportError:  # numba is optional, kernels then run as plain python loops
+    _njit = None
+
+
+def _kernel(func):
+    """
+    compiles a recursive numpy kernel with numba when it is installed
+
+    :param func: function working on numpy arrays and scalars only
+    :return: compiled function or func itself
+    """
+    if _njit is None:
+        return func
+    return _njit(cache=True, nogil=True)(func)
+
+
+def _series(values, like, name=None):
+    """
+    wraps a result column like its input: a Series on the index of a DataFrame, the bare
+    array for an ArrayFrame
+    """
+    if isinstance(like, ArrayFrame):
+        return values
+    return Series(values, index=like.index, name=name)
+
+
+def _via_pandas(func):
+    """
+    for indicators built on pandas rolling windows: an ArrayFrame is converted to a
+    DataFrame on the way in and a Series result back to an array
+    """
+    @functools.wraps(func)
+    def wrapper(dataframe, *args, **kwargs):
+        if not isinstance(dataframe, ArrayFrame):
+            return func(dataframe, *args, **kwargs)
+        result = func(dataframe.to_dataframe(), *args, **kwargs)
+        return result.to_numpy() if isinstance(result, Series) else result
+    return wrapper
+
+
+def _talib_inputs(dataframe):
+    # the talib abstract API takes a DataFrame or a dict of float64 arrays
+    return dataframe.to_dict(np.float64) if isinstance(dataframe, ArrayFrame) else dataframe
+
+
+@_kernel
+def _ema_kernel(src, period, state):
+    """
+    talib compatible EMA that can be resumed, state holds the ema, the number of values
+    seen while seeding and their sum, and is updated in place
+    """
+    n = src.shape[0]
+    out = np.empty(n)
+    k = 2.0 / (period + 1)
+    ema, seen, total = state[0], state[1], state[2]
+    for i in range(n):
+        x = src[i]
+        if seen < period:
+            if np.isnan(x) and seen == 0:
+                # leading NaNs are skipped like talib does
+                out[i] = np.nan
+                continue
+            total += x
+            seen += 1
+            if seen == period:
+                ema = total / period
+                out[i] = ema
+            else:
+                out[i] = np.nan
+        else:
+            ema = (x - ema) * k + ema
+            out[i] = ema
+    state[0], state[1], state[2] = ema, seen, total
+    return out
+
+
+@_kernel
+def _heikinashi_kernel(open_, high, low, close):
+    n = close.shape[0]
+    ha_open = np.empty(n)
+    ha_high = np.empty(n)
+    ha_low = np.empty(n)
+    ha_close = np.empty(n)
+    prev_open = 0.0
+    prev_close = 0.0
+    for i in range(n):
+        ha_close[i] = (open_[i] + high[i] + low[i] + close[i]) / 4
+        if i == 0:
+            ha_open[i] = open_[i]
+        else:
+            ha_open[i] = (prev_open + prev_close) / 2
+        ha_high[i] = max(high[i], ha_open[i], ha_close[i])
+        ha_low[i] = min(low[i], ha_open[i], ha_close[i])
+        prev_open = ha_open[i]
+        prev_close = ha_close[i]
+    return ha_open, ha_high, ha_low, ha_close
+
+
 def heikinashi(bars):
-    bars = bars.copy()
-    bars['ha_close'] = (bars['open'] + bars['high'] +
-                        bars['low'] + bars['close']) / 4
+    """
+    exact Heikin-Ashi candles, ha_open follows its full recursion in a single pass
 
-    bars['ha_open'] = (bars['open'].shift(1) + bars['close'].shift(1)) / 2
-    bars.loc[:1, 'ha_open'] = bars['open'].values[0]
-    for x in range(2):
-        bars.loc[1:, 'ha_open'] = (
-            (bars['ha_open'].shift(1) + bars['ha_close'].shift(1)) / 2)[1:]
+    :param bars: dataframe or ArrayFrame containing open/high/low/close
+    :return: DataFrame (ArrayFrame for an ArrayFrame) with open/high/low/close of the Heikin-Ashi candles
+    """
+    ha_open, ha_high, ha_low, ha_close = _heikinashi_kernel(
+        np.ascontiguousarray(bars['open'], dtype=np.float64),
+        np.ascontiguousarray(bars['high'], dtype=np.float64),
+        np.ascontiguousarray(bars['low'], dtype=np.float64),
+        np.ascontiguousarray(bars['close'], dtype=np.float64))
 
-    bars['ha_high'] = bars.loc[:, ['high', 'ha_open', 'ha_close']].max(axis=1)
-    bars['ha_low'] = bars.loc[:, ['low', 'ha_open', 'ha_close']].min(axis=1)
+    if isinstance(bars, ArrayFrame):
+        return ArrayFrame({'open': ha_open, 'high': ha_high, 'low': ha_low, 'close': ha_close}, dtype=bars.dtype)
 
     return pd.DataFrame(
         index=bars.index,
         data={
-            'open': bars['ha_open'],
-            'high': bars['ha_high'],
-            'low': bars['ha_low'],
-            'close': bars['ha_close']})
+            'open': ha_open,
+            'high': ha_high,
+            'low': ha_low,
+            'close': ha_close})
+
+
+class HeikinAshiState():
+    """
+    streaming counterpart of heikinashi, every closed bar is folded in with O(1) work
+    and produces exactly the values the batch version gives for the same history
+    """
+
+    __slots__ = ('open', 'high', 'low', 'close')
+
+    def __init__(self):
+        self.open = None
+        self.high = None
+        self.low = None
+        self.close = None
+
+    def update(self, candle):
+        """
+        :param candle: mapping (or row) with open/high/low/close of the closed bar
+        :return: (open, high, low, close) of the new Heikin-Ashi candle
+        """
+        o, h, l, c = float(candle['open']), float(candle['high']), float(candle['low']), float(candle['close'])
+
+        ha_close = (o + h + l + c) / 4
+        if self.open is None:
+            ha_open = o
+        else:
+            ha_open = (self.open + self.close) / 2
+
+        self.open = ha_open
+        self.high = max(h, ha_open, ha_close)
+        self.low = min(l, ha_open, ha_close)
+        self.close = ha_close
+
+        return self.open, self.high, self.low, self.close
+
+    @classmethod
+    def from_bars(cls, bars):
+        """
+        builds a state already positioned after the last row of bars
+
+        :param bars: dataframe containing open/high/low/close
+        :return: HeikinAshiState
+        """
+        state = cls()
+        if len(bars):
+            ha = heikinashi(bars)
+            state.open, state.high, state.low, state.close = (float(v) for v in ha.iloc[-1])
+        return state
 
 
 def crossed(series1, series2, direction=None):
@@ -48,9 +203,9 @@ def crossed(series1, series2, direction=None):
             series1.shift(1) >= series2.shift(1)))
 
     if direction is None:
-        return above or below
+        return above | below
 
-    return above if direction is "above" else below
+    return above if direction == "above" else below
 
 
 def crossed_above(series1, series2):
@@ -61,29 +216,56 @@ def crossed_below(series1, series2):
     return crossed(series1, series2, "below")
 
 
+def _aroon(values, period, maximum) -> ndarray:
+    """
+    pyti.aroon_up/aroon_down over sliding windows of period + 1 values: 100 on the bar of
+    the newest high (low), 100 / period less for every bar since
+    """
+    out = np.full(values.shape[0], np.nan)
+    if values.shape[0] > period:
+        # newest first, argmax/argmin then return the bars since the newest extreme; in
+        # chunks, as they copy the reversed windows
+        windows = np.lib.stride_tricks.sliding_window_view(values, period + 1)[:, ::-1]
+        step = max(1, 2 ** 20 // (period + 1))
+        for start in range(0, windows.shape[0], step):
+            chunk = windows[start:start + step]
+            since = chunk.argmax(axis=1) if maximum else chunk.argmin(axis=1)
+            out[period + start:period + start + chunk.shape[0]] = (period - since) / float(period) * 100
+    return out
+
+
 def aroon(dataframe, period=25, field='close', colum_prefix="aroon") -> DataFrame:
-    from pyti.aroon import aroon_up as up
-    from pyti.aroon import aroon_down as down
-    dataframe["{}_up".format(colum_prefix)] = up(dataframe[field], period)
-    dataframe["{}_down".format(colum_prefix)] = down(dataframe[field], period)
+    """
+    adds <colum_prefix>_up and <colum_prefix>_down, the values of pyti's aroon
+    """
+    values = np.ascontiguousarray(dataframe[field], dtype=np.float64)
+    dataframe["{}_up".format(colum_prefix)] = _aroon(values, int(period), True)
+    dataframe["{}_down".format(colum_prefix)] = _aroon(values, int(period), False)
     return dataframe
 
 
 def atr(dataframe, period, field='close') -> ndarray:
     from pyti.average_true_range import average_true_range
-    return average_true_range(dataframe[field], period)
+    return average_true_range(dataframe[field], dataframe['high'], dataframe['low'], period)
 
 
 def atr_percent(dataframe, period, field='close') -> ndarray:
     from pyti.average_true_range_percent import average_true_range_percent
-    return average_true_range_percent(dataframe[field], period)
+    return average_true_range_percent(dataframe[field], dataframe['high'], dataframe['low'], period)
 
 
 def bollinger_bands(dataframe, period=21, stdv=2, field='close', colum_prefix="bb") -> DataFrame:
-    from pyti.bollinger_bands import lower_bollinger_band, middle_bollinger_band, upper_bollinger_band
-    dataframe["{}_lower".format(colum_prefix)] = lower_bollinger_band(dataframe[field], period, stdv)
-    dataframe["{}_middle".format(colum_prefix)] = middle_bollinger_band(dataframe[field], period, stdv)
-    dataframe["{}_upper".format(colum_prefix)] = upper_bollinger_band(dataframe[field], period, stdv)
+    """
+    adds <colum_prefix>_lower/_middle/_upper, the values of pyti's bollinger bands: the sma
+    plus and minus stdv population standard deviations, from O(n) rolling windows
+    instead of pyti's np.std per bar
+    """
+    close = Series(np.asarray(dataframe[field], dtype=np.float64))
+    middle = close.rolling(int(period)).mean().to_numpy()
+    deviation = close.rolling(int(period)).std(ddof=0).to_numpy() * stdv
+    dataframe["{}_lower".format(colum_prefix)] = middle - deviation
+    dataframe["{}_middle".format(colum_prefix)] = middle
+    dataframe["{}_upper".format(colum_prefix)] = middle + deviation
 
     return dataframe
 
@@ -100,6 +282,7 @@ def accumulation_distribution(dataframe) -> ndarray:
     return acd(dataframe['close'], dataframe['high'], dataframe['low'], dataframe['volume'])
 
 
+@_via_pandas
 def osc(dataframe, periods=14) -> ndarray:
     """
     1. Calculating DM (i).
@@ -113,11 +296,13 @@ def osc(dataframe, periods=14) -> ndarray:
     :param periods:
     :return:
     """
-    df = dataframe
-    df['DM'] = (df['high'] - df['high'].shift()).apply(lambda x: max(x, 0))
-    df['DMn'] = (df['low'].shift() - df['low']).apply(lambda x: max(x, 0))
-    return Series.rolling_mean(df.DM, periods) / (
-            Series.rolling_mean(df.DM, periods) + Series.rolling_mean(df.DMn, periods))
+    high = dataframe['high']
+    low = dataframe['low']
+
+    dm = np.maximum(high - high.shift(), 0).rolling(periods).mean()
+    dmn = np.maximum(low.shift() - low, 0).rolling(periods).mean()
+
+    return dm / (dm + dmn)
 
 
 def cmo(dataframe, period, field='close') -> ndarray:
@@ -136,6 +321,16 @@ def cci(dataframe, period) -> ndarray:
     return commodity_channel_index(dataframe['close'], dataframe['high'], dataframe['low'], period)
 
 
+def _sma_skipna(values, period) -> ndarray:
+    """
+    rolling mean that ignores NaNs inside the window and is NaN for the first period - 1
+    values, which is what pyti's simple_moving_average gives for a Series
+    """
+    out = Series(values).rolling(period, min_periods=1).mean().to_numpy(copy=True)
+    out[:period - 1] = np.nan
+    return out
+
+
 def vfi(dataframe, length=130, coef=0.2, vcoef=2.5, signalLength=5, smoothVFI=False):
     """
     Volume Flow Indicator conversion
@@ -204,63 +399,117 @@ def vfi(dataframe, length=130, coef=0.2, vcoef=2.5, signalLength=5, smoothVFI=Fa
     plot( vfi, title="vfi", color=green,linewidth=2)
     """
     import talib as ta
-    from math import log
-    from pyti.simple_moving_average import simple_moving_average as sma
-    from numpy import where
-
-    length = length
-    coef = coef
-    vcoef = vcoef
-    signalLength = signalLength
-    smoothVFI = smoothVFI
-    df = dataframe
-    # Add hlc3 and populate inter to the dataframe
-    df['hlc'] = ((df['high'] + df['low'] + df['close']) / 3).astype(float)
-    df['inter'] = df['hlc'].map(log) - df['hlc'].shift(+1).map(log)
-    df['vinter'] = df['inter'].rolling(30).std(ddof=0)
-    df['cutoff'] = (coef * df['vinter'] * df['close'])
-    # Vave is to be calculated on volume of the past bar
-    df['vave'] = sma(df['volume'].shift(+1), length)
-    df['vmax'] = df['vave'] * vcoef
-    df['vc'] = where((df['volume'] < df['vmax']), df['volume'], df['vmax'])
-    df['mf'] = df['hlc'] - df['hlc'].shift(+1)
-
-    # more logic for vcp, so create a def and df.apply it
-    def vcp(x):
-        if x['mf'] > x['cutoff']:
-            return x['vc']
-        elif x['mf'] < -(x['cutoff']):
-            return -(x['vc'])
-        else:
-            return 0
 
-    df['vcp'] = df.apply(vcp, axis=1)
+    high = np.asarray(dataframe['high'], dtype=float)
+    low = np.asarray(dataframe['low'], dtype=float)
+    close = np.asarray(dataframe['close'], dtype=float)
+    volume = np.asarray(dataframe['volume'], dtype=float)
+
+    # Add hlc3 and populate inter
+    hlc = (high + low + close) / 3
+    log_hlc = np.log(hlc)
+    inter = np.empty_like(hlc)
+    inter[0] = np.nan
+    inter[1:] = log_hlc[1:] - log_hlc[:-1]
+    vinter = Series(inter).rolling(30).std(ddof=0).values
+    cutoff = coef * vinter * close
+    # Vave is to be calculated on volume of the past bar
+    vave = _sma_skipna(Series(volume).shift(+1).values, length)
+    vmax = vave * vcoef
+    vc = np.where(volume < vmax, volume, vmax)
+    mf = np.empty_like(hlc)
+    mf[0] = np.nan
+    mf[1:] = hlc[1:] - hlc[:-1]
+
+    vcp = np.where(mf > cutoff, vc, np.where(mf < -cutoff, -vc, 0.0))
     # vfi has a smooth option passed over def call, sma if set
-    df['vfi'] = (df['vcp'].rolling(length).sum()) / df['vave']
+    vfi = Series(vcp).rolling(length).sum().values / vave
     if smoothVFI == True:
-        df['vfi'] = sma(df['vfi'], 3)
-    df['vfima'] = ta.EMA(df['vfi'], signalLength)
-    df['vfi_hist'] = df['vfi'] - df['vfima']
+        vfi = _sma_skipna(vfi, 3)
+    vfima = ta.EMA(vfi, signalLength)
+    vfi_hist = vfi - vfima
+
+    return _series(vfi, dataframe, 'vfi'), \
+        _series(vfima, dataframe, 'vfima'), \
+        _series(vfi_hist, dataframe, 'vfi_hist')
+
+
+MMAR_PERIODS = np.array([5, 10, 20, 30, 40, 50, 60, 70, 80, 90, 100])
+
+# colour names indexed by int8 code + 2
+MMAR_COLORS = ['red', 'maroon', 'grey', 'green', 'lime']
+
+
+@_kernel
+def _ema_ribbon(src, periods):
+    """
+    talib compatible EMAs of every period in one pass over src, one row per period
+    """
+    m = periods.shape[0]
+    n = src.shape[0]
+    out = np.full((m, n), np.nan)
+    for j in range(m):
+        p = periods[j]
+        if n < p:
+            continue
+        k = 2.0 / (p + 1)
+        total = 0.0
+        for i in range(p):
+            total += src[i]
+        ema = total / p
+        out[j, p - 1] = ema
+        for i in range(p, n):
+            ema = (src[i] - ema) * k + ema
+            out[j, i] = ema
+    return out
+
+
+def _sma_ribbon(src, periods):
+    """
+    SMAs of every period from one cumulative sum, one row per period
+    """
+    periods = np.asarray(periods)
+    n = src.shape[0]
+    out = np.full((periods.shape[0], n), np.nan)
+    csum = np.concatenate(([0.0], np.cumsum(src)))
+    for j, p in enumerate(periods):
+        if n >= p:
+            out[j, p - 1:] = (csum[p:] - csum[:-p]) / p
+    return out
 
-    # clean up columns used vfi calculation but not needed for strat
-    df.drop('hlc', axis=1, inplace=True)
-    df.drop('inter', axis=1, inplace=True)
-    df.drop('vinter', axis=1, inplace=True)
-    df.drop('cutoff', axis=1, inplace=True)
-    df.drop('vave', axis=1, inplace=True)
-    df.drop('vmax', axis=1, inplace=True)
-    df.drop('vc', axis=1, inplace=True)
-    df.drop('mf', axis=1, inplace=True)
-    df.drop('vcp', axis=1, inplace=True)
 
-    return df['vfi'], df['vfima'], df['vfi_hist']
+def _ma_colors(ribbon, ref):
+    """
+    Madrid colour codes, +2 lime, +1 green, 0 grey, -1 maroon, -2 red
 
+    :param ribbon: 2D array, one moving average per row
+    :param ref: reference moving average (ma100)
+    :return: int8 array of the same shape as ribbon
+    """
+    change = np.full(ribbon.shape, np.nan)
+    change[:, 1:] = ribbon[:, 1:] - ribbon[:, :-1]
 
-def mmar(dataframe, matype="EMA", src="close", debug=False):
+    above = ribbon > ref
+    below = ribbon < ref
+    rising = change >= 0
+    falling = change <= 0
+
+    return np.select(
+        [rising & above, (change < 0) & above, falling & below, rising & below],
+        [2, -1, -2, 1],
+        0
+    ).astype(np.int8)
+
+
+def mmar(dataframe, matype="EMA", src="close", debug=False, codes=False):
     """
     Madrid Moving Average Ribbon
 
-    Returns: MMAR
+    The whole ribbon is computed as one 2D array and classified with vectorized
+    comparisons, the input frame is not modified.
+
+    :param codes: return int8 colour codes (see _ma_colors) instead of categoricals
+    Returns: MMAR colours of leadMA (ma05), ma10 .. ma90
     """
     """
     Author(Freqtrade): Creslinux
@@ -344,155 +593,32 @@ def mmar(dataframe, matype="EMA", src="close", debug=False):
     plot( ma90, color=maColor(ma90,ma100), style=line, title="MMA90", linewidth=3)
     :return:
     """
-    import talib as ta
-
-    matype = matype
-    src = src
-    df = dataframe
-    debug = debug
+    close = np.ascontiguousarray(dataframe[src], dtype=np.float64)
 
     # Default to EMA, allow SMA if passed to def.
-    if matype == "EMA" or matype == "ema":
-        ma = ta.EMA
-    elif matype == "SMA" or matype == "sma":
-        ma = ta.SMA
+    if matype == "SMA" or matype == "sma":
+        ribbon = _sma_ribbon(close, MMAR_PERIODS)
     else:
-        ma = ta.EMA
-
-    # Get MAs, also last MA in own column to pass to def later
-    df["ma05"] = ma(df[src], 5)
-    df['ma05l'] = df['ma05'].shift(+1)
-    df["ma10"] = ma(df[src], 10)
-    df['ma10l'] = df['ma10'].shift(+1)
-    df["ma20"] = ma(df[src], 20)
-    df['ma20l'] = df['ma20'].shift(+1)
-    df["ma30"] = ma(df[src], 30)
-    df['ma30l'] = df['ma30'].shift(+1)
-    df["ma40"] = ma(df[src], 40)
-    df['ma40l'] = df['ma40'].shift(+1)
-    df["ma50"] = ma(df[src], 50)
-    df['ma50l'] = df['ma50'].shift(+1)
-    df["ma60"] = ma(df[src], 60)
-    df['ma60l'] = df['ma60'].shift(+1)
-    df["ma70"] = ma(df[src], 70)
-    df['ma70l'] = df['ma70'].shift(+1)
-    df["ma80"] = ma(df[src], 80)
-    df['ma80ll'] = df['ma80'].shift(+1)
-    df["ma90"] = ma(df[src], 90)
-    df['ma90l'] = df['ma90'].shift(+1)
-    df["ma100"] = ma(df[src], 100)
-    df['ma100l'] = df['ma100'].shift(+1)
-
-    """ logic for LeadMA
-    : change(ma05)>=0 and ma05>ma100 ? lime    +2
-    : change(ma05)<0  and ma05>ma100 ? maroon  -1
-    : change(ma05)<=0 and ma05<ma100 ? red     -2
-    : change(ma05)>=0 and ma05<ma100 ? green   +1
-    : gray
-    """
-
-    def leadMAc(x):
-        if (x['ma05'] - x['ma05l']) >= 0 and (x['ma05'] > x['ma100']):
-            # Lime: Uptrend.Long trading
-            x["leadMA"] = "lime"
-            return x["leadMA"]
-        elif (x['ma05'] - x['ma05l']) < 0 and (x['ma05'] > x['ma100']):
-            # Maroon : Short Reentry (sell the peak) or uptrend reversal warning
-            x["leadMA"] = "maroon"
-            return x["leadMA"]
-        elif (x['ma05'] - x['ma05l']) <= 0 and (x['ma05'] < x['ma100']):
-            # Red : Downtrend. Short trading
-            x["leadMA"] = "red"
-            return x["leadMA"]
-        elif (x['ma05'] - x['ma05l']) >= 0 and (x['ma05'] < x['ma100']):
-            # Green: Reentry(buy the dip) or downtrend reversal warning
-            x["leadMA"] = "green"
-            return x["leadMA"]
-        else:
-            # If its great it means not enough ticker data for lookback
-            x["leadMA"] = "grey"
-            return x["leadMA"]
-
-    df['leadMA'] = df.apply(leadMAc, axis=1)
-
-    """   Logic for MAs 
-    : change(ma)>=0 and ma05>ma100 ? lime
-    : change(ma)<0  and ma05>ma100 ? maroon
-    : change(ma)<=0 and ma05<ma100 ? red
-    : change(ma)>=0 and ma05<ma100 ? green
-    : gray
-    """
-
-    def maColor(x, ma):
-        col_label = '_'.join([ma, "c"])
-        col_lable_l = ''.join([ma, "l"])
-
-        if (x[ma] - x[col_lable_l]) >= 0 and (x[ma] > x['ma100']):
-            # Lime: Uptrend.Long trading
-            x[col_label] = "lime"
-            return x[col_label]
-        elif (x[ma] - x[col_lable_l]) < 0 and (x[ma] > x['ma100']):
-            # Maroon : Short Reentry (sell the peak) or uptrend reversal warning
-            x[col_label] = "maroon"
-            return x[col_label]
-
-        elif (x[ma] - x[col_lable_l]) <= 0 and (x[ma] < x['ma100']):
-            # Red : Downtrend. Short trading
-            x[col_label] = "red"
-            return x[col_label]
-
-        elif (x[ma] - x[col_lable_l]) >= 0 and (x[ma] < x['ma100']):
-            # Green: Reentry(buy the dip) or downtrend reversal warning
-            x[col_label] = "green"
-            return x[col_label]
-        else:
-            # If its great it means not enough ticker data for lookback
-            x[col_label] = 'grey'
-            return x[col_label]
-
-    df['ma05_c'] = df.apply(maColor, ma="ma05", axis=1)
-    df['ma10_c'] = df.apply(maColor, ma="ma10", axis=1)
-    df['ma20_c'] = df.apply(maColor, ma="ma20", axis=1)
-    df['ma30_c'] = df.apply(maColor, ma="ma30", axis=1)
-    df['ma40_c'] = df.apply(maColor, ma="ma40", axis=1)
-    df['ma50_c'] = df.apply(maColor, ma="ma50", axis=1)
-    df['ma60_c'] = df.apply(maColor, ma="ma60", axis=1)
-    df['ma70_c'] = df.apply(maColor, ma="ma70", axis=1)
-    df['ma80_c'] = df.apply(maColor, ma="ma80", axis=1)
-    df['ma90_c'] = df.apply(maColor, ma="ma90", axis=1)
+        ribbon = _ema_ribbon(close, MMAR_PERIODS)
+
+    colors = _ma_colors(ribbon, ribbon[-1])
 
     if debug:
-        from pandas import set_option
-        set_option('display.max_rows', 10)
-        print(df[["date", "leadMA",
-                  "ma05", "ma05l", "ma05_c",
-                  "ma10", "ma10l", "ma10_c",
-                  # "ma20", "ma20l", "ma20_c",
-                  # "ma30", "ma30l", "ma30_c",
-                  # "ma40", "ma40l", "ma40_c",
-                  # "ma50", "ma50l", "ma50_c",
-                  # "ma60", "ma60l", "ma60_c",
-                  # "ma70", "ma70l", "ma70_c",
-                  # "ma80", "ma80l", "ma80_c",
-                  "ma90", "ma90l", "ma90_c",
-                  "ma100", "leadMA"]].tail(200))
-
-        print(df[["date", 'close',
-                  "leadMA",
-                  "ma10_c",
-                  "ma20_c",
-                  "ma30_c",
-                  "ma40_c",
-                  "ma50_c",
-                  "ma60_c",
-                  "ma70_c",
-                  "ma80_c",
-                  "ma90_c"
-                  ]].tail(684))
-
-    return df['leadMA'], df['ma10_c'], df['ma20_c'], df['ma30_c'], \
-           df['ma40_c'], df['ma50_c'], df['ma60_c'], df['ma70_c'], \
-           df['ma80_c'], df['ma90_c']
+        print(pd.DataFrame(ribbon.T, index=getattr(dataframe, 'index', None),
+                           columns=['ma{:02d}'.format(p) for p in MMAR_PERIODS]).tail(200))
+        print(pd.DataFrame(colors.T, index=getattr(dataframe, 'index', None),
+                           columns=['ma{:02d}_c'.format(p) for p in MMAR_PERIODS]).tail(200))
+
+    if codes:
+        return tuple(colors[i] for i in range(len(MMAR_PERIODS) - 1))
+
+    # leadMA is the colour of ma05, followed by ma10 .. ma90
+    if isinstance(dataframe, ArrayFrame):
+        names = np.array(MMAR_COLORS, dtype=object)
+        return tuple(names[colors[i] + 2] for i in range(len(MMAR_PERIODS) - 1))
+    return tuple(
+        pd.Series(pd.Categorical.from_codes(colors[i] + 2, categories=MMAR_COLORS), index=dataframe.index)
+        for i in range(len(MMAR_PERIODS) - 1))
 
 
 def madrid_sqz(datafame, length=34, src='close', ref=13, sqzLen=5):
@@ -541,14 +667,10 @@ def madrid_sqz(datafame, length=34, src='close', ref=13, sqzLen=5):
                 refma < 0 and closema > refma) ? yellow: refma >= 0 ? green: maroon)
     """
     import talib as ta
-    from numpy import where
 
-    len = length
-    src = src
-    ref = ref
-    sqzLen = sqzLen
-    df = datafame
     ema = ta.EMA
+    source = np.ascontiguousarray(datafame[src], dtype=np.float64)
+    close = np.ascontiguousarray(datafame['close'], dtype=np.float64)
 
     """ Original code logic
     ma = ema(src, len)
@@ -556,10 +678,10 @@ def madrid_sqz(datafame, length=34, src='close', ref=13, sqzLen=5):
     refma = ema(src, ref) - ma
     sqzma = ema(src, sqzLen) - ma
     """
-    df['sqz_ma'] = ema(df[src], len)
-    df['sqz_cma'] = df['close'] - df['sqz_ma']
-    df['sqz_rma'] = ema(df[src], ref) - df['sqz_ma']
-    df['sqz_sma'] = ema(df[src], sqzLen) - df['sqz_ma']
+    ma = ema(source, length)
+    cma = close - ma
+    rma = ema(source, ref) - ma
+    sma = ema(source, sqzLen) - ma
 
     """ Original code logic
     plotcandle(0, closema, 0, closema, color=closema >= 0?aqua: fuchsia)
@@ -569,49 +691,20 @@ def madrid_sqz(datafame, length=34, src='close', ref=13, sqzLen=5):
     (refma >= 0 and closema < refma) or (refma < 0 and closema > refma) ? yellow: 
     refma >= 0 ? green: maroon)
     """
+    cma_c = np.where(cma >= 0, "aqua", "fuchsia").astype(object)
+    sma_c = np.where(sma >= 0, "lime", "red").astype(object)
+    rma_c = np.select(
+        [((rma >= 0) & (cma < rma)) | ((rma < 0) & (cma > rma)), rma >= 0],
+        ["yellow", "green"],
+        "maroon"
+    ).astype(object)
 
-    # print(df[['sqz_cma', 'sqz_rma', 'sqz_sma']])
-
-    def sqz_cma_c(x):
-        if x['sqz_cma'] >= 0:
-            x['sqz_cma_c'] = "aqua"
-            return x['sqz_cma_c']
-        else:
-            x['sqz_cma_c'] = "fuchsia"
-            return x['sqz_cma_c']
-
-    df['sqz_cma_c'] = df.apply(sqz_cma_c, axis=1)
-
-    def sqz_sma_c(x):
-        if x['sqz_sma'] >= 0:
-            x['sqz_sma_c'] = "lime"
-            return x['sqz_sma_c']
-        else:
-            x['sqz_sma_c'] = "red"
-            return x['sqz_sma_c']
-
-    df['sqz_sma_c'] = df.apply(sqz_sma_c, axis=1)
-
-    def sqz_rma_c(x):
-        if x['sqz_rma'] >= 0 and x['sqz_cma'] < x['sqz_rma']:
-            x['sqz_rma_c'] = "yellow"
-            return x['sqz_rma_c']
-        elif x['sqz_rma'] < 0 and x['sqz_cma'] > x['sqz_rma']:
-            x['sqz_rma_c'] = "yellow"
-            return x['sqz_rma_c']
-        elif x['sqz_rma'] >= 0:
-            x['sqz_rma_c'] = "green"
-            return x['sqz_rma_c']
-        else:
-            x['sqz_rma_c'] = "maroon"
-            return x['sqz_rma_c']
-
-    df['sqz_rma_c'] = df.apply(sqz_rma_c, axis=1)
-
-    # print(df[['sqz_cma_c', 'sqz_rma_c', 'sqz_sma_c']])
-    return df['sqz_cma_c'], df['sqz_rma_c'], df['sqz_sma_c']
+    return _series(cma_c, datafame, 'sqz_cma_c'), \
+        _series(rma_c, datafame, 'sqz_rma_c'), \
+        _series(sma_c, datafame, 'sqz_sma_c')
 
 
+@_via_pandas
 def stc(dataframe, fast=23, slow=50, length=10):
     import pandas as pd
     # First, the 23-period and the 50-period EMA and the MACD values are calculated:
@@ -634,150 +727,237 @@ def stc(dataframe, fast=23, slow=50, length=10):
     return dataframe['stc']
 
 
-def laguerre(dataframe, gamma=0.75, smooth=1, debug=bool):
-    """
-    laguerre RSI
-    Author Creslin
-    Original Author: John Ehlers 1979
-
-
-    :param dataframe: df
-    :param gamma: Between 0 and 1, default 0.75
-    :param smooth: 1 is off. Valid values over 1 are alook back smooth for an ema
-    :param debug: Bool, prints to console
-    :return: Laguerre RSI:values 0 to +1
-    """
+@_kernel
+def _laguerre_kernel(close, gamma, smooth, state):
     """
-    Laguerra RSI 
-    How to trade lrsi:  (TL, DR) buy on the flat 0, sell on the drop from top,
-    not when touch the top
-    http://systemtradersuccess.com/testing-laguerre-rsi/
-
-    http://www.davenewberg.com/Trading/TS_Code/Ehlers_Indicators/Laguerre_RSI.html
+    state holds L0, L1, L2, L3, the ema of the smoothing, the number of values seen
+    by the ema and their running sum, it is updated in place
     """
-    import talib as ta
-    import pandas as pd
-    ema = ta.EMA
-
-    df = dataframe
+    n = close.shape[0]
+    out = np.empty(n)
     g = gamma
-    smooth = smooth
-    debug = debug
-    if debug:
-        from pandas import set_option
-        set_option('display.max_rows', 2000)
-        set_option('display.max_columns', 8)
+    L0, L1, L2, L3 = state[0], state[1], state[2], state[3]
+    ema, seen, total = state[4], state[5], state[6]
+    k = 2.0 / (smooth + 1)
 
-    """
-    Vectorised pandas or numpy calculations are not used
-    in Laguerre as L0 is self referencing.
-    Therefore we use an intertuples loop as next best option. 
-    """
-    lrsi_l = []
-    L0, L1, L2, L3 = 0.0, 0.0, 0.0, 0.0
-    for row in df.itertuples(index=True, name='lrsi'):
-        """ Original Pine Logic  Block1
-        p = close
-        L0 = ((1 - g)*p)+(g*nz(L0[1]))
-        L1 = (-g*L0)+nz(L0[1])+(g*nz(L1[1]))
-        L2 = (-g*L1)+nz(L1[1])+(g*nz(L2[1]))
-        L3 = (-g*L2)+nz(L2[1])+(g*nz(L3[1])) 
-        """
+    for i in range(n):
         # Feed back loop
         L0_1, L1_1, L2_1, L3_1 = L0, L1, L2, L3
 
-        L0 = (1 - g) * row.close + g * L0_1
+        L0 = (1 - g) * close[i] + g * L0_1
         L1 = -g * L0 + L0_1 + g * L1_1
         L2 = -g * L1 + L1_1 + g * L2_1
         L3 = -g * L2 + L2_1 + g * L3_1
 
-        """ Original Pinescript Block 2 
-        cu=(L0 > L1? L0 - L1: 0) + (L1 > L2? L1 - L2: 0) + (L2 > L3? L2 - L3: 0)
-        cd=(L0 < L1? L1 - L0: 0) + (L1 < L2? L2 - L1: 0) + (L2 < L3? L3 - L2: 0)
-        """
         cu = 0.0
         cd = 0.0
-        if (L0 >= L1):
+        if L0 >= L1:
             cu = L0 - L1
         else:
             cd = L1 - L0
 
-        if (L1 >= L2):
+        if L1 >= L2:
             cu = cu + L1 - L2
         else:
             cd = cd + L2 - L1
 
-        if (L2 >= L3):
+        if L2 >= L3:
             cu = cu + L2 - L3
         else:
             cd = cd + L3 - L2
 
-        """Original Pinescript  Block 3 
-        lrsi=ema((cu+cd==0? -1: cu+cd)==-1? 0: (cu/(cu+cd==0? -1: cu+cd)), smooth)
-        """
         if (cu + cd) != 0:
-            lrsi_l.append(cu / (cu + cd))
+            lrsi = cu / (cu + cd)
         else:
-            lrsi_l.append(0)
+            lrsi = 0.0
+
+        if smooth <= 1:
+            out[i] = lrsi
+        elif seen < smooth:
+            # same seeding as talib.EMA, the first value is the sma of `smooth` values
+            total += lrsi
+            seen += 1
+            if seen == smooth:
+                ema = total / smooth
+                out[i] = ema
+            else:
+                out[i] = np.nan
+        else:
+            ema = (lrsi - ema) * k + ema
+            out[i] = ema
+
+    state[0], state[1], state[2], state[3] = L0, L1, L2, L3
+    state[4], state[5], state[6] = ema, seen, total
+    return out
+
+
+class LaguerreState():
+    """
+    resumable Laguerre RSI, keeps the L0..L3 filter and the smoothing ema between calls
+    so a live bot only feeds the bars it has not seen yet
+    """
+
+    __slots__ = ('gamma', 'smooth', 'state')
+
+    def __init__(self, gamma=0.75, smooth=1):
+        self.gamma = float(gamma)
+        self.smooth = int(smooth)
+        self.state = np.zeros(7)
 
-    return lrsi_l
+    @property
+    def filters(self):
+        """
+        :return: (L0, L1, L2, L3) after the last processed bar
+        """
+        return tuple(float(v) for v in self.state[:4])
+
+    def run(self, close) -> np.ndarray:
+        """
+        :param close: closes of the bars following the last processed one
+        :return: float64 array of the Laguerre RSI of these bars
+        """
+        return _laguerre_kernel(np.ascontiguousarray(close, dtype=np.float64),
+                                self.gamma, self.smooth, self.state)
+
+    def update(self, close) -> float:
+        """
+        :param close: close of the next bar
+        :return: Laguerre RSI of that bar, NaN while the smoothing warms up
+        """
+        return float(self.run(np.array([close], dtype=np.float64))[0])
+
+
+def laguerre(dataframe, gamma=0.75, smooth=1, debug=bool):
+    """
+    laguerre RSI
+    Author Creslin
+    Original Author: John Ehlers 1979
+
+
+    :param dataframe: df
+    :param gamma: Between 0 and 1, default 0.75
+    :param smooth: 1 is off. Valid values over 1 are alook back smooth for an ema
+    :param debug: Bool, prints to console
+    :return: Laguerre RSI:values 0 to +1 as float64 array
+    """
+    """
+    Laguerra RSI 
+    How to trade lrsi:  (TL, DR) buy on the flat 0, sell on the drop from top,
+    not when touch the top
+    http://systemtradersuccess.com/testing-laguerre-rsi/
+
+    http://www.davenewberg.com/Trading/TS_Code/Ehlers_Indicators/Laguerre_RSI.html
+    """
+    """
+    Vectorised pandas or numpy calculations are not used
+    in Laguerre as L0 is self referencing.
+    The recursion runs in _laguerre_kernel, compiled with numba when available,
+    use LaguerreState to resume from the last bar instead of starting over.
+
+    Original Pine Logic
+    p = close
+    L0 = ((1 - g)*p)+(g*nz(L0[1]))
+    L1 = (-g*L0)+nz(L0[1])+(g*nz(L1[1]))
+    L2 = (-g*L1)+nz(L1[1])+(g*nz(L2[1]))
+    L3 = (-g*L2)+nz(L2[1])+(g*nz(L3[1]))
+    cu=(L0 > L1? L0 - L1: 0) + (L1 > L2? L1 - L2: 0) + (L2 > L3? L2 - L3: 0)
+    cd=(L0 < L1? L1 - L0: 0) + (L1 < L2? L2 - L1: 0) + (L2 < L3? L3 - L2: 0)
+    lrsi=ema((cu+cd==0? -1: cu+cd)==-1? 0: (cu/(cu+cd==0? -1: cu+cd)), smooth)
+    """
+    if debug is True:
+        from pandas import set_option
+        set_option('display.max_rows', 2000)
+        set_option('display.max_columns', 8)
 
+    return LaguerreState(gamma, smooth).run(dataframe['close'])
 
-def ichimoku(dataframe):
-    "Ichimoku cloud indicator"
 
-    from datetime import timedelta
+def _rolling_extreme(values, window, maximum) -> ndarray:
+    """
+    max or min of every full window, NaN for the first window - 1 rows and for windows
+    holding a NaN, like pandas rolling
+    """
+    out = np.full(values.shape[0], np.nan)
+    if values.shape[0] >= window:
+        windows = np.lib.stride_tricks.sliding_window_view(values, window)
+        out[window - 1:] = windows.max(axis=1) if maximum else windows.min(axis=1)
+    return out
 
-    df = dataframe.copy()
 
-    high_9 = df['high'].rolling(window=9).max()
-    low_9 = df['low'].rolling(window=9).min()
-    df['tenkan_sen'] = (high_9 + low_9) / 2
+def ichimoku(dataframe, tenkan=9, kijun=26, senkou=52, displacement=26, chikou=22):
+    """
+    Ichimoku cloud indicator
 
-    high_26 = df['high'].rolling(window=26).max()
-    low_26 = df['low'].rolling(window=26).min()
-    df['kijun_sen'] = (high_26 + low_26) / 2
+    Every series has len(dataframe) + displacement values: the spans are projected
+    displacement bars ahead, into slots allocated once, and `date` continues the frame's
+    own bar interval into these slots. streaming.Ichimoku computes the same bar by bar.
 
-    # this is to extend the 'df' in future for 26 days
-    # the 'df' here is numerical indexed df
-    last_index = df.iloc[-1:].index[0]
-    last_date = df['date'].iloc[-1].date()
-    for i in range(26):
-        df.loc[last_index + 1 + i, 'date'] = last_date + timedelta(days=i)
+    :param dataframe: dataframe or ArrayFrame containing date/high/low/close
+    :return: dict of Series (arrays for an ArrayFrame): date, tenkan_sen, kijun_sen, senkou_span_a, senkou_span_b, chikou_span
+    """
+    high = np.ascontiguousarray(dataframe['high'], dtype=np.float64)
+    low = np.ascontiguousarray(dataframe['low'], dtype=np.float64)
+    close = np.ascontiguousarray(dataframe['close'], dtype=np.float64)
+    n = close.shape[0]
+    size = n + displacement
 
-    df['senkou_span_a'] = ((df['tenkan_sen'] + df['kijun_sen']) / 2).shift(26)
+    tenkan_sen = np.full(size, np.nan)
+    tenkan_sen[:n] = (_rolling_extreme(high, tenkan, True) + _rolling_extreme(low, tenkan, False)) / 2
 
-    high_52 = df['high'].rolling(window=52).max()
-    low_52 = df['low'].rolling(window=52).min()
-    df['senkou_span_b'] = ((high_52 + low_52) / 2).shift(26)
+    kijun_sen = np.full(size, np.nan)
+    kijun_sen[:n] = (_rolling_extreme(high, kijun, True) + _rolling_extreme(low, kijun, False)) / 2
 
-    # most charting softwares dont plot this line
-    df['chikou_span'] = df['close'].shift(-22)  # sometimes -26
+    senkou_span_a = np.full(size, np.nan)
+    senkou_span_a[displacement:] = (tenkan_sen[:n] + kijun_sen[:n]) / 2
 
+    senkou_span_b = np.full(size, np.nan)
+    senkou_span_b[displacement:] = (_rolling_extreme(high, senkou, True) + _rolling_extreme(low, senkou, False)) / 2
+
+    # most charting softwares dont plot this line
+    chikou_span = np.full(size, np.nan)
+    chikou_span[:max(n - chikou, 0)] = close[chikou:]  # sometimes -26
+
+    dates = pd.DatetimeIndex(dataframe['date'])
+    values = dates.values
+    step = np.diff(values).min() if n > 1 else np.timedelta64(1, 'D')
+    projected = np.empty(size, dtype=values.dtype)
+    projected[:n] = values
+    projected[n:] = values[-1] + step * np.arange(1, displacement + 1) if n else values[:0]
+    projected = pd.DatetimeIndex(projected)
+    if dates.tz is not None:
+        projected = projected.tz_localize('UTC').tz_convert(dates.tz)
+
+    if isinstance(dataframe, ArrayFrame):
+        return {'date': projected.values, 'tenkan_sen': tenkan_sen, 'kijun_sen': kijun_sen,
+                'senkou_span_a': senkou_span_a, 'senkou_span_b': senkou_span_b, 'chikou_span': chikou_span}
+
+    index = pd.RangeIndex(size)
     return {
-        'tenkan_sen': df['tenkan_sen'],
-        'kijun_sen': df['kijun_sen'],
-        'senkou_span_a': df['senkou_span_a'],
-        'senkou_span_b': df['senkou_span_b'],
-        'chikou_span': df['chikou_span'],
+        'date': Series(projected, index=index),
+        'tenkan_sen': Series(tenkan_sen, index=index),
+        'kijun_sen': Series(kijun_sen, index=index),
+        'senkou_span_a': Series(senkou_span_a, index=index),
+        'senkou_span_b': Series(senkou_span_b, index=index),
+        'chikou_span': Series(chikou_span, index=index),
     }
 
 
 def ema(dataframe, period, field='close'):
     import talib.abstract as ta
-    return ta.EMA(dataframe, timeperiod=period, price=field)
+    return ta.EMA(_talib_inputs(dataframe), timeperiod=period, price=field)
 
 
 def tema(dataframe, period, field='close'):
     import talib.abstract as ta
-    return ta.TEMA(dataframe, timeperiod=period, price=field)
+    return ta.TEMA(_talib_inputs(dataframe), timeperiod=period, price=field)
 
 
 def sma(dataframe, period, field='close'):
     import talib.abstract as ta
-    return ta.SMA(dataframe, timeperiod=period, price=field)
+    return ta.SMA(_talib_inputs(dataframe), timeperiod=period, price=field)
 
 
+@_via_pandas
 def vpcii(dataframe, period_short=5, period_long=20, hist=8,hist_long=30):
     """
     improved version of the vpcii
@@ -797,6 +977,7 @@ def vpcii(dataframe, period_short=5, period_long=20, hist=8,hist_long=30):
 
     return dataframe['vpci_hist'].abs()
 
+@_via_pandas
 def vpci(dataframe, period_short=5,period_long=20):
     """
     volume confirming indicator as seen here
@@ -820,9 +1001,9 @@ def vpci(dataframe, period_short=5,period_long=20):
     return vpci
 
 
-def williams_percent(dataframe):
+def williams_percent(dataframe, period=14):
     from pyti.williams_percent_r import williams_percent_r
-    return williams_percent_r(dataframe['close'])
+    return williams_percent_r(dataframe['close'], dataframe['high'], dataframe['low'], period)
 
 
 def momentum(dataframe, field='close', period=9):
@@ -830,10 +1011,11 @@ def momentum(dataframe, field='close', period=9):
     return m(dataframe[field], period)
 
 
+@_via_pandas
 def vwma(df, window):
-    return df.apply(lambda x: x.close * x.volume, axis=1).rolling(window).sum() / df.volume.rolling(window).sum()
+    return (df['close'] * df['volume']).rolling(window).sum() / df['volume'].rolling(window).sum()
 
 
 def ultimate_oscilator(dataframe):
     from pyti.ultimate_oscillator import ultimate_oscillator as uo
-    uo(dataframe['close'], dataframe['low'])
+    return uo(dataframe['close'], dataframe['high'], dataframe['low'])
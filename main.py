@@ -1,9 +1,15 @@
+import asyncio
+
 import bitmex
-import time
 
+from checkpoint import Checkpoint
 from configuration import *
-
+from metrics import METRICS, InstrumentedClient
+from positions import PositionBook
+from ratelimit import RateLimitedClient
+from runtime import Runtime
 from strategy import Strategy
+from streaming import MFI
 from trader import Trader
 
 if __name__ == "__main__":
@@ -14,10 +20,38 @@ if __name__ == "__main__":
         api_secret=API_SECRET
     )
 
-    strategy = Strategy(client, timeframe=TIMEFRAME)
-    trader = Trader(client, strategy, money_to_trade=AMOUNT_MONEY_TO_TRADE, leverage=LEVERAGE)
+    if METRICS_PORT:
+        METRICS.serve(METRICS_PORT)
+        client = InstrumentedClient(client)
+
+    # shared by every Strategy and Trader: paced by the exchange's rate limit headers,
+    # retried on 429/503 and identical concurrent reads sent once
+    client = RateLimitedClient(client, limit=REST_RATE_LIMIT, max_retries=REST_MAX_RETRIES,
+                               pool_size=REST_POOL_SIZE)
+
+    url = None
+    if MARKET_DATA == 'websocket':
+        from feed import BITMEX_WS_URL, BITMEX_TESTNET_WS_URL
+        url = BITMEX_TESTNET_WS_URL if TEST_EXCHANGE else BITMEX_WS_URL
+
+    # positions are streamed when the websocket can be authenticated, otherwise fetched per signal
+    positions = PositionBook() if MARKET_DATA == 'websocket' and API_KEY else None
+
+    runtime = Runtime(client, market_data=MARKET_DATA, url=url, close_offset=CANDLE_CLOSE_OFFSET,
+                      positions=positions, api_key=API_KEY, api_secret=API_SECRET,
+                      reconcile_interval=POSITION_RECONCILE_INTERVAL,
+                      summary_interval=METRICS_SUMMARY_INTERVAL,
+                      checkpoint=Checkpoint(CHECKPOINT_PATH) if CHECKPOINT_PATH else None,
+                      checkpoint_interval=CHECKPOINT_INTERVAL)
+
+    for symbol, timeframe in INSTRUMENTS:
+        # the streaming mfi is checkpointed with the candle buffer, so a restart resumes it
+        strategy = Strategy(client, timeframe=timeframe, symbol=symbol, streaming={'mfi': MFI(14, low='close')})
+        trader = Trader(client, strategy, money_to_trade=AMOUNT_MONEY_TO_TRADE, leverage=LEVERAGE,
+                        execution=EXECUTION, positions=positions)
+        runtime.add(strategy, trader)
 
-    while True:
-        if round(time.time()) % time_to_wait_new_trade[TIMEFRAME] == 0:
-            trader.execute_trade()
-            time.sleep(5)  # 10
+    try:
+        asyncio.run(runtime.serve())
+    except KeyboardInterrupt:
+        pass  # runtime.stop() already saved the checkpoint and shut the workers down
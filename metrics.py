@@ -0,0 +1,262 @@
+"""
+    latency histograms and counters of the trading loop, served in the Prometheus text format
+"""
+import bisect
+import threading
+import time
+from collections import deque
+
+# upper bounds in seconds, from sub-millisecond indicator math to slow REST round trips
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+PREFIX = 'bitmexbot_'
+
+
+class Histogram():
+    """
+    cumulative bucket counts for the endpoint plus the last `window` values for the
+    rolling summary
+    """
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count', 'recent')
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, window=1000):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.recent = deque(maxlen=window)
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        self.recent.append(value)
+
+
+class _Timer():
+    __slots__ = ('metrics', 'name', 'labels', 'started')
+
+    def __init__(self, metrics, name, labels):
+        self.metrics, self.name, self.labels = metrics, name, labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.name, time.perf_counter() - self.started, **self.labels)
+
+
+class Metrics():
+    """
+    registry of histograms and counters keyed by name and labels
+
+    Recording is a dict lookup, a bisect and a few additions under a lock, a few
+    microseconds per tick for all stages together. render() produces the Prometheus
+    text exposition format, summary() rolling percentiles over the last `window`
+    observations of every histogram.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, window=1000):
+        self.buckets = buckets
+        self.window = window
+        self.histograms = {}
+        self.counters = {}
+        self.started = time.time()
+        self.port = None
+
+        self._lock = threading.Lock()
+        self._server = None
+
+    def observe(self, name, seconds, **labels):
+        key = (name, _key(labels))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(self.buckets, self.window)
+            histogram.observe(seconds)
+
+    def inc(self, name, value=1, **labels):
+        key = (name, _key(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def timer(self, name, **labels) -> _Timer:
+        """
+        with metrics.timer('stage_seconds', stage='fetch'): ...
+        """
+        return _Timer(self, name, labels)
+
+    def render(self) -> str:
+        """
+        :return: every metric in the Prometheus text exposition format
+        """
+        lines = []
+        with self._lock:
+            histograms = sorted(self.histograms.items())
+            counters = sorted(self.counters.items())
+
+        declared = set()
+        for (name, labels), histogram in histograms:
+            metric = PREFIX + name
+            if metric not in declared:
+                lines.append('# TYPE {} histogram'.format(metric))
+                declared.add(metric)
+            cumulative = 0
+            for bound, count in zip(histogram.buckets + (float('inf'),), histogram.counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append('{}_bucket{} {}'.format(metric, _labels(labels + (('le', le),)), cumulative))
+            lines.append('{}_sum{} {!r}'.format(metric, _labels(labels), histogram.sum))
+            lines.append('{}_count{} {}'.format(metric, _labels(labels), histogram.count))
+
+        for (name, labels), value in counters:
+            metric = PREFIX + name
+            if metric not in declared:
+                lines.append('# TYPE {} counter'.format(metric))
+                declared.add(metric)
+            lines.append('{}{} {}'.format(metric, _labels(labels), value))
+
+        lines.append('# TYPE {}uptime_seconds gauge'.format(PREFIX))
+        lines.append('{}uptime_seconds {:.0f}'.format(PREFIX, time.time() - self.started))
+        return '\n'.join(lines) + '\n'
+
+    def summary(self) -> str:
+        """
+        :return: one line per histogram with count, mean and p50/p95/p99/max in milliseconds
+            over the rolling window, then the counters
+        """
+        lines = []
+        with self._lock:
+            histograms = sorted((k, h.count, h.sum, list(h.recent)) for k, h in self.histograms.items())
+            counters = sorted(self.counters.items())
+
+        for (name, labels), count, total, recent in histograms:
+            if not recent:
+                continue
+            recent.sort()
+            p50, p95, p99 = (recent[min(len(recent) - 1, int(q * len(recent)))] * 1000 for q in (0.5, 0.95, 0.99))
+            lines.append('{:<64} n={:<7} mean={:8.2f}ms p50={:8.2f}ms p95={:8.2f}ms p99={:8.2f}ms max={:8.2f}ms'.format(
+                name + _labels(labels), count, total / count * 1000, p50, p95, p99, recent[-1] * 1000))
+        for (name, labels), value in counters:
+            lines.append('{:<64} {}'.format(name + _labels(labels), value))
+        return '\n'.join(lines)
+
+    def serve(self, port=9100, host='127.0.0.1'):
+        """
+        serves /metrics (Prometheus) and /summary (plain text) from a daemon thread
+
+        :param port: 0 picks a free port, see self.port
+        """
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.startswith('/metrics'):
+                    body, content_type = metrics.render(), 'text/plain; version=0.0.4'
+                elif self.path.startswith('/summary'):
+                    body, content_type = metrics.summary() + '\n', 'text/plain'
+                else:
+                    self.send_error(404)
+                    return
+                body = body.encode()
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self.port = self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever, name='metrics', daemon=True).start()
+        return self._server
+
+    def close(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+def _key(labels) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _labels(labels) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(k, v.replace('"', '\\"')) for k, v in labels) + '}'
+
+
+class _Operation():
+    def __init__(self, metrics, name, operation):
+        self.metrics, self.name, self.operation = metrics, name, operation
+
+    def __call__(self, *args, **kwargs):
+        self.metrics.inc('exchange_requests_total', operation=self.name)
+        sent = time.perf_counter()
+        return _TimedFuture(self.metrics, self.name, self.operation(*args, **kwargs), sent)
+
+
+class _TimedFuture():
+    """
+    times the round trip from the call until its result is available
+    """
+
+    def __init__(self, metrics, name, future, sent):
+        self.metrics, self.name, self.future, self.sent = metrics, name, future, sent
+
+    def _wait(self, method):
+        try:
+            res = method()
+        except Exception:
+            self.metrics.inc('exchange_errors_total', operation=self.name)
+            raise
+        finally:
+            self.metrics.observe('exchange_request_seconds', time.perf_counter() - self.sent, operation=self.name)
+        return res
+
+    def result(self, *args, **kwargs):
+        return self._wait(lambda: self.future.result(*args, **kwargs))
+
+    def response(self, *args, **kwargs):
+        return self._wait(lambda: self.future.response(*args, **kwargs))
+
+
+class _Resource():
+    def __init__(self, metrics, resource):
+        self._metrics, self._resource = metrics, resource
+
+    def __getattr__(self, name):
+        operation = getattr(self._resource, name)
+        if not callable(operation):
+            return operation
+        return _Operation(self._metrics, name, operation)
+
+
+class InstrumentedClient():
+    """
+    wraps a bitmex client (or SimulatedExchange): every operation is counted and its
+    round trip, errors included, recorded as exchange_request_seconds{operation=...}
+    """
+
+    def __init__(self, client, metrics=None):
+        self._client = client
+        self._metrics = metrics or METRICS
+        self._resources = {}
+
+    def __getattr__(self, name):
+        resource = self._resources.get(name)
+        if resource is None:
+            resource = self._resources[name] = _Resource(self._metrics, getattr(self._client, name))
+        return resource
+
+
+# process wide registry used by Strategy, Trader and the runtime
+METRICS = Metrics()
@@ -0,0 +1,158 @@
+"""
+    in-memory position and open-order book kept current by the private websocket tables
+"""
+import json
+import threading
+from collections import deque
+
+from candles import timestamp_ms
+
+# order states after which an order is no longer open
+CLOSED_ORDER_STATUS = ('Filled', 'Canceled', 'Rejected')
+
+
+class PositionBook():
+    """
+    current position and open orders per symbol, read in O(1) without network calls
+
+    Fed by the position, order and execution tables of MarketDataFeed (see attach):
+    partials replace the state, inserts and updates are merged by their keys, closed
+    orders are dropped. reconcile() overwrites it from REST, which the runtime does
+    periodically to recover from any missed message.
+
+    `synced` is set by the position partial of the stream and cleared when the feed
+    disconnects, so readers fall back to REST while the book is not kept current.
+    """
+
+    def __init__(self):
+        self.positions = {}
+        self.orders = {}
+        self.executions = deque(maxlen=1000)
+        self.synced = False
+
+        self._lock = threading.Lock()
+        # (table, key) -> timestamp of the stream updates received while reconcile() fetches
+        self._touched = None
+
+    def attach(self, feed):
+        """
+        subscribes the book to the private tables of feed
+        """
+        feed.on_table('position', self.on_position)
+        feed.on_table('order', self.on_order)
+        feed.on_table('execution', self.on_execution)
+        feed.on_disconnect(self.on_disconnect)
+
+    def on_disconnect(self):
+        self.synced = False
+
+    def _touch(self, table, key, row):
+        if self._touched is not None:
+            self._touched[(table, key)] = _timestamp(row)
+
+    def current_qty(self, symbol) -> int:
+        """
+        :return: signed position size in contracts, 0 if there is no position
+        """
+        position = self.positions.get(symbol)
+        return position.get('currentQty') or 0 if position else 0
+
+    def position(self, symbol) -> dict:
+        return dict(self.positions.get(symbol, {}))
+
+    def open_orders(self, symbol=None) -> list:
+        with self._lock:
+            return [dict(o) for o in self.orders.values() if symbol is None or o.get('symbol') == symbol]
+
+    def on_position(self, action, data):
+        with self._lock:
+            if action == 'partial':
+                self.positions = {}
+                self.synced = True
+            for row in data:
+                self._touch('position', row['symbol'], row)
+                if action == 'delete':
+                    self.positions.pop(row['symbol'], None)
+                else:
+                    self.positions.setdefault(row['symbol'], {}).update(row)
+
+    def on_order(self, action, data):
+        with self._lock:
+            if action == 'partial':
+                self.orders = {}
+            for row in data:
+                order_id = row['orderID']
+                self._touch('order', order_id, row)
+                if action == 'delete':
+                    self.orders.pop(order_id, None)
+                    continue
+                order = self.orders.setdefault(order_id, {})
+                order.update(row)
+                if order.get('ordStatus') in CLOSED_ORDER_STATUS or order.get('leavesQty') == 0:
+                    del self.orders[order_id]
+
+    def on_execution(self, action, data):
+        if action == 'partial':
+            return
+        for row in data:
+            self.executions.append(row)
+
+    def reconcile(self, client, symbols=None):
+        """
+        replaces the book with the REST view of positions and open orders
+
+        A position or order the stream updated while the REST requests were in flight
+        keeps its streamed state unless the REST row has a newer timestamp, so the
+        snapshot never rolls back a more recent update.
+
+        :param symbols: only reconcile these symbols, all if None
+        """
+        with self._lock:
+            self._touched = {}
+        try:
+            positions = client.Position.Position_get(
+                filter=json.dumps({"symbol": symbols[0]}) if symbols and len(symbols) == 1 else None
+            ).result()[0]
+            orders = client.Order.Order_getOrders(
+                filter=json.dumps({"open": True}),
+                count=500
+            ).result()[0]
+        except Exception:
+            with self._lock:
+                self._touched = None
+            raise
+
+        def in_scope(row):
+            return symbols is None or row.get('symbol') in symbols
+
+        with self._lock:
+            touched, self._touched = self._touched, None
+            self.positions = _merge(self.positions, {row['symbol']: dict(row) for row in positions if in_scope(row)},
+                                    touched, 'position', in_scope)
+            self.orders = _merge(self.orders, {row['orderID']: dict(row) for row in orders if in_scope(row)},
+                                 touched, 'order', in_scope)
+
+
+def _timestamp(row):
+    return timestamp_ms(row['timestamp']) if row and row.get('timestamp') is not None else None
+
+
+def _merge(book, fresh, touched, table, in_scope) -> dict:
+    """
+    :param book: current rows by key
+    :param fresh: REST rows by key, in scope only
+    :param touched: (table, key) -> timestamp of the stream updates received during the fetch
+    :return: the rows of fresh, except where the stream is newer, and the rows of book out of scope
+    """
+    merged = {key: row for key, row in book.items() if not in_scope(row)}
+    for key in set(fresh) | {key for key in book if key not in merged}:
+        if (table, key) not in touched:
+            if key in fresh:
+                merged[key] = fresh[key]
+            continue
+        streamed, rest = touched[(table, key)], _timestamp(fresh.get(key))
+        if key in fresh and rest is not None and (streamed is None or rest > streamed):
+            merged[key] = fresh[key]
+        elif key in book:
+            merged[key] = book[key]
+    return merged
@@ -0,0 +1,289 @@
+"""
+    rate limit aware wrapper of the bitmex REST client shared by every Strategy and Trader
+"""
+import copy
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+from metrics import METRICS
+
+# statuses after which BitMEX did not process the request and asks to come back later
+RETRY_STATUS = (429, 503)
+
+# read only operations, identical concurrent calls are sent once
+COALESCED_OPERATIONS = ('Position_get', 'Instrument_get', 'Order_getOrders', 'Trade_getBucketed',
+                        'User_getMargin', 'User_getWallet')
+
+
+class TokenBucket():
+    """
+    requests allowed by the exchange, refilled at limit per `period` seconds
+
+    The x-ratelimit-limit/-remaining headers of every response correct the local estimate
+    whenever the exchange counts fewer requests left; a 429 stops every caller until its
+    retry-after time.
+    """
+
+    def __init__(self, limit=60, period=60.0, clock=time.monotonic, sleep=time.sleep):
+        self.limit = limit
+        self.period = period
+        self.tokens = float(limit)
+        self.paused_until = 0.0
+
+        self._clock = clock
+        self._sleep = sleep
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.limit, self.tokens + (now - self._updated) * self.limit / self.period)
+        self._updated = now
+
+    def acquire(self) -> float:
+        """
+        takes a token, waiting until one is available
+
+        :return: seconds waited
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = self._clock()
+                self._refill(now)
+                if now >= self.paused_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                wait = max(self.paused_until - now, (1 - self.tokens) * self.period / self.limit)
+            self._sleep(wait)
+            waited += wait
+
+    def update(self, headers):
+        """
+        :param headers: response headers, x-ratelimit-limit/-remaining are read when present
+        """
+        headers = {k.lower(): v for k, v in (headers or {}).items()}
+        if 'x-ratelimit-remaining' not in headers:
+            return
+        with self._lock:
+            now = self._clock()
+            self._refill(now)
+            if 'x-ratelimit-limit' in headers:
+                self.limit = int(headers['x-ratelimit-limit'])
+            self.tokens = min(self.tokens, float(headers['x-ratelimit-remaining']))
+
+    def pause(self, seconds):
+        with self._lock:
+            self.paused_until = max(self.paused_until, self._clock() + seconds)
+            self.tokens = 0.0
+
+
+def backoff(attempt, base=0.5, cap=30.0) -> float:
+    """
+    exponential backoff with full jitter
+
+    :param attempt: 0 for the first retry
+    :return: seconds to wait
+    """
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def configure_pool(client, size=10):
+    """
+    sizes the keep-alive connection pool of a bravado client, so concurrent instruments
+    reuse connections instead of opening new ones; clients without a requests session are
+    left alone
+
+    :param size: connections kept per host, at least the number of threads using the client
+    :return: True if the pool was configured
+    """
+    session = getattr(getattr(getattr(client, 'swagger_spec', None), 'http_client', None), 'session', None)
+    if session is None:
+        return False
+    from requests import Session
+    from requests.adapters import HTTPAdapter
+
+    if not isinstance(session, Session):
+        return False
+
+    adapter = HTTPAdapter(pool_connections=size, pool_maxsize=size, pool_block=True)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return True
+
+
+def retry_after(headers, now=None):
+    """
+    :param headers: response headers, Retry-After holds seconds or an HTTP-date
+    :return: seconds to wait, None when the header is missing or unreadable
+    """
+    value = {k.lower(): v for k, v in (headers or {}).items()}.get('retry-after')
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - (now or time.time()))
+    except (TypeError, ValueError):
+        return None
+
+
+def _status(error):
+    return getattr(error, 'status_code', None)
+
+
+def _headers(response):
+    """
+    :param response: what future.result() or future.response() returned
+    """
+    if isinstance(response, tuple):
+        response = response[-1]
+    response = getattr(response, 'incoming_response', response)
+    return getattr(response, 'headers', None)
+
+
+class _Call():
+    """
+    one request in flight, shared by every identical read issued while it runs
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class _Future():
+    """
+    sends the request when its result is asked for, like the bravado future it wraps
+    """
+
+    def __init__(self, client, name, operation, kwargs):
+        self.client, self.name, self.operation, self.kwargs = client, name, operation, kwargs
+
+    def result(self):
+        return self.client._send(self.name, self.operation, self.kwargs, 'result')
+
+    def response(self):
+        return self.client._send(self.name, self.operation, self.kwargs, 'response')
+
+
+class _Operation():
+    def __init__(self, client, name, operation):
+        self.client, self.name, self.operation = client, name, operation
+
+    def __call__(self, **kwargs):
+        return _Future(self.client, self.name, self.operation, kwargs)
+
+
+class _Resource():
+    def __init__(self, client, resource):
+        self._client, self._resource = client, resource
+
+    def __getattr__(self, name):
+        operation = getattr(self._resource, name)
+        if not callable(operation):
+            return operation
+        return _Operation(self._client, name, operation)
+
+
+class RateLimitedClient():
+    """
+    wraps a bitmex client (or SimulatedExchange) so that every request
+
+    - takes a token from a TokenBucket kept in line with the x-ratelimit headers, so the
+      bot slows down before the exchange answers 429 rather than after
+    - is retried up to max_retries times on 429 and 503 with jittered exponential
+      backoff, never sooner than a retry-after header asks
+    - is sent once when it is a read identical to one already in flight, every caller
+      gets its result (COALESCED_OPERATIONS), the callers that waited get a deep copy of
+      the body from result(); the response object of response() is shared
+
+    The request is sent when result() or response() is called, on the caller's thread.
+    """
+
+    def __init__(self, client, limit=60, max_retries=5, pool_size=10, metrics=None, bucket=None):
+        """
+        :param limit: requests per minute until the first response tells the actual limit
+        :param pool_size: keep-alive connections per host, see configure_pool
+        """
+        self._client = client
+        self.bucket = bucket or TokenBucket(limit)
+        self.max_retries = max_retries
+        self._metrics = metrics or METRICS
+        self._resources = {}
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        configure_pool(client, pool_size)
+
+    def __getattr__(self, name):
+        resource = self._resources.get(name)
+        if resource is None:
+            resource = self._resources[name] = _Resource(self, getattr(self._client, name))
+        return resource
+
+    def _send(self, name, operation, kwargs, method):
+        """
+        :param method: 'result' or 'response', the method of the wrapped future to call
+        """
+        if name not in COALESCED_OPERATIONS:
+            return self._request(name, operation, kwargs, method)
+
+        key = (name, method, tuple(sorted((k, repr(v)) for k, v in kwargs.items())))
+        with self._lock:
+            call = self._in_flight.get(key)
+            leader = call is None
+            if leader:
+                call = self._in_flight[key] = _Call()
+
+        if not leader:
+            self._metrics.inc('exchange_coalesced_total', operation=name)
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            if method == 'result':
+                body, response = call.value
+                return copy.deepcopy(body), response
+            return call.value
+
+        try:
+            call.value = self._request(name, operation, kwargs, method)
+            return call.value
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            call.done.set()
+
+    def _request(self, name, operation, kwargs, method):
+        attempt = 0
+        while True:
+            waited = self.bucket.acquire()
+            if waited:
+                self._metrics.observe('ratelimit_wait_seconds', waited, operation=name)
+            try:
+                res = getattr(operation(**kwargs), method)()
+            except Exception as e:
+                status = _status(e)
+                headers = _headers(getattr(e, 'response', None))
+                self.bucket.update(headers)
+                if status not in RETRY_STATUS or attempt >= self.max_retries:
+                    raise
+
+                delay = max(backoff(attempt), retry_after(headers) or 0.0)
+                self._metrics.inc('exchange_retries_total', operation=name, status=status)
+                print(f"{name} got {status}, retry {attempt + 1} in {delay:.1f}s")
+                attempt += 1
+                if status == 429:
+                    self.bucket.pause(delay)  # every caller waits, the next acquire sleeps
+                else:
+                    time.sleep(delay)
+                continue
+
+            self.bucket.update(_headers(res))
+            return res
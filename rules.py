@@ -0,0 +1,242 @@
+"""
+    declarative buy/sell/take profit conditions compiled into a single numpy function
+"""
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+_OPERATORS = {'lt': '<', 'le': '<=', 'gt': '>', 'ge': '>=', 'eq': '==', 'ne': '!='}
+
+
+def _shifted(values, start, shift) -> np.ndarray:
+    """
+    rows start..n of values moved down by shift rows, NaN where there is no earlier row
+    """
+    values = np.asarray(values, dtype=np.float64)
+    n = values.shape[0]
+    if start >= shift:
+        return values[start - shift:n - shift]
+    return np.concatenate((np.full(min(shift - start, n - start), np.nan), values[:max(n - shift, 0)]))
+
+
+class Value(ABC):
+    """
+    a number per bar: a column of the frame or a constant, compared with <, >, ==... into a Rule
+    """
+
+    @abstractmethod
+    def source(self, shift, names) -> str:
+        """
+        :param shift: bars back, 1 for the previous bar
+        :param names: dict of (column, shift) to variable name, filled while compiling
+        :return: numpy expression of the value
+        """
+
+    def _compare(self, op, other):
+        return Compare(op, self, _value(other))
+
+    def __lt__(self, other):
+        return self._compare('lt', other)
+
+    def __le__(self, other):
+        return self._compare('le', other)
+
+    def __gt__(self, other):
+        return self._compare('gt', other)
+
+    def __ge__(self, other):
+        return self._compare('ge', other)
+
+    def __eq__(self, other):
+        return self._compare('eq', other)
+
+    def __ne__(self, other):
+        return self._compare('ne', other)
+
+    __hash__ = object.__hash__
+
+
+class Column(Value):
+    def __init__(self, name):
+        self.name = name
+
+    def source(self, shift, names):
+        return names.setdefault((self.name, shift), 'v{}'.format(len(names)))
+
+    def __repr__(self):
+        return self.name
+
+
+class Constant(Value):
+    def __init__(self, value):
+        self.value = float(value)
+
+    def source(self, shift, names):
+        return repr(self.value)
+
+    def __repr__(self):
+        return repr(self.value)
+
+
+def _value(value) -> Value:
+    if isinstance(value, Value):
+        return value
+    if isinstance(value, str):
+        return Column(value)
+    return Constant(value)
+
+
+class Rule(ABC):
+    """
+    a condition per bar, combined with & (and), | (or) and ~ (not)
+    """
+
+    @abstractmethod
+    def source(self, names) -> str:
+        """
+        :param names: dict of (column, shift) to variable name, filled while compiling
+        :return: numpy expression of a boolean array
+        """
+
+    def __and__(self, other):
+        return Combine('&', self, other)
+
+    def __or__(self, other):
+        return Combine('|', self, other)
+
+    def __invert__(self):
+        return Not(self)
+
+
+class Compare(Rule):
+    def __init__(self, op, left, right):
+        self.op, self.left, self.right = op, left, right
+
+    def source(self, names):
+        return '({} {} {})'.format(self.left.source(0, names), _OPERATORS[self.op], self.right.source(0, names))
+
+    def __repr__(self):
+        return '({!r} {} {!r})'.format(self.left, _OPERATORS[self.op], self.right)
+
+
+class Cross(Rule):
+    """
+    left crosses right on this bar: on the other side of it now, touching or on this side one bar ago
+    """
+
+    def __init__(self, direction, left, right):
+        self.direction, self.left, self.right = direction, _value(left), _value(right)
+
+    def source(self, names):
+        now, before = ('>', '<=') if self.direction == 'above' else ('<', '>=')
+        return '(({} {} {}) & ({} {} {}))'.format(
+            self.left.source(0, names), now, self.right.source(0, names),
+            self.left.source(1, names), before, self.right.source(1, names))
+
+    def __repr__(self):
+        return 'crossed_{}({!r}, {!r})'.format(self.direction, self.left, self.right)
+
+
+class Combine(Rule):
+    def __init__(self, op, left, right):
+        self.op, self.left, self.right = op, left, right
+
+    def source(self, names):
+        return '({} {} {})'.format(self.left.source(names), self.op, self.right.source(names))
+
+    def __repr__(self):
+        return '({!r} {} {!r})'.format(self.left, self.op, self.right)
+
+
+class Not(Rule):
+    def __init__(self, rule):
+        self.rule = rule
+
+    def source(self, names):
+        return '(~{})'.format(self.rule.source(names))
+
+    def __repr__(self):
+        return '~{!r}'.format(self.rule)
+
+
+def crossed_above(left, right) -> Rule:
+    """
+    :param left: column name, Column or number
+    :param right: column name, Column or number
+    """
+    return Cross('above', left, right)
+
+
+def crossed_below(left, right) -> Rule:
+    return Cross('below', left, right)
+
+
+class RuleSet():
+    """
+    named rules compiled into one generated function
+
+    Every column a rule reads, at the current and at the previous bar, is sliced once
+    and all rules are evaluated from these slices with vectorized numpy operators.
+    evaluate() covers the whole series in batch mode; with `last` set only the last
+    bars are computed, which is all live trading needs.
+    """
+
+    def __init__(self, **rules):
+        self.rules = rules
+        self.source, self._function = self._compile()
+
+    def _compile(self):
+        names = {}
+        expressions = {key: rule.source(names) for key, rule in self.rules.items()}
+
+        lines = ['def evaluate(columns, start, n):']
+        for (column, shift), name in names.items():
+            lines.append('    {} = _shifted(columns[{!r}], start, {})'.format(name, column, shift))
+        lines.append('    return {')
+        for key, expression in expressions.items():
+            lines.append('        {!r}: np.broadcast_to({}, (n - start,)),'.format(key, expression))
+        lines.append('    }')
+        source = '\n'.join(lines)
+
+        namespace = {'np': np, '_shifted': _shifted}
+        exec(compile(source, '<rules>', 'exec'), namespace)
+        return source, namespace['evaluate']
+
+    def evaluate(self, columns, last=None) -> dict:
+        """
+        :param columns: DataFrame or mapping of column name to 1D array
+        :param last: only evaluate the last `last` bars, every bar if None
+        :return: dict of rule name to bool array
+        """
+        n = len(next(iter(columns.values()))) if isinstance(columns, dict) else len(columns)
+        start = 0 if last is None else max(0, n - last)
+        with np.errstate(invalid='ignore'):
+            return self._function(columns, start, n)
+
+    def signals(self, columns, last=None) -> np.ndarray:
+        """
+        predictions from the buy, sell and tp rules: 1 buy, 2 sell, 3 take profit,
+        0 when nothing or when buy and sell disagree
+
+        :return: int8 array
+        """
+        flags = self.evaluate(columns, last)
+        buy, sell = flags['buy'], flags['sell']
+        tp = flags.get('tp', np.zeros_like(buy))
+
+        return np.select(
+            [buy & ~sell, sell & ~buy, tp & ~buy & ~sell],
+            [1, 2, 3],
+            0
+        ).astype(np.int8)
+
+    def predict(self, columns) -> int:
+        """
+        prediction of the last bar, computed from the last two bars only, 0 (nothing) when
+        there is no bar yet, e.g. after a failed backfill
+        """
+        signals = self.signals(columns, last=1)
+        return int(signals[-1]) if signals.shape[0] else 0
+
+    def __repr__(self):
+        return 'RuleSet({})'.format(', '.join('{}={!r}'.format(k, v) for k, v in self.rules.items()))
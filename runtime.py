@@ -0,0 +1,274 @@
+"""
+    one asyncio runtime hosting many (symbol, timeframe, Strategy, Trader) instances
+"""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import METRICS
+from scheduler import CandleScheduler
+
+
+class Instrument():
+    """
+    a strategy and its trader with their own queue and worker thread
+
+    Blocking work (REST fetches, orders) runs on the instrument's single thread, so it
+    stays in candle order for this instrument and never waits on another one.
+    """
+
+    def __init__(self, strategy, trader):
+        self.strategy = strategy
+        self.trader = trader
+        self.symbol = strategy.symbol
+        self.timeframe = strategy.timeframe
+
+        self.queue = None
+        self.executor = ThreadPoolExecutor(max_workers=1,
+                                           thread_name_prefix='{}-{}'.format(self.symbol, self.timeframe))
+        self.ticks = 0
+        self.errors = 0
+        self.last_duration = None
+
+    def handle(self, candles):
+        """
+        runs on the worker thread
+
+        :param candles: streamed candles to feed first, empty in REST mode
+        """
+        for candle in candles:
+            self.strategy.on_candle(candle)
+        self.trader.execute_trade(refresh=not candles)
+
+    def snapshot(self) -> dict:
+        """
+        runs on the worker thread, between two ticks
+        """
+        return {'strategy': self.strategy.snapshot()}
+
+    def restore(self, state) -> bool:
+        """
+        the position is not part of the state: stops, liquidations or manual trades may have
+        changed it while the bot was down, the trader fetches it before its first order
+        """
+        return self.strategy.restore(state['strategy'])
+
+
+class Runtime():
+    """
+    drives every instrument from one shared client and one market data source
+
+    In 'websocket' mode a single MarketDataFeed carries the subscriptions of all
+    instruments. In 'rest' mode one CandleScheduler fires the candle closes of every
+    timeframe. Either way events are only queued on the loop; each instrument drains
+    its own queue, and when it falls behind the queued candles are fed at once and a
+    single decision is taken on the newest one.
+
+    With a PositionBook (websocket mode, api_key/api_secret set) the feed also carries
+    the private position/order/execution tables into it, and it is reconciled over REST
+    every reconcile_interval seconds.
+
+    With summary_interval set, the rolling latency summary of metrics.METRICS is
+    printed every summary_interval seconds.
+
+    With a checkpoint.Checkpoint the instruments are restored from it on start, so only
+    the bins closed while the bot was down are fetched, and saved to it every
+    checkpoint_interval seconds and on stop.
+    """
+
+    def __init__(self, client, market_data='rest', url=None, close_offset=1.0,
+                 positions=None, api_key=None, api_secret=None, reconcile_interval=60,
+                 summary_interval=None, checkpoint=None, checkpoint_interval=60):
+        self.client = client
+        self.market_data = market_data
+        self.url = url
+        self.close_offset = close_offset
+        self.positions = positions
+        self.api_key = api_key
+        self.api_secret = api_secret
+        self.reconcile_interval = reconcile_interval
+        self.summary_interval = summary_interval
+        self.checkpoint = checkpoint
+        self.checkpoint_interval = checkpoint_interval
+        self.instruments = []
+        self.feed = None
+
+        self._tasks = []
+        self._scheduler = None
+        self._running = False
+
+    def add(self, strategy, trader) -> Instrument:
+        instrument = Instrument(strategy, trader)
+        self.instruments.append(instrument)
+        return instrument
+
+    async def run(self):
+        self._running = True
+        loop = asyncio.get_running_loop()
+
+        for instrument in self.instruments:
+            instrument.queue = asyncio.Queue()
+            self._tasks.append(asyncio.create_task(self._worker(instrument)))
+
+        if self.positions is not None:
+            self._tasks.append(asyncio.create_task(self._reconcile()))
+
+        if self.summary_interval:
+            self._tasks.append(asyncio.create_task(self._summarize()))
+
+        if self.checkpoint is not None:
+            await self.restore()
+            self._tasks.append(asyncio.create_task(self._save_periodically()))
+
+        if self.market_data == 'websocket':
+            await self._run_websocket(loop)
+        else:
+            await self._run_rest(loop)
+
+    async def serve(self):
+        """
+        runs until cancelled, e.g. by Ctrl+C under asyncio.run, and then shuts down through stop()
+        """
+        try:
+            await self.run()
+        finally:
+            await self.stop()
+
+    async def stop(self):
+        self._running = False
+        if self.feed is not None:
+            await self.feed.stop()
+        if self._scheduler is not None:
+            self._scheduler.stop()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self.checkpoint is not None:
+            await self.save()
+        for instrument in self.instruments:
+            instrument.executor.shutdown(wait=False)
+
+    async def _worker(self, instrument):
+        loop = asyncio.get_running_loop()
+        while True:
+            events = [await instrument.queue.get()]
+            while not instrument.queue.empty():
+                events.append(instrument.queue.get_nowait())
+
+            candles = [e for e in events if e is not None]
+            METRICS.inc('coalesced_events_total', len(events) - 1, symbol=instrument.symbol)
+            started = time.perf_counter()
+            try:
+                await loop.run_in_executor(instrument.executor, instrument.handle, candles)
+            except Exception as e:
+                instrument.errors += 1
+                METRICS.inc('errors_total', stage='tick', symbol=instrument.symbol)
+                print(f"{instrument.symbol} {instrument.timeframe}: {e!r}")
+            instrument.ticks += 1
+            instrument.last_duration = time.perf_counter() - started
+
+    async def _reconcile(self):
+        loop = asyncio.get_running_loop()
+        symbols = sorted({i.symbol for i in self.instruments})
+        while True:
+            try:
+                await loop.run_in_executor(None, self.positions.reconcile, self.client, symbols)
+            except Exception as e:
+                print(f"Position reconciliation failed: {e!r}")
+            await asyncio.sleep(self.reconcile_interval)
+
+    async def restore(self) -> int:
+        """
+        restores every instrument found in the checkpoint
+
+        :return: number of instruments restored
+        """
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        states = await loop.run_in_executor(None, self.checkpoint.load)
+        restored = 0
+        for instrument in self.instruments:
+            state = states.get((instrument.symbol, instrument.timeframe))
+            if state is not None and await loop.run_in_executor(instrument.executor, instrument.restore, state):
+                restored += 1
+        if states:
+            print(f"Restored {restored} of {len(self.instruments)} instruments from {self.checkpoint.path} "
+                  f"in {(time.perf_counter() - started) * 1000:.0f}ms")
+        return restored
+
+    async def save(self):
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        states = {}
+        for instrument in self.instruments:
+            states[(instrument.symbol, instrument.timeframe)] = await loop.run_in_executor(
+                instrument.executor, instrument.snapshot)
+        await loop.run_in_executor(None, self.checkpoint.save, states)
+        METRICS.observe('checkpoint_seconds', time.perf_counter() - started)
+
+    async def _save_periodically(self):
+        while True:
+            await asyncio.sleep(self.checkpoint_interval)
+            try:
+                await self.save()
+            except Exception as e:
+                METRICS.inc('errors_total', stage='checkpoint')
+                print(f"Checkpoint failed: {e!r}")
+
+    async def _summarize(self):
+        while True:
+            await asyncio.sleep(self.summary_interval)
+            print(METRICS.summary())
+
+    async def _run_websocket(self, loop):
+        from feed import MarketDataFeed, BITMEX_TESTNET_WS_URL
+
+        self.feed = MarketDataFeed(
+            symbols=sorted({i.symbol for i in self.instruments}),
+            timeframes=sorted({i.timeframe for i in self.instruments}),
+            url=self.url or BITMEX_TESTNET_WS_URL,
+            client=self.client,
+            api_key=self.api_key,
+            api_secret=self.api_secret
+        )
+        if self.positions is not None and self.api_key:
+            self.positions.attach(self.feed)
+
+        await self._warm_up(loop)
+
+        for instrument in self.instruments:
+            last = instrument.strategy.candles.last_timestamp
+            if last is not None:
+                key = (instrument.symbol, instrument.timeframe)
+                self.feed.last_timestamp[key] = max(last, self.feed.last_timestamp.get(key, last))
+            self.feed.on_candle(lambda symbol, timeframe, candle, queue=instrument.queue: queue.put_nowait(candle),
+                                symbol=instrument.symbol, timeframe=instrument.timeframe)
+
+        await self.feed.run()
+
+    async def _warm_up(self, loop):
+        # every buffer is filled, or backfilled after a restore, in parallel before the first candle,
+        # a failed one is filled again by its first tick
+        results = await asyncio.gather(*(
+            loop.run_in_executor(i.executor, i.strategy.candles.refresh, self.client, i.symbol)
+            for i in self.instruments), return_exceptions=True)
+        for instrument, result in zip(self.instruments, results):
+            if isinstance(result, Exception):
+                print(f"{instrument.symbol} {instrument.timeframe}: warm up failed {result!r}")
+
+    async def _run_rest(self, loop):
+        self._scheduler = scheduler = CandleScheduler(offset=self.close_offset)
+        await self._warm_up(loop)
+        try:
+            await loop.run_in_executor(None, scheduler.sync, self.client, self.instruments[0].symbol)
+        except Exception:
+            print("Could not sync with exchange time, using the local clock")
+
+        for instrument in self.instruments:
+            scheduler.every(instrument.timeframe,
+                            lambda timeframe, close_time, queue=instrument.queue: queue.put_nowait(None))
+
+        scheduler.fire_due()
+        while self._running:
+            await asyncio.sleep(max(0.0, scheduler.next_fire_time() - scheduler.now()))
+            scheduler.fire_due()
@@ -0,0 +1,132 @@
+"""
+    sleeps until candle boundaries and fires the registered callbacks, replaces busy waiting on time.time()
+"""
+import threading
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+
+from configuration import TICKER_INTERVAL_MINUTES
+
+
+def server_time_offset(client, symbol='XBTUSD') -> float:
+    """
+    estimates exchange clock minus local clock from the Date header of a cheap REST call
+
+    The header has a one second resolution, so the midpoint of that second and of the
+    request round trip is used.
+
+    :param client: bitmex API client
+    :return: offset in seconds to add to time.time()
+    """
+    sent = time.time()
+    response = client.Instrument.Instrument_get(symbol=symbol, count=1).response()
+    received = time.time()
+
+    server = parsedate_to_datetime(response.incoming_response.headers['Date']).timestamp() + 0.5
+    return server - (sent + received) / 2
+
+
+class CandleScheduler():
+    """
+    fires callback(timeframe, close_time) once per closed candle of each registered timeframe
+
+    The thread sleeps until the next bin boundary (exchange time) plus `offset`
+    seconds, so the exchange has published the bin before we ask for it.
+    Boundaries are tracked per timeframe: each one fires exactly once, and if a
+    callback overruns past later boundaries only the latest is fired and the others
+    are counted in `skipped`. Close-to-fire delays are kept in `delays`.
+    """
+
+    def __init__(self, offset=1.0, clock=time.time):
+        self.offset = offset
+        self.clock = clock
+        self.time_offset = 0.0
+
+        self.delays = {}
+        self.skipped = {}
+
+        self._callbacks = {}
+        self._last_fired = {}
+        self._stop = threading.Event()
+
+    def every(self, timeframe, callback):
+        """
+        :param timeframe: one of TICKER_INTERVAL_MINUTES
+        :param callback: callable(timeframe, close_time), close_time in exchange epoch seconds
+        """
+        self._callbacks.setdefault(timeframe, []).append(callback)
+        self.delays.setdefault(timeframe, deque(maxlen=1000))
+        self.skipped.setdefault(timeframe, 0)
+
+    def sync(self, client, symbol='XBTUSD'):
+        """
+        aligns the scheduler with the exchange clock
+        """
+        self.time_offset = server_time_offset(client, symbol)
+        return self.time_offset
+
+    def now(self) -> float:
+        return self.clock() + self.time_offset
+
+    @staticmethod
+    def interval(timeframe) -> int:
+        return TICKER_INTERVAL_MINUTES[timeframe] * 60
+
+    def next_fire_time(self) -> float:
+        """
+        :return: exchange time of the next callback round
+        """
+        now = self.now()
+        due = []
+        for timeframe in self._callbacks:
+            interval = self.interval(timeframe)
+            boundary = (now - self.offset) // interval * interval
+            if boundary <= self._last_fired.get(timeframe, boundary):
+                boundary += interval
+            due.append(boundary + self.offset)
+        return min(due)
+
+    def fire_due(self) -> int:
+        """
+        fires every timeframe whose latest boundary has not been fired yet
+
+        :return: number of timeframes fired
+        """
+        fired = 0
+        for timeframe, callbacks in self._callbacks.items():
+            interval = self.interval(timeframe)
+            boundary = (self.now() - self.offset) // interval * interval
+            last = self._last_fired.get(timeframe)
+
+            if last is None:
+                # nothing fires for the candle that was already closed at start up
+                self._last_fired[timeframe] = boundary
+                continue
+            if boundary <= last:
+                continue
+
+            self.skipped[timeframe] += int((boundary - last) // interval) - 1
+            self._last_fired[timeframe] = boundary
+
+            self.delays[timeframe].append(self.now() - boundary)
+            for callback in callbacks:
+                callback(timeframe, boundary)
+            fired += 1
+
+        return fired
+
+    def run(self):
+        """
+        blocks and fires callbacks until stop() is called
+        """
+        self._stop.clear()
+        self.fire_due()
+        while not self._stop.is_set():
+            wait = self.next_fire_time() - self.now()
+            if wait > 0 and self._stop.wait(wait):
+                break
+            self.fire_due()
+
+    def stop(self):
+        self._stop.set()
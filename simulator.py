@@ -0,0 +1,529 @@
+"""
+    in-process stand-in for the bitmex client, our orders are matched against replayed candles or trades
+"""
+import bisect
+import itertools
+import json
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from email.utils import format_datetime
+
+import numpy as np
+from pandas import to_datetime
+
+from backtest import TAKER_FEE
+from configuration import TICKER_INTERVAL_MINUTES
+
+# BitMEX maker rebate, negative fee
+MAKER_FEE = -0.00025
+
+
+def _to_ms(column) -> np.ndarray:
+    values = np.asarray(column)
+    if np.issubdtype(values.dtype, np.number):
+        return values.astype(np.int64)
+    return np.asarray(to_datetime(column, utc=True).values.astype('datetime64[ms]').astype(np.int64))
+
+
+class LatencyModel():
+    """
+    order round trip in seconds, mean plus uniform jitter
+
+    :param sleep: also sleep for it, to exercise the bot in wall clock time
+    """
+
+    def __init__(self, mean=0.0, jitter=0.0, seed=0, sleep=False):
+        self.mean = mean
+        self.jitter = jitter
+        self.sleep = sleep
+        self._rng = np.random.default_rng(seed)
+
+    def sample(self) -> float:
+        if self.jitter:
+            return max(0.0, self.mean + self._rng.uniform(-self.jitter, self.jitter))
+        return self.mean
+
+
+class SlippageModel():
+    """
+    market orders pay a fixed spread in basis points plus an impact proportional to
+    their share of the bar (or trade) volume
+    """
+
+    def __init__(self, bps=0.0, impact=0.0):
+        self.bps = bps
+        self.impact = impact
+
+    def price(self, side, price, qty, volume) -> float:
+        slip = self.bps / 10000
+        if self.impact and volume:
+            slip += self.impact * qty / volume
+        return price * (1 + slip) if side == 'Buy' else price * (1 - slip)
+
+
+class OrderBook():
+    """
+    resting limit orders in price-time priority
+
+    Orders only fill when the market trades through their price: the queue ahead of
+    them at their own price is unknown, so touching it is not enough.
+    """
+
+    def __init__(self):
+        self.orders = {}
+        self._levels = {'Buy': {}, 'Sell': {}}
+        self._prices = {'Buy': [], 'Sell': []}
+
+    def __len__(self):
+        return len(self.orders)
+
+    def best(self, side):
+        prices = self._prices[side]
+        if not prices:
+            return None
+        return prices[-1] if side == 'Buy' else prices[0]
+
+    def add(self, order):
+        side, price = order['side'], order['price']
+        level = self._levels[side].get(price)
+        if level is None:
+            level = self._levels[side][price] = deque()
+            bisect.insort(self._prices[side], price)
+        level.append(order)
+        self.orders[order['orderID']] = order
+
+    def remove(self, order_id):
+        order = self.orders.pop(order_id, None)
+        if order is None:
+            return None
+        side, price = order['side'], order['price']
+        level = self._levels[side][price]
+        level.remove(order)
+        if not level:
+            self._drop_level(side, price)
+        return order
+
+    def _drop_level(self, side, price):
+        del self._levels[side][price]
+        prices = self._prices[side]
+        del prices[bisect.bisect_left(prices, price)]
+
+    def match(self, price, size=None):
+        """
+        pops the fills of a market trade at price, best price first and oldest first
+        within a price
+
+        :param size: traded size available to our orders, unlimited if None
+        :return: list of (order, qty)
+        """
+        fills = []
+        for side in ('Buy', 'Sell'):
+            prices = self._prices[side]
+            while prices and (size is None or size > 0):
+                best = prices[-1] if side == 'Buy' else prices[0]
+                if (side == 'Buy' and best <= price) or (side == 'Sell' and best >= price):
+                    break
+                level = self._levels[side][best]
+                while level and (size is None or size > 0):
+                    order = level[0]
+                    qty = order['leavesQty'] if size is None else min(order['leavesQty'], size)
+                    fills.append((order, qty))
+                    if size is not None:
+                        size -= qty
+                    if qty == order['leavesQty']:
+                        level.popleft()
+                        del self.orders[order['orderID']]
+                if not level:
+                    self._drop_level(side, best)
+        return fills
+
+
+class _Response():
+    def __init__(self, result, headers):
+        self.result = result
+        self.incoming_response = self
+        self.headers = headers
+        self.status_code = 200
+
+
+class _Future():
+    """
+    same shape as the bravado future returned by the real client
+    """
+
+    def __init__(self, result, headers):
+        self._response = _Response(result, headers)
+
+    def result(self):
+        return self._response.result, self._response
+
+    def response(self):
+        return self._response
+
+
+class _Endpoint():
+    def __init__(self, **methods):
+        self.__dict__.update(methods)
+
+
+class SimulatedExchange():
+    """
+    replays recorded candles or trades of one symbol and serves the REST endpoints the
+    bot uses from them: Trade_getBucketed, Position_get, Order_new, Order_closePosition,
+    Order_getOrders, Order_cancel and Instrument_get
+
+    The clock is virtual: step()/run() reveal one event at a time, every endpoint only
+    sees the data up to the current event. Market orders fill at the price the market
+    has when they arrive - the next bar's open in candle mode, the last trade within
+    the sampled latency in trade mode - moved by the slippage model. Limit orders rest
+    in an OrderBook and fill as maker when later events trade through them, in candle
+    mode up to the bar volume, in trade mode up to each trade's size. Positions and
+    PnL are accounted in XBT like the XBTUSD inverse contract.
+
+    :param candles: dataframe with date (bin timestamp), open, high, low, close, volume
+    :param trades: dataframe with timestamp, price, size, used when candles is None
+    :param timeframe: bin size of the candles, or the one served from the trades
+    """
+
+    def __init__(self, candles=None, trades=None, symbol='XBTUSD', timeframe='1m', latency=None,
+                 slippage=None, taker_fee=TAKER_FEE, maker_fee=MAKER_FEE):
+        self.symbol = symbol
+        self.timeframe = timeframe
+        self.interval_ms = TICKER_INTERVAL_MINUTES[timeframe] * 60 * 1000
+        self.latency = latency or LatencyModel()
+        self.slippage = slippage or SlippageModel()
+        self.taker_fee = taker_fee
+        self.maker_fee = maker_fee
+
+        self.book = OrderBook()
+        self.orders = {}
+        self.executions = deque(maxlen=10000)
+        self.now = None
+        self.last_price = None
+        self.events = 0
+
+        self.pos = 0
+        self.cost = 0.0  # signed sum of contracts / entry price of the open position
+        self.realized = 0.0
+        self.fees = 0.0
+
+        self._ids = itertools.count(1)
+        self._lock = threading.RLock()
+
+        if candles is not None:
+            self._ts = _to_ms(candles['date'])
+            self._bins = np.ascontiguousarray(candles[['open', 'high', 'low', 'close', 'volume']].values,
+                                              dtype=np.float64)
+            self._trades = None
+        else:
+            self._trades = (_to_ms(trades['timestamp']),
+                            np.ascontiguousarray(trades['price'], dtype=np.float64),
+                            np.ascontiguousarray(trades['size'], dtype=np.float64))
+            self._ts, self._bins, self._bin_end = self._aggregate(*self._trades)
+        self._next = 0    # next event to replay
+        self._closed = 0  # number of bins served by Trade_getBucketed
+
+        self.Trade = _Endpoint(Trade_getBucketed=self.Trade_getBucketed)
+        self.Position = _Endpoint(Position_get=self.Position_get)
+        self.Order = _Endpoint(Order_new=self.Order_new, Order_closePosition=self.Order_closePosition,
+                               Order_getOrders=self.Order_getOrders, Order_cancel=self.Order_cancel)
+        self.Instrument = _Endpoint(Instrument_get=self.Instrument_get)
+
+    def _aggregate(self, ts, price, size):
+        """
+        bins of the whole trade tape at once, a bin is stamped with its close time and
+        holds the trades in [timestamp - interval, timestamp)
+        """
+        bin_ts = (ts // self.interval_ms + 1) * self.interval_ms
+        starts = np.flatnonzero(np.r_[True, bin_ts[1:] != bin_ts[:-1]])
+        ends = np.r_[starts[1:], ts.shape[0]]
+        bins = np.column_stack((price[starts],
+                                np.maximum.reduceat(price, starts),
+                                np.minimum.reduceat(price, starts),
+                                price[ends - 1],
+                                np.add.reduceat(size, starts)))
+        return bin_ts[starts], bins, ends
+
+    def __len__(self):
+        return self._trades[0].shape[0] if self._trades is not None else self._ts.shape[0]
+
+    @property
+    def done(self):
+        return self._next >= len(self)
+
+    def step(self) -> bool:
+        """
+        replays the next event
+
+        :return: True when the event closed a bin
+        """
+        with self._lock:
+            if self._trades is not None:
+                return self._step_trade()
+            return self._step_candle()
+
+    def run(self, on_bar=None, until=None) -> int:
+        """
+        replays events until the end of the data
+
+        The lock is only held while an event is replayed, on_bar runs without it, so
+        requests from other threads (a netted Trader's order thread) are served between
+        bins and on_bar may wait for them.
+
+        :param on_bar: callable(exchange) called after every closed bin, e.g. to run a Trader
+        :param until: stop after the bin with this timestamp (ms)
+        :return: number of events replayed
+        """
+        started = self.events
+        while not self.done:
+            if self.step():
+                if on_bar is not None:
+                    on_bar(self)
+                if until is not None and self.now >= until:
+                    break
+        return self.events - started
+
+    def _step_candle(self):
+        i = self._next
+        o, h, l, c, v = self._bins[i]
+        if self.book.orders:
+            # a resting order is crossed by the bar range, in priority order, the bids at the
+            # low and the asks at the high share the volume of the bar
+            remaining = int(v)
+            for price in (l, h):
+                for order, qty in self.book.match(price, remaining):
+                    self._fill(order, qty, order['price'], maker=True)
+                    remaining -= qty
+        self.last_price = c
+        self.now = int(self._ts[i])
+        self._closed = i + 1
+        self._next = i + 1
+        self.events += 1
+        return True
+
+    def _step_trade(self):
+        i = self._next
+        ts, price, size = self._trades
+        closed = False
+        if self._closed < self._ts.shape[0] and i >= self._bin_end[self._closed]:
+            # first trade of a new bin, the previous bin is closed at its boundary
+            self.now = int(self._ts[self._closed])
+            self._closed += 1
+            closed = True
+            # the caller acts on the bin close before this trade is replayed
+            return closed
+
+        p = price[i]
+        if self.book.orders:
+            for order, qty in self.book.match(p, int(size[i])):
+                self._fill(order, qty, order['price'], maker=True)
+        self.last_price = p
+        self.now = int(ts[i])
+        self._next = i + 1
+        self.events += 1
+        if self._next == ts.shape[0] and self._closed < self._ts.shape[0]:
+            self.now = int(self._ts[self._closed])
+            self._closed += 1
+            closed = True
+        return closed
+
+    def _arrival_price(self, latency):
+        """
+        market price when an order sent now reaches the exchange
+        """
+        if self._trades is None:
+            return self._bins[self._next, 0] if self._next < self._ts.shape[0] else self.last_price
+        ts, price, _ = self._trades
+        if self.now is None:
+            return price[0]
+        if self._next >= ts.shape[0] or ts[self._next] > self.now + latency * 1000:
+            return self.last_price
+        j = np.searchsorted(ts, self.now + latency * 1000, side='right') - 1
+        return price[max(j, self._next)]
+
+    def _volume(self):
+        if self._trades is None:
+            return self._bins[min(self._next, self._ts.shape[0] - 1), 4]
+        return self._trades[2][min(self._next, self._trades[2].shape[0] - 1)]
+
+    def _fill(self, order, qty, price, maker=False):
+        delta = qty if order['side'] == 'Buy' else -qty
+        pos = self.pos
+        if pos != 0 and (pos > 0) != (delta > 0):
+            closed = min(abs(delta), abs(pos))
+            fraction = closed / abs(pos)
+            self.realized += fraction * (self.cost - pos / price)
+            self.cost -= fraction * self.cost
+            pos += closed if delta > 0 else -closed
+            delta += -closed if delta > 0 else closed
+        if delta:
+            pos += delta
+            self.cost += delta / price
+        self.pos = pos
+
+        fee = qty / price * (self.maker_fee if maker else self.taker_fee)
+        self.fees += fee
+
+        filled = order['cumQty'] + qty
+        order['avgPx'] = (order['avgPx'] * order['cumQty'] + price * qty) / filled
+        order['cumQty'] = filled
+        order['leavesQty'] -= qty
+        order['ordStatus'] = 'Filled' if order['leavesQty'] == 0 else 'PartiallyFilled'
+        order['timestamp'] = self._datetime()
+        self.executions.append({'orderID': order['orderID'], 'symbol': self.symbol, 'side': order['side'],
+                                'lastQty': qty, 'lastPx': price, 'execComm': fee,
+                                'lastLiquidityInd': 'AddedLiquidity' if maker else 'RemovedLiquidity',
+                                'timestamp': order['timestamp']})
+
+    def equity(self) -> float:
+        """
+        realised plus unrealised profit at the last price net of fees, in XBT
+        """
+        unrealised = self.cost - self.pos / self.last_price if self.pos else 0.0
+        return self.realized + unrealised - self.fees
+
+    def _datetime(self):
+        return datetime.fromtimestamp((self.now or 0) / 1000, timezone.utc)
+
+    def _future(self, result, latency=0.0):
+        if latency and self.latency.sleep:
+            time.sleep(latency)
+        return _Future(result, {'Date': format_datetime(self._datetime(), usegmt=True),
+                                'x-ratelimit-limit': '60', 'x-ratelimit-remaining': '60'})
+
+    def _check_symbol(self, symbol):
+        if symbol is not None and symbol != self.symbol:
+            raise ValueError("The simulator only trades {}, got {}".format(self.symbol, symbol))
+
+    def Trade_getBucketed(self, binSize='1m', symbol=None, count=100, reverse=False, startTime=None,
+                          endTime=None, partial=False, start=0, **kwargs):
+        """
+        closed bins up to the current event, `partial` is ignored
+        """
+        if binSize != self.timeframe:
+            raise ValueError("The simulator serves {} bins, got {}".format(self.timeframe, binSize))
+        self._check_symbol(symbol)
+
+        with self._lock:
+            ts = self._ts[:self._closed]
+            lo = 0 if startTime is None else np.searchsorted(ts, _to_ms([startTime])[0], side='left')
+            hi = ts.shape[0] if endTime is None else np.searchsorted(ts, _to_ms([endTime])[0], side='right')
+            if reverse:
+                rows = range(hi - 1 - start, max(lo, hi - start - count) - 1, -1)
+            else:
+                rows = range(lo + start, min(hi, lo + start + count))
+
+            result = []
+            for i in rows:
+                o, h, l, c, v = self._bins[i].tolist()
+                result.append({'timestamp': datetime.fromtimestamp(ts[i] / 1000, timezone.utc),
+                               'symbol': self.symbol, 'open': o, 'high': h, 'low': l, 'close': c, 'volume': v})
+            return self._future(result)
+
+    def Position_get(self, filter=None, columns=None, count=None, **kwargs):
+        if filter is not None and json.loads(filter).get('symbol', self.symbol) != self.symbol:
+            return self._future([])
+
+        with self._lock:
+            unrealised = self.cost - self.pos / self.last_price if self.pos and self.last_price else 0.0
+            position = {'symbol': self.symbol, 'currentQty': self.pos,
+                        'avgEntryPrice': self.pos / self.cost if self.pos else None,
+                        'markPrice': self.last_price, 'isOpen': self.pos != 0,
+                        'realisedPnl': int(round(self.realized * 1e8)),
+                        'unrealisedPnl': int(round(unrealised * 1e8)),
+                        'execComm': int(round(self.fees * 1e8))}
+            return self._future([position])
+
+    def Order_new(self, symbol=None, side=None, orderQty=None, price=None, ordType=None, execInst='',
+                  clOrdID=None, **kwargs):
+        self._check_symbol(symbol)
+        if side is None:
+            side = 'Buy' if orderQty > 0 else 'Sell'
+        qty = abs(int(orderQty))
+        ordType = ordType or ('Limit' if price is not None else 'Market')
+        latency = self.latency.sample()
+
+        with self._lock:
+            order = {'orderID': str(next(self._ids)), 'clOrdID': clOrdID, 'symbol': self.symbol, 'side': side,
+                     'orderQty': qty, 'price': price, 'ordType': ordType, 'execInst': execInst or '',
+                     'ordStatus': 'New', 'cumQty': 0, 'leavesQty': qty, 'avgPx': 0.0,
+                     'timestamp': self._datetime()}
+            self.orders[order['orderID']] = order
+
+            market = self._arrival_price(latency)
+            crossing = price is None or (price >= market if side == 'Buy' else price <= market)
+
+            if 'Close' in order['execInst'] or 'ReduceOnly' in order['execInst']:
+                qty = min(qty, abs(self.pos) if (self.pos > 0) != (side == 'Buy') else 0)
+                order['orderQty'] = order['leavesQty'] = qty
+
+            if qty == 0 or (crossing and 'ParticipateDoNotInitiate' in order['execInst']):
+                order['ordStatus'] = 'Canceled'
+            elif ordType == 'Market':
+                self._fill(order, qty, self.slippage.price(side, market, qty, self._volume()))
+            elif crossing:
+                self._fill(order, qty, market)
+            else:
+                self.book.add(order)
+
+            return self._future(dict(order), latency)
+
+    def Order_closePosition(self, symbol=None, price=None, **kwargs):
+        with self._lock:
+            if self.pos == 0:
+                raise ValueError("No position to close")
+            side = 'Sell' if self.pos > 0 else 'Buy'
+            return self.Order_new(symbol=symbol, side=side, orderQty=abs(self.pos), price=price,
+                                  execInst='Close')
+
+    def Order_getOrders(self, symbol=None, filter=None, count=100, reverse=False, **kwargs):
+        with self._lock:
+            orders = list(self.orders.values())
+            if filter is not None and json.loads(filter).get('open'):
+                orders = [o for o in orders if o['orderID'] in self.book.orders]
+            if reverse:
+                orders = orders[::-1]
+            return self._future([dict(o) for o in orders[:count]])
+
+    def Order_cancel(self, orderID=None, **kwargs):
+        with self._lock:
+            canceled = []
+            for order_id in ([orderID] if isinstance(orderID, str) else orderID or []):
+                order = self.book.remove(order_id)
+                if order is not None:
+                    order['ordStatus'] = 'Canceled'
+                    canceled.append(dict(order))
+            return self._future(canceled, self.latency.sample())
+
+    def Instrument_get(self, symbol=None, count=1, **kwargs):
+        self._check_symbol(symbol)
+        return self._future([{'symbol': self.symbol, 'lastPrice': self.last_price, 'timestamp': self._datetime()}])
+
+
+if __name__ == '__main__':
+    from util import synthetic_ohlcv
+
+    bars = 1000000
+    df = synthetic_ohlcv(bars)
+    exchange = SimulatedExchange(candles=df)
+    started = time.perf_counter()
+    exchange.run()
+    elapsed = time.perf_counter() - started
+    print(f"candles: {bars} events in {elapsed:.2f}s, {bars / elapsed * 60 / 1e6:.1f}M events/min")
+
+    rng = np.random.default_rng(0)
+    n = 1000000
+    trades = {'timestamp': np.cumsum(rng.integers(1, 200, n)) + 1514764800000,
+              'price': 10000 + np.cumsum(rng.normal(0, 0.5, n)).round(1),
+              'size': rng.integers(1, 5000, n)}
+    exchange = SimulatedExchange(trades=trades)
+    for offset in range(1, 11):
+        exchange.Order_new(side='Buy', orderQty=100, price=9990.0 - offset)
+        exchange.Order_new(side='Sell', orderQty=100, price=10010.0 + offset)
+    started = time.perf_counter()
+    exchange.run()
+    elapsed = time.perf_counter() - started
+    print(f"trades: {n} events in {elapsed:.2f}s, {n / elapsed * 60 / 1e6:.1f}M events/min, "
+          f"{len(exchange.executions)} fills, position {exchange.pos}")
@@ -0,0 +1,201 @@
+"""
+    append-only on-disk candle history, one memory-mapped file per column and per symbol/timeframe
+"""
+import os
+from datetime import datetime, timezone
+
+import numpy as np
+from pandas import DataFrame, to_datetime
+
+from candles import BUCKETED_PAGE_SIZE, timestamp_ms
+from configuration import TICKER_INTERVAL_MINUTES
+
+# column name and dtype of every file of a series, date is the bin timestamp in epoch milliseconds
+COLUMNS = (('date', np.int64), ('open', np.float64), ('high', np.float64), ('low', np.float64),
+           ('close', np.float64), ('volume', np.float64))
+
+
+class CandleStore():
+    """
+    candle history under root/<symbol>/<timeframe>/<column>.bin as raw little endian arrays
+
+    Bins are only ever appended in timestamp order, so the date file is a sorted index
+    and a time range is found with two binary searches. Reads are memory-mapped
+    read-only: opening a series costs the same for a day or years of 1m bins, and only
+    the pages of the rows actually read are loaded. The row count is the length of the
+    shortest column, which makes a torn append invisible until the next append repairs it.
+    """
+
+    def __init__(self, root='data'):
+        self.root = root
+        self._maps = {}
+
+    def path(self, symbol, timeframe, column=None) -> str:
+        folder = os.path.join(self.root, symbol, timeframe)
+        return folder if column is None else os.path.join(folder, column + '.bin')
+
+    def series(self):
+        """
+        :return: iterator of the stored (symbol, timeframe) pairs
+        """
+        if not os.path.isdir(self.root):
+            return
+        for symbol in sorted(os.listdir(self.root)):
+            for timeframe in sorted(os.listdir(os.path.join(self.root, symbol))):
+                yield symbol, timeframe
+
+    def rows(self, symbol, timeframe) -> int:
+        sizes = []
+        for name, dtype in COLUMNS:
+            try:
+                sizes.append(os.path.getsize(self.path(symbol, timeframe, name)) // np.dtype(dtype).itemsize)
+            except OSError:
+                return 0
+        return min(sizes)
+
+    def last_timestamp(self, symbol, timeframe):
+        """
+        :return: epoch milliseconds of the newest stored bin or None when empty
+        """
+        dates = self.columns(symbol, timeframe)['date']
+        return int(dates[-1]) if dates.shape[0] else None
+
+    def append(self, symbol, timeframe, date, open, high, low, close, volume) -> int:
+        """
+        appends bins in timestamp order, bins not newer than the last stored one are skipped
+
+        :param date: epoch milliseconds, datetimes or ISO strings
+        :return: number of bins stored
+        """
+        date = np.array([timestamp_ms(d) for d in date], dtype=np.int64) \
+            if not np.issubdtype(np.asarray(date).dtype, np.integer) else np.asarray(date, dtype=np.int64)
+        values = {'date': date, 'open': open, 'high': high, 'low': low, 'close': close, 'volume': volume}
+
+        if date.shape[0] > 1 and not (date[1:] > date[:-1]).all():
+            raise ValueError("Bins must be appended in strictly increasing timestamp order")
+
+        last = self.last_timestamp(symbol, timeframe)
+        skip = 0 if last is None else int(np.searchsorted(date, last, side='right'))
+        if skip == date.shape[0]:
+            return 0
+
+        self._write(symbol, timeframe, values, skip)
+        return date.shape[0] - skip
+
+    def _write(self, symbol, timeframe, values, skip):
+        os.makedirs(self.path(symbol, timeframe), exist_ok=True)
+        n = self.rows(symbol, timeframe)
+        self._maps.pop((symbol, timeframe), None)
+
+        # the date file is written last, a row only counts once every column has it
+        for name, dtype in COLUMNS[1:] + COLUMNS[:1]:
+            with open(self.path(symbol, timeframe, name), 'ab') as f:
+                f.truncate(n * np.dtype(dtype).itemsize)
+                f.write(np.ascontiguousarray(values[name][skip:], dtype=dtype).tobytes())
+
+    def extend(self, symbol, timeframe, ticker: list) -> int:
+        """
+        appends bins in the format of the /trade/bucketed API
+
+        :param ticker: list of bucket dicts, any order
+        :return: number of bins stored
+        """
+        rows = sorted((r for r in ticker if r['open'] is not None), key=lambda r: timestamp_ms(r['timestamp']))
+        if not rows:
+            return 0
+        return self.append(symbol, timeframe, [timestamp_ms(r['timestamp']) for r in rows],
+                           *([r[name] for r in rows] for name, _ in COLUMNS[1:]))
+
+    def append_frame(self, symbol, timeframe, dataframe) -> int:
+        """
+        :param dataframe: dataframe in the util.parse_dataframe layout
+        """
+        date = to_datetime(dataframe['date'], utc=True).values.astype('datetime64[ms]').astype(np.int64)
+        return self.append(symbol, timeframe, date, *(dataframe[name].values for name, _ in COLUMNS[1:]))
+
+    def columns(self, symbol, timeframe) -> dict:
+        """
+        :return: dict of read-only memory-mapped arrays, one per column
+        """
+        key = (symbol, timeframe)
+        n = self.rows(symbol, timeframe)
+        cached = self._maps.get(key)
+        if cached is not None and cached[0] == n:
+            return cached[1]
+
+        columns = {}
+        for name, dtype in COLUMNS:
+            if n == 0:
+                columns[name] = np.empty(0, dtype=dtype)
+            else:
+                columns[name] = np.memmap(self.path(symbol, timeframe, name), dtype=dtype, mode='r', shape=(n,))
+        self._maps[key] = (n, columns)
+        return columns
+
+    def range(self, symbol, timeframe, start=None, end=None) -> tuple:
+        """
+        :param start: first bin timestamp included, anything timestamp_ms accepts
+        :param end: last bin timestamp included
+        :return: (first row, row after the last) of the range
+        """
+        dates = self.columns(symbol, timeframe)['date']
+        lo = 0 if start is None else int(np.searchsorted(dates, timestamp_ms(start), side='left'))
+        hi = dates.shape[0] if end is None else int(np.searchsorted(dates, timestamp_ms(end), side='right'))
+        return lo, max(lo, hi)
+
+    def load(self, symbol, timeframe, start=None, end=None) -> DataFrame:
+        """
+        bins between start and end in the util.parse_dataframe layout, the price columns
+        are views on the mapped files and are not copied
+
+        :return: DataFrame
+        """
+        lo, hi = self.range(symbol, timeframe, start, end)
+        columns = self.columns(symbol, timeframe)
+        data = {'date': to_datetime(np.asarray(columns['date'][lo:hi]), unit='ms', utc=True)}
+        for name, _ in COLUMNS[1:]:
+            data[name] = columns[name][lo:hi]
+        return DataFrame(data, copy=False)
+
+    def sync(self, client, symbol='XBTUSD', timeframe='1m', since=None) -> int:
+        """
+        downloads the bins that closed after the newest stored one
+
+        :param client: bitmex API client
+        :param since: where an empty series starts, anything timestamp_ms accepts
+        :return: number of new bins
+        """
+        interval_ms = TICKER_INTERVAL_MINUTES[timeframe] * 60 * 1000
+        last = self.last_timestamp(symbol, timeframe)
+        start = last + interval_ms if last is not None else timestamp_ms(since or 0)
+
+        stored = 0
+        while True:
+            res = client.Trade.Trade_getBucketed(
+                binSize=timeframe,
+                symbol=symbol,
+                startTime=datetime.fromtimestamp(start / 1000, timezone.utc),
+                count=BUCKETED_PAGE_SIZE,
+                partial=False
+            ).result()[0]
+
+            stored += self.extend(symbol, timeframe, res)
+
+            if len(res) < BUCKETED_PAGE_SIZE:
+                return stored
+            start = max(timestamp_ms(row['timestamp']) for row in res) + interval_ms
+
+
+if __name__ == '__main__':
+    import sys
+
+    import bitmex
+    from configuration import TEST_EXCHANGE, API_KEY, API_SECRET
+
+    # python store.py XBTUSD 1m 2018-01-01
+    symbol, timeframe = sys.argv[1], sys.argv[2]
+    since = sys.argv[3] if len(sys.argv) > 3 else None
+    store = CandleStore()
+    stored = store.sync(bitmex.bitmex(test=TEST_EXCHANGE, api_key=API_KEY, api_secret=API_SECRET),
+                        symbol, timeframe, since)
+    print(f"{stored} new {timeframe} bins, {store.rows(symbol, timeframe)} stored for {symbol}")
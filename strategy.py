@@ -1,75 +1,215 @@
+import time
+
 import talib as ta
+import numpy as np
 from util import *
 from indicators import *
+from candles import CandleBuffer
+from frames import ffill
+from metrics import METRICS
+import rules
+from configuration import CANDLE_BUFFER_SIZE
+
+
+def _mfi(df, period):
+    high, close, volume = (np.asarray(df[c], dtype=np.float64) for c in ('high', 'close', 'volume'))
+    return ffill(ta.MFI(high, close, close, volume, timeperiod=period))
 
 
 class Strategy():
-    def __init__(self, client, timeframe='5m'):
+    def __init__(self, client, timeframe='5m', history=CANDLE_BUFFER_SIZE,
+                 mfi_period=14, mfi_oversold=30, mfi_overbought=70, symbol='XBTUSD', streaming=None,
+                 cache=None):
+        """
+        :param streaming: dict of name to streaming.StreamingIndicator, each is fed every
+            closed bin once, their last values are in self.streamed
+        :param cache: cache.IndicatorCache shared by the strategies evaluated on the same
+            candles, e.g. the parameter sets of a sweep
+        """
         self.client = client
-        # self.pair = pair
+        self.symbol = symbol
         self.timeframe = timeframe
+        self.mfi_period = mfi_period
+        self.mfi_oversold = mfi_oversold
+        self.mfi_overbought = mfi_overbought
+        self.candles = CandleBuffer(capacity=history, timeframe=timeframe)
+        self.rules = self.build_rules()
+        self.streaming = streaming or {}
+        self.streamed = {}
+        self.streamed_until = None
+        self.cache = cache
 
     def get_ticker_indicator(self):
         return int(self.timeframe[:-1])
 
-    def predict(self):
+    def on_candle(self, candle):
+        """
+        feeds a closed candle pushed by the websocket feed into the candle buffer
+
+        :param candle: dict in the /trade/bucketed format
+        """
+        self.candles.extend([candle])
+
+    def predict(self, refresh=True):
 
         # df = pd.DataFrame(self.client.Trade.Trade_getBucketed(
         #     binSize=self.timeframe,
-        #     symbol='XBTUSD',
+        #     symbol=self.symbol,
         #     count=100,
         #     reverse=True
         # ).result()[0])
 
         # df.set_index(['timestamp'], inplace=True)
 
-        res = self.client.Trade.Trade_getBucketed(
-            binSize=self.timeframe,
-            symbol='XBTUSD',
-            count=100,
-            reverse=True
-        ).result()[0]
+        started = time.perf_counter()
+
+        # only the bins closed since the last call are fetched,
+        # in streaming mode the buffer is already fed through on_candle
+        if refresh:
+            self.candles.refresh(self.client, symbol=self.symbol)
+        self.feed_streaming()
+        fetched = time.perf_counter()
+
+        # zero-copy column views, no pandas index or block manager on the tick path
+        df = self.candles.frame()
+        framed = time.perf_counter()
+
+        # indicators need the whole window, the rules only the last two bars
+        df = self.populate_indicators(df)
+        computed = time.perf_counter()
 
-        df = parse_dataframe(res)
+        prediction = self.rules.predict(df)
+        done = time.perf_counter()
 
-        ha = heikinashi(df)
+        for stage, seconds in (('fetch', fetched - started), ('dataframe', framed - fetched),
+                               ('indicators', computed - framed), ('rules', done - computed)):
+            METRICS.observe('stage_seconds', seconds, stage=stage, symbol=self.symbol, timeframe=self.timeframe)
+
+        return prediction
+
+    def feed_streaming(self) -> int:
+        """
+        updates the streaming indicators with the bins stored since the last call
+
+        :return: number of bins fed
+        """
+        if not self.streaming:
+            return 0
+        dates = self.candles.dates()
+        first = 0 if self.streamed_until is None else int(np.searchsorted(dates, self.streamed_until, side='right'))
+        columns = [self.candles.column(name) for name in CandleBuffer.COLUMNS]
+        for i in range(first, dates.shape[0]):
+            bar = dict(zip(CandleBuffer.COLUMNS, (float(c[i]) for c in columns)))
+            for name, indicator in self.streaming.items():
+                self.streamed[name] = indicator.update(bar)
+        if dates.shape[0]:
+            self.streamed_until = int(dates[-1])
+        return dates.shape[0] - first
+
+    def snapshot(self) -> dict:
+        """
+        :return: candle buffer and streaming indicator state, see restore
+        """
+        return {
+            'candles': self.candles.snapshot(),
+            'streaming': {name: indicator.snapshot() for name, indicator in self.streaming.items()},
+            'streamed': dict(self.streamed),
+            'streamed_until': self.streamed_until,
+        }
+
+    def restore(self, snapshot, now=None) -> bool:
+        """
+        puts back the state of snapshot, the next refresh then only fetches the bins closed since
+
+        A snapshot whose newest bin is more than a whole buffer old, or taken with other
+        streaming indicators, is ignored and the buffer is filled from the exchange as usual.
+
+        :param now: epoch milliseconds, the local clock if None
+        :return: True if restored
+        """
+        candles = snapshot['candles']
+        if candles['timeframe'] != self.timeframe or set(snapshot['streaming']) != set(self.streaming):
+            return False
+        if candles['dates'].shape[0] == 0:
+            return False
+        now = time.time() * 1000 if now is None else now
+        if now - candles['dates'][-1] > self.candles.capacity * self.candles.interval_ms:
+            return False
+
+        self.candles.restore(candles)
+        for name, state in snapshot['streaming'].items():
+            self.streaming[name].restore(state)
+        self.streamed = dict(snapshot['streamed'])
+        self.streamed_until = snapshot['streamed_until']
+        return True
+
+    def populate_signals(self, df):
+        """
+        adds the indicator columns and the buy/sell/tp flags for every row of df
+
+        :param df: dataframe or frames.ArrayFrame containing open/high/low/close/volume
+        :return: df
+        """
+        return self.populate_rules(self.populate_indicators(df))
+
+    def populate_indicators(self, df, source=None):
+        """
+        adds ha_open/ha_close/mfi, these only depend on mfi_period
+
+        :param df: dataframe or frames.ArrayFrame containing open/high/low/close/volume
+        :param source: id of the candles of df for the cache, see IndicatorCache.call,
+            they are hashed when None
+        :return: df
+        """
+        if self.cache is None:
+            ha = heikinashi(df)
+            mfi = _mfi(df, self.mfi_period)
+        else:
+            ha = self.cache.call(heikinashi, df, columns=('open', 'high', 'low', 'close'), source=source)
+            mfi = self.cache.call(_mfi, df, self.mfi_period, columns=('high', 'close', 'volume'), source=source)
 
         df['ha_open'] = ha['open']
         df['ha_close'] = ha['close']
-        df['mfi'] = ta.MFI(df['high'], df['close'], df['close'], df['volume'], timeperiod=14)
-
-        df.fillna(method='ffill', inplace=True)
-
-        df.loc[
-            (
-                df['ha_open'].lt(df['ha_close']) &   # green bar
-                crossed_above(df['mfi'], 30)
-            ),
-            'buy'] = 1
-
-        df.loc[
-            (
-                df['ha_open'].lt(df['ha_close']) &  # red bar
-                crossed_below(df['mfi'], 70)
-            ),
-            'sell'] = 1
-
-        df.loc[
-            (
-                crossed_above(df['mfi'], 70) |
-                crossed_below(df['mfi'], 30)
-            ),
-            'tp'] = 1
-
-        latest = df.iloc[-1]
-
-        (buy, sell, tp) = latest['buy'] == 1, latest['sell'] == 1, latest['tp'] == 1
-
-        if buy and not sell:
-            return 1
-        elif sell and not buy:
-            return 2
-        elif tp and not buy and not sell:
-            return 3
-        else:
-            return 0
+        df['mfi'] = mfi
+
+        return df
+
+    def build_rules(self) -> rules.RuleSet:
+        """
+        buy/sell/tp conditions over the columns of populate_indicators
+        """
+        ha_open, ha_close, mfi = rules.Column('ha_open'), rules.Column('ha_close'), rules.Column('mfi')
+
+        return rules.RuleSet(
+            buy=(ha_open < ha_close) &  # green bar
+                rules.crossed_above(mfi, self.mfi_oversold),
+            sell=(ha_open < ha_close) &  # red bar
+                 rules.crossed_below(mfi, self.mfi_overbought),
+            tp=rules.crossed_above(mfi, self.mfi_overbought) |
+               rules.crossed_below(mfi, self.mfi_oversold),
+        )
+
+    def populate_rules(self, df):
+        """
+        sets the buy/sell/tp flags from the indicator columns, existing flags are replaced
+
+        :param df: dataframe with the columns of populate_indicators
+        :return: df
+        """
+        for name, flags in self.rules.evaluate(df).items():
+            df[name] = np.where(flags, 1.0, np.nan)
+
+        return df
+
+    def signals(self, df, indicators=True) -> np.ndarray:
+        """
+        computes what predict would have returned on every bar of df in one pass
+
+        :param df: dataframe or frames.ArrayFrame containing open/high/low/close/volume
+        :param indicators: False if df already holds the columns of populate_indicators
+        :return: int8 array of predictions (0 nothing, 1 buy, 2 sell, 3 take profit)
+        """
+        if indicators:
+            df = self.populate_indicators(df.copy())
+
+        return self.rules.signals(df)
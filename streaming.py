@@ -0,0 +1,489 @@
+"""
+    streaming versions of the core indicators, every closed bar is folded in with update(bar)
+
+    Each indicator is a small stateful object: update(bar) returns the value for that bar
+    (NaN while warming up), snapshot() returns its state and restore(snapshot) puts it back.
+    check_parity compares them with the batch functions, run this module to print it.
+"""
+import copy
+import math
+from abc import ABC, abstractmethod
+from collections import deque
+
+import numpy as np
+
+NAN = float('nan')
+
+
+class StreamingIndicator(ABC):
+    """
+    base class, subclasses list their state in __slots__ and implement update
+    """
+
+    __slots__ = ()
+
+    @abstractmethod
+    def update(self, bar):
+        """
+        :param bar: dict with open/high/low/close/volume of the next closed bar
+        :return: value for that bar, NaN while warming up
+        """
+
+    def snapshot(self) -> dict:
+        return {name: copy.deepcopy(getattr(self, name)) for name in self._state_slots()}
+
+    def restore(self, snapshot):
+        for name, value in snapshot.items():
+            setattr(self, name, copy.deepcopy(value))
+        return self
+
+    def run(self, dataframe) -> np.ndarray:
+        """
+        feeds every row of dataframe, mostly useful to warm up and to compare with the batch version
+        """
+        return np.array([self.update(bar) for bar in dataframe.to_dict('records')], dtype=np.float64)
+
+    def _state_slots(self):
+        for cls in type(self).__mro__:
+            for name in getattr(cls, '__slots__', ()):
+                yield name
+
+
+class EMA(StreamingIndicator):
+    """
+    talib.EMA, seeded with the sma of the first period values
+    """
+
+    __slots__ = ('period', 'field', 'value', 'seen', 'total')
+
+    def __init__(self, period, field='close'):
+        self.period = period
+        self.field = field
+        self.value = NAN
+        self.seen = 0
+        self.total = 0.0
+
+    def update(self, bar):
+        return self.push(bar[self.field])
+
+    def push(self, x):
+        if self.seen < self.period:
+            if math.isnan(x) and self.seen == 0:
+                return NAN
+            self.total += x
+            self.seen += 1
+            if self.seen < self.period:
+                return NAN
+            self.value = self.total / self.period
+        else:
+            self.value = (x - self.value) * (2.0 / (self.period + 1)) + self.value
+        return self.value
+
+
+class SMA(StreamingIndicator):
+    """
+    talib.SMA, keeps a running sum of the window
+    """
+
+    __slots__ = ('period', 'field', 'window', 'total')
+
+    def __init__(self, period, field='close'):
+        self.period = period
+        self.field = field
+        self.window = deque(maxlen=period)
+        self.total = 0.0
+
+    def update(self, bar):
+        return self.push(bar[self.field])
+
+    def push(self, x):
+        if len(self.window) == self.period:
+            self.total -= self.window[0]
+        self.window.append(x)
+        self.total += x
+        if len(self.window) < self.period:
+            return NAN
+        return self.total / self.period
+
+
+class TEMA(StreamingIndicator):
+    """
+    talib.TEMA, 3 * ema1 - 3 * ema2 + ema3 with each ema fed by the previous one
+    """
+
+    __slots__ = ('field', 'ema1', 'ema2', 'ema3')
+
+    def __init__(self, period, field='close'):
+        self.field = field
+        self.ema1 = EMA(period)
+        self.ema2 = EMA(period)
+        self.ema3 = EMA(period)
+
+    def update(self, bar):
+        e1 = self.ema1.push(bar[self.field])
+        if math.isnan(e1):
+            return NAN
+        e2 = self.ema2.push(e1)
+        if math.isnan(e2):
+            return NAN
+        e3 = self.ema3.push(e2)
+        if math.isnan(e3):
+            return NAN
+        return 3 * e1 - 3 * e2 + e3
+
+
+class ATR(StreamingIndicator):
+    """
+    Wilder's average true range as in pyti average_true_range
+    """
+
+    __slots__ = ('period', 'prev_close', 'seen', 'total', 'value')
+
+    def __init__(self, period):
+        self.period = period
+        self.prev_close = None
+        self.seen = 0
+        self.total = 0.0
+        self.value = NAN
+
+    def update(self, bar):
+        high, low, close = bar['high'], bar['low'], bar['close']
+        if self.prev_close is None:
+            tr = high - low
+        else:
+            tr = max(high - low, abs(high - self.prev_close), abs(low - self.prev_close))
+        self.prev_close = close
+
+        if self.seen < self.period:
+            self.total += tr
+            self.seen += 1
+            if self.seen < self.period:
+                return NAN
+            self.value = self.total / self.period
+        else:
+            self.value = (self.value * (self.period - 1) + tr) / self.period
+        return self.value
+
+
+class BollingerBands(StreamingIndicator):
+    """
+    pyti bollinger bands, update returns (lower, middle, upper)
+
+    The window sums are kept relative to the first value seen to avoid cancellation
+    in the variance.
+    """
+
+    __slots__ = ('period', 'stdv', 'field', 'window', 'total', 'total_sq', 'offset')
+
+    def __init__(self, period=21, stdv=2, field='close'):
+        self.period = period
+        self.stdv = stdv
+        self.field = field
+        self.window = deque(maxlen=period)
+        self.total = 0.0
+        self.total_sq = 0.0
+        self.offset = None
+
+    def update(self, bar):
+        x = bar[self.field]
+        if self.offset is None:
+            self.offset = x
+        d = x - self.offset
+        if len(self.window) == self.period:
+            old = self.window[0]
+            self.total -= old
+            self.total_sq -= old * old
+        self.window.append(d)
+        self.total += d
+        self.total_sq += d * d
+
+        if len(self.window) < self.period:
+            return NAN, NAN, NAN
+
+        mean = self.total / self.period
+        std = math.sqrt(max(self.total_sq / self.period - mean * mean, 0.0))
+        middle = mean + self.offset
+        return middle - std * self.stdv, middle, middle + std * self.stdv
+
+
+class CCI(StreamingIndicator):
+    """
+    talib.CCI, the mean deviation needs one pass over the window so this is O(period)
+
+    pyti's commodity_channel_index divides by the mean deviation of the whole input,
+    which uses future bars and can not be streamed.
+    """
+
+    __slots__ = ('period', 'window', 'total')
+
+    def __init__(self, period=14):
+        self.period = period
+        self.window = deque(maxlen=period)
+        self.total = 0.0
+
+    def update(self, bar):
+        tp = (bar['high'] + bar['low'] + bar['close']) / 3
+        if len(self.window) == self.period:
+            self.total -= self.window[0]
+        self.window.append(tp)
+        self.total += tp
+
+        if len(self.window) < self.period:
+            return NAN
+
+        mean = self.total / self.period
+        deviation = sum(abs(v - mean) for v in self.window) / self.period
+        if deviation == 0:
+            return 0.0
+        return (tp - mean) / (0.015 * deviation)
+
+
+class CMO(StreamingIndicator):
+    """
+    pyti chande_momentum_oscillator, sums of the up and down moves of the last period closes
+    """
+
+    __slots__ = ('period', 'field', 'prev', 'moves', 'up', 'down', 'seen')
+
+    def __init__(self, period, field='close'):
+        self.period = period
+        self.field = field
+        self.prev = None
+        self.moves = deque(maxlen=period - 1)
+        self.up = 0.0
+        self.down = 0.0
+        self.seen = 0
+
+    def update(self, bar):
+        x = bar[self.field]
+        self.seen += 1
+        if self.prev is not None:
+            if len(self.moves) == self.moves.maxlen and self.moves.maxlen:
+                old = self.moves[0]
+                if old > 0:
+                    self.up -= old
+                else:
+                    self.down += old
+            move = x - self.prev
+            self.moves.append(move)
+            if move > 0:
+                self.up += move
+            else:
+                self.down -= move
+        self.prev = x
+
+        total = self.up + self.down
+        if self.seen < self.period or total == 0:
+            return NAN
+        return 100 * (self.up - self.down) / total
+
+
+class _RollingExtreme():
+    """
+    monotonic deque giving the min or max of the last `length` values in O(1) amortised
+    """
+
+    __slots__ = ('length', 'sign', 'values', 'count')
+
+    def __init__(self, length, maximum):
+        self.length = length
+        self.sign = 1 if maximum else -1
+        self.values = deque()
+        self.count = 0
+
+    def push(self, x):
+        key = self.sign * x
+        while self.values and self.sign * self.values[-1][1] <= key:
+            self.values.pop()
+        self.values.append((self.count, x))
+        self.count += 1
+        if self.values[0][0] <= self.count - 1 - self.length:
+            self.values.popleft()
+        return self.values[0][1]
+
+
+class STC(StreamingIndicator):
+    """
+    indicators.stc, schaff trend cycle on the macd of two emas, the stochastic window
+    is summed directly so this is O(length)
+    """
+
+    __slots__ = ('fast', 'slow', 'length', 'macd_low', 'macd_high', 'valid', 'stoks')
+
+    def __init__(self, fast=23, slow=50, length=10):
+        self.fast = EMA(fast)
+        self.slow = EMA(slow)
+        self.length = length
+        self.macd_low = _RollingExtreme(length, maximum=False)
+        self.macd_high = _RollingExtreme(length, maximum=True)
+        self.valid = 0
+        self.stoks = deque(maxlen=length)
+
+    def update(self, bar):
+        fast = self.fast.update(bar)
+        slow = self.slow.update(bar)
+        macd = fast - slow
+        if math.isnan(macd):
+            return NAN
+
+        low = self.macd_low.push(macd)
+        high = self.macd_high.push(macd)
+        self.valid += 1
+        if self.valid < self.length:
+            return NAN
+
+        stok = (macd - low) / (high - low) * 100 if high != low else NAN
+        self.stoks.append(stok)
+        if len(self.stoks) < self.length:
+            return NAN
+
+        # summed over the window rather than kept as a running sum: the formula divides
+        # by stod - stok, a running sum would turn the exact zeros into huge values
+        stod = sum(self.stoks) / self.length
+        numerator = 100 * (macd - (stok * macd))
+        denominator = (stod * macd) - (stok * macd)
+        if denominator == 0:
+            return math.copysign(math.inf, numerator) if numerator else NAN
+        return numerator / denominator
+
+
+class Ichimoku(StreamingIndicator):
+    """
+    indicators.ichimoku, update returns (tenkan_sen, kijun_sen, senkou_span_a, senkou_span_b)
+    of the bar
+
+    The spans of a bar were computed displacement bars earlier, the ones of the next
+    displacement bars are in projection(). chikou_span looks ahead and has no live value.
+    """
+
+    __slots__ = ('tenkan', 'kijun', 'senkou', 'seen', 'highs', 'lows', 'spans')
+
+    def __init__(self, tenkan=9, kijun=26, senkou=52, displacement=26):
+        self.tenkan = tenkan
+        self.kijun = kijun
+        self.senkou = senkou
+        self.seen = 0
+        self.highs = [_RollingExtreme(length, maximum=True) for length in (tenkan, kijun, senkou)]
+        self.lows = [_RollingExtreme(length, maximum=False) for length in (tenkan, kijun, senkou)]
+        self.spans = deque(maxlen=displacement)
+
+    def update(self, bar):
+        self.seen += 1
+        lines = []
+        for length, highs, lows in zip((self.tenkan, self.kijun, self.senkou), self.highs, self.lows):
+            high, low = highs.push(bar['high']), lows.push(bar['low'])
+            lines.append((high + low) / 2 if self.seen >= length else NAN)
+        tenkan_sen, kijun_sen, span_b = lines
+
+        spans = self.spans[0] if len(self.spans) == self.spans.maxlen else (NAN, NAN)
+        self.spans.append(((tenkan_sen + kijun_sen) / 2, span_b))
+        return (tenkan_sen, kijun_sen) + spans
+
+    def projection(self) -> list:
+        """
+        :return: (senkou_span_a, senkou_span_b) of the next displacement bars
+        """
+        return list(self.spans)
+
+
+class MFI(StreamingIndicator):
+    """
+    talib.MFI, field names can be remapped, Strategy uses MFI(14, low='close')
+    """
+
+    __slots__ = ('period', 'high', 'low', 'close', 'prev_tp', 'flows', 'positive', 'negative')
+
+    def __init__(self, period=14, high='high', low='low', close='close'):
+        self.period = period
+        self.high = high
+        self.low = low
+        self.close = close
+        self.prev_tp = None
+        self.flows = deque(maxlen=period)
+        self.positive = 0.0
+        self.negative = 0.0
+
+    def update(self, bar):
+        tp = (bar[self.high] + bar[self.low] + bar[self.close]) / 3
+        if self.prev_tp is None:
+            self.prev_tp = tp
+            return NAN
+
+        flow = tp * bar['volume']
+        if tp > self.prev_tp:
+            pos, neg = flow, 0.0
+        elif tp < self.prev_tp:
+            pos, neg = 0.0, flow
+        else:
+            pos, neg = 0.0, 0.0
+        self.prev_tp = tp
+
+        if len(self.flows) == self.period:
+            old_pos, old_neg = self.flows[0]
+            self.positive -= old_pos
+            self.negative -= old_neg
+        self.flows.append((pos, neg))
+        self.positive += pos
+        self.negative += neg
+
+        if len(self.flows) < self.period:
+            return NAN
+        total = self.positive + self.negative
+        if total < 1.0:
+            return 0.0
+        return 100 * self.positive / total
+
+
+def _compare(got, expected, rtol, atol):
+    expected = np.asarray(expected, dtype=np.float64).reshape(got.shape)
+    both = np.isfinite(got) & np.isfinite(expected)
+    diff = float(np.max(np.abs(got[both] - expected[both]))) if both.any() else 0.0
+    return bool(np.allclose(got, expected, rtol=rtol, atol=atol, equal_nan=True)), diff
+
+
+def check_parity(dataframe, rtol=1e-6, atol=1e-6) -> dict:
+    """
+    runs every streaming indicator bar by bar and compares it with its batch version
+
+    :param dataframe: dataframe containing open/high/low/close/volume
+    :return: dict name -> (matches, max absolute difference)
+    """
+    import talib
+    import indicators
+    from pyti.average_true_range import average_true_range
+    from pyti.chande_momentum_oscillator import chande_momentum_oscillator
+
+    df = dataframe.reset_index(drop=True)
+    close, high, low, volume = (df[c].values.astype(float) for c in ('close', 'high', 'low', 'volume'))
+    bands = indicators.bollinger_bands(df.copy(), period=21, stdv=2)
+    cloud = indicators.ichimoku(df)
+
+    cases = {
+        'ema': (EMA(14), indicators.ema(df, 14)),
+        'sma': (SMA(14), indicators.sma(df, 14)),
+        'tema': (TEMA(9), indicators.tema(df, 9)),
+        'atr': (ATR(14), average_true_range(close, high, low, 14)),
+        'bollinger_bands': (BollingerBands(21, 2), bands[['bb_lower', 'bb_middle', 'bb_upper']].values),
+        'cci': (CCI(20), talib.CCI(high, low, close, 20)),
+        'cmo': (CMO(14), chande_momentum_oscillator(close, 14)),
+        'stc': (STC(23, 50, 10), indicators.stc(df.copy(), 23, 50, 10)),
+        'mfi': (MFI(14, low='close'), talib.MFI(high, close, close, volume, timeperiod=14)),
+        'ichimoku': (Ichimoku(), np.column_stack([cloud[k].values[:len(df)] for k in
+                                                  ('tenkan_sen', 'kijun_sen', 'senkou_span_a', 'senkou_span_b')])),
+    }
+
+    results = {}
+    for name, (indicator, expected) in cases.items():
+        if name in ('bollinger_bands', 'ichimoku'):
+            got = np.array([indicator.update(bar) for bar in df.to_dict('records')])
+        else:
+            got = indicator.run(df)
+        results[name] = _compare(got, expected, rtol, atol)
+    return results
+
+
+if __name__ == "__main__":
+    from util import synthetic_ohlcv
+
+    for name, (matches, diff) in check_parity(synthetic_ohlcv(5000)).items():
+        print(f"{name:16s} {'ok' if matches else 'MISMATCH'}  max diff {diff:.3g}")
@@ -0,0 +1,137 @@
+"""
+    parallel parameter sweep of Strategy over one shared-memory copy of the candle history
+"""
+import itertools
+import math
+import random
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+
+import numpy as np
+from pandas import DataFrame
+
+from backtest import backtest, summary
+from cache import IndicatorCache
+from strategy import Strategy
+
+COLUMNS = ('open', 'high', 'low', 'close', 'volume')
+
+# parameters that change the indicator columns, sets sharing them are evaluated together
+INDICATOR_PARAMS = ('mfi_period',)
+
+_shared = {}
+
+
+def grid(**params) -> list:
+    """
+    full cartesian product, grid(mfi_period=[10, 14], mfi_oversold=[20, 30])
+
+    :return: list of parameter dicts
+    """
+    names = list(params)
+    return [dict(zip(names, values)) for values in itertools.product(*params.values())]
+
+
+def random_search(n, seed=None, **params) -> list:
+    """
+    n random draws, every parameter is either a list of choices or a (low, high) int range
+
+    :return: list of distinct parameter dicts
+    """
+    rng = random.Random(seed)
+    sets = {}
+    for _ in range(n * 10):
+        draw = {}
+        for name, space in params.items():
+            if isinstance(space, tuple):
+                draw[name] = rng.randint(space[0], space[1])
+            else:
+                draw[name] = rng.choice(space)
+        sets[tuple(sorted(draw.items()))] = draw
+        if len(sets) == n:
+            break
+    return list(sets.values())
+
+
+def _attach(name, length):
+    memory = shared_memory.SharedMemory(name=name)
+    _shared['memory'] = memory
+    # tasks of one worker share the heikin-ashi columns and the mfi of every period
+    _shared['cache'] = IndicatorCache()
+    _shared['values'] = np.ndarray((len(COLUMNS), length), dtype=np.float64, buffer=memory.buf)
+
+
+def _evaluate(param_sets, timeframe, backtest_kwargs):
+    """
+    worker task, indicator columns are computed once for all the given parameter sets
+    and cached for the next tasks of this worker
+    """
+    values = _shared['values']
+    df = DataFrame({name: values[i] for i, name in enumerate(COLUMNS)}, copy=False)
+
+    indicator_params = {k: v for k, v in param_sets[0].items() if k in INDICATOR_PARAMS}
+    strategy = Strategy(None, timeframe=timeframe, cache=_shared['cache'], **indicator_params)
+    # the shared memory never changes while the sweep runs, its name identifies the candles
+    df = strategy.populate_indicators(df, source=_shared['memory'].name)
+
+    results = []
+    for params in param_sets:
+        strategy = Strategy(None, timeframe=timeframe, **params)
+        signals = strategy.signals(df, indicators=False)
+        result = backtest(df, strategy, signals=signals, **backtest_kwargs)
+        results.append(dict(params, **summary(result)))
+    return results
+
+
+def _tasks(param_sets, workers) -> list:
+    groups = {}
+    for params in param_sets:
+        key = tuple(params.get(k) for k in INDICATOR_PARAMS)
+        groups.setdefault(key, []).append(params)
+
+    # split groups into enough chunks to keep every worker busy
+    size = max(1, math.ceil(len(param_sets) / (workers * 4)))
+    return [group[i:i + size] for group in groups.values() for i in range(0, len(group), size)]
+
+
+def run_sweep(df, param_sets, workers=None, timeframe='1m', sort_by='profit', on_result=None,
+              **backtest_kwargs) -> DataFrame:
+    """
+    backtests every parameter set on a process pool
+
+    The OHLCV columns are copied once into shared memory and every worker maps them,
+    nothing but parameters and summaries is pickled.
+
+    :param df: dataframe containing open/high/low/close/volume
+    :param param_sets: list of Strategy keyword arguments, see grid and random_search
+    :param workers: number of processes, all cores if None
+    :param sort_by: summary column the table is ranked by, descending
+    :param on_result: callable(row) invoked as soon as each result arrives
+    :param backtest_kwargs: passed to backtest, e.g. money_to_trade, leverage, fee
+    :return: ranked DataFrame, one row per parameter set
+    """
+    from os import cpu_count
+    workers = workers or cpu_count()
+
+    n = len(df)
+    memory = shared_memory.SharedMemory(create=True, size=max(1, len(COLUMNS) * n * 8))
+    try:
+        values = np.ndarray((len(COLUMNS), n), dtype=np.float64, buffer=memory.buf)
+        for i, name in enumerate(COLUMNS):
+            values[i] = df[name].values
+
+        rows = []
+        with ProcessPoolExecutor(max_workers=workers, initializer=_attach, initargs=(memory.name, n)) as pool:
+            futures = [pool.submit(_evaluate, task, timeframe, backtest_kwargs)
+                       for task in _tasks(param_sets, workers)]
+            for future in as_completed(futures):
+                for row in future.result():
+                    rows.append(row)
+                    if on_result is not None:
+                        on_result(row)
+        del values
+    finally:
+        memory.close()
+        memory.unlink()
+
+    return DataFrame(rows).sort_values(sort_by, ascending=False, ignore_index=True)
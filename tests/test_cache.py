@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+import talib
+
+from cache import IndicatorCache
+from util import synthetic_ohlcv
+
+
+@pytest.mark.parametrize('source', [None, 'XBTUSD'])
+def test_extension_matches_recompute(source):
+    close = synthetic_ohlcv(600, seed=2)['close'].to_numpy()
+    cache = IndicatorCache()
+    for n in range(500, 601):
+        result = cache.get('ema', close[:n], source=source, period=14)
+    assert cache.stats['misses'] == 1 and cache.stats['extensions'] == 100
+    np.testing.assert_allclose(result, talib.EMA(close, 14), rtol=1e-12)
+
+    # earlier results are views on the same buffer and are not overwritten by extensions
+    np.testing.assert_allclose(cache.get('ema', close[:550], source=source, period=14),
+                               talib.EMA(close, 14)[:550], rtol=1e-12)
+    assert cache.stats['hits'] == 1
+
+
+def test_changed_prefix_is_recomputed():
+    close = synthetic_ohlcv(600, seed=2)['close'].to_numpy()
+    cache = IndicatorCache()
+    cache.get('ema', close[:500], period=14)
+    changed = close.copy()
+    changed[250] += 1
+    result = cache.get('ema', changed, period=14)
+    assert cache.stats['extensions'] == 0
+    np.testing.assert_allclose(result, talib.EMA(changed, 14), rtol=1e-12)
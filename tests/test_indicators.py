@@ -0,0 +1,99 @@
+import numpy as np
+import pytest
+import talib
+
+from indicators import LaguerreState, aroon, bollinger_bands, laguerre
+from util import synthetic_ohlcv
+
+
+def laguerre_itertuples(dataframe, gamma):
+    """
+    indicators.laguerre as it was before LaguerreState, it never applied smooth
+    """
+    lrsi_l = []
+    g = gamma
+    L0, L1, L2, L3 = 0.0, 0.0, 0.0, 0.0
+    for row in dataframe.itertuples(index=True, name='lrsi'):
+        L0_1, L1_1, L2_1, L3_1 = L0, L1, L2, L3
+
+        L0 = (1 - g) * row.close + g * L0_1
+        L1 = -g * L0 + L0_1 + g * L1_1
+        L2 = -g * L1 + L1_1 + g * L2_1
+        L3 = -g * L2 + L2_1 + g * L3_1
+
+        cu = 0.0
+        cd = 0.0
+        if (L0 >= L1):
+            cu = L0 - L1
+        else:
+            cd = L1 - L0
+
+        if (L1 >= L2):
+            cu = cu + L1 - L2
+        else:
+            cd = cd + L2 - L1
+
+        if (L2 >= L3):
+            cu = cu + L2 - L3
+        else:
+            cd = cd + L3 - L2
+
+        if (cu + cd) != 0:
+            lrsi_l.append(cu / (cu + cd))
+        else:
+            lrsi_l.append(0)
+
+    return np.array(lrsi_l, dtype=np.float64)
+
+
+@pytest.fixture(scope='module')
+def candles():
+    return synthetic_ohlcv(3000, seed=7)
+
+
+@pytest.mark.parametrize('gamma', [0.5, 0.75])
+@pytest.mark.parametrize('smooth', [1, 5])
+def test_laguerre_matches_itertuples(candles, gamma, smooth):
+    expected = laguerre_itertuples(candles, gamma)
+    if smooth > 1:
+        expected = talib.EMA(expected, smooth)
+
+    got = laguerre(candles, gamma=gamma, smooth=smooth)
+
+    np.testing.assert_allclose(got, expected, rtol=1e-12, atol=1e-12)
+    assert np.isnan(got[:smooth - 1]).all()
+
+
+@pytest.mark.parametrize('smooth', [1, 5])
+@pytest.mark.parametrize('split', [1, 4, 1500, 2999])
+def test_laguerre_state_resumed_matches_batch(candles, smooth, split):
+    close = candles['close'].to_numpy()
+    batch = laguerre(candles, gamma=0.75, smooth=smooth)
+
+    lrsi = LaguerreState(0.75, smooth)
+    head = lrsi.run(close[:split])
+    tail = [lrsi.update(c) for c in close[split:]]
+
+    np.testing.assert_array_equal(np.concatenate((head, tail)), batch)
+
+
+@pytest.mark.parametrize('period', [5, 25])
+def test_aroon_matches_pyti(candles, period):
+    from pyti.aroon import aroon_down, aroon_up
+
+    close = candles['close'].to_numpy()
+    got = aroon(candles.copy(), period=period)
+
+    np.testing.assert_array_equal(got['aroon_up'].to_numpy(), aroon_up(close, period))
+    np.testing.assert_array_equal(got['aroon_down'].to_numpy(), aroon_down(close, period))
+
+
+def test_bollinger_bands_match_pyti(candles):
+    from pyti.bollinger_bands import lower_bollinger_band, middle_bollinger_band, upper_bollinger_band
+
+    close = candles['close'].to_numpy()
+    got = bollinger_bands(candles.copy(), period=21, stdv=2)
+
+    for column, band in (('bb_lower', lower_bollinger_band), ('bb_middle', middle_bollinger_band),
+                         ('bb_upper', upper_bollinger_band)):
+        np.testing.assert_allclose(got[column].to_numpy(), band(close, 21, 2), rtol=1e-10)
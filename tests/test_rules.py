@@ -0,0 +1,18 @@
+import numpy as np
+
+from strategy import Strategy
+
+
+def test_predict_is_neutral_without_bars():
+    strategy = Strategy(None, timeframe='1m')
+    empty = {'ha_open': np.array([]), 'ha_close': np.array([]), 'mfi': np.array([])}
+
+    assert strategy.rules.predict(empty) == 0
+    assert strategy.predict(refresh=False) == 0  # empty candle buffer, e.g. after a failed backfill
+
+
+def test_predict_matches_last_signal():
+    strategy = Strategy(None, timeframe='1m')
+    columns = {'ha_open': np.array([1.0, 1.0]), 'ha_close': np.array([2.0, 2.0]), 'mfi': np.array([25.0, 35.0])}
+
+    assert strategy.rules.predict(columns) == strategy.rules.signals(columns)[-1] == 1
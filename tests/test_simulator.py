@@ -0,0 +1,26 @@
+import pytest
+
+from backtest import backtest
+from simulator import SimulatedExchange
+from strategy import Strategy
+from trader import Trader
+from util import synthetic_ohlcv
+
+
+@pytest.mark.parametrize('execution', ['sequential', 'netted'])
+def test_replay_matches_backtest(execution):
+    df = synthetic_ohlcv(2000, seed=1)
+    exchange = SimulatedExchange(candles=df)
+    trader = Trader(exchange, Strategy(exchange, timeframe='1m'), execution=execution)
+
+    def on_bar(exchange):
+        # in netted mode the order is sent from the trader's thread, waiting for it
+        # needs the exchange to serve requests between bins
+        future = trader.execute_trade()
+        if future is not None:
+            future.result(timeout=10)
+
+    exchange.run(on_bar=on_bar)
+
+    expected = backtest(df, Strategy(None, timeframe='1m'))['equity'].iloc[-1]
+    assert exchange.equity() == pytest.approx(expected, rel=1e-9, abs=1e-12)
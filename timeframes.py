@@ -0,0 +1,200 @@
+"""
+    higher timeframe candles built incrementally from a base timeframe
+"""
+import numpy as np
+from pandas import DataFrame, to_datetime
+
+from candles import CandleBuffer, timestamp_ms
+from configuration import TICKER_INTERVAL_MINUTES
+
+
+def interval_minutes(interval) -> int:
+    """
+    :param interval: one of TICKER_INTERVAL_MINUTES or a number of minutes
+    """
+    return TICKER_INTERVAL_MINUTES[interval] if isinstance(interval, str) else int(interval)
+
+
+def dates_ms(dates) -> np.ndarray:
+    """
+    :param dates: date column of a candle dataframe
+    :return: epoch milliseconds as int64
+    """
+    return np.asarray(to_datetime(dates, utc=True).values.astype('datetime64[ms]').astype(np.int64))
+
+
+def aggregate(dates, open, high, low, close, volume, interval_ms):
+    """
+    groups base bins into higher timeframe bins in one pass
+
+    Bins are stamped with their close time like the exchange does: the bin stamped T
+    holds the base bins stamped in (T - interval, T].
+
+    :param dates: sorted base bin timestamps in epoch milliseconds
+    :return: (timestamps, open, high, low, close, volume) of the higher timeframe bins
+    """
+    labels = -(-dates // interval_ms) * interval_ms
+    if labels.shape[0] == 0:
+        return (labels,) + tuple(np.empty(0) for _ in range(5))
+    starts = np.flatnonzero(np.r_[True, labels[1:] != labels[:-1]])
+    ends = np.r_[starts[1:], labels.shape[0]] - 1
+    return (labels[starts],
+            np.asarray(open)[starts],
+            np.maximum.reduceat(high, starts),
+            np.minimum.reduceat(low, starts),
+            np.asarray(close)[ends],
+            np.add.reduceat(volume, starts))
+
+
+def align(bin_dates, values, dates) -> np.ndarray:
+    """
+    forward fills higher timeframe values onto base timestamps without look-ahead
+
+    :param bin_dates: sorted close timestamps of the higher timeframe bins, epoch milliseconds
+    :param values: one column of the higher timeframe bins
+    :param dates: base timestamps, epoch milliseconds
+    :return: value of the last bin closed at each base timestamp, NaN before the first one
+    """
+    index = np.searchsorted(bin_dates, dates, side='right') - 1
+    values = np.asarray(values, dtype=np.float64)
+    if values.shape[0] == 0:
+        return np.full(index.shape[0], np.nan)
+    out = values[np.maximum(index, 0)]
+    out[index < 0] = np.nan
+    return out
+
+
+class TimeframeAggregator():
+    """
+    builds one higher timeframe from base bins, each base bin updates the open higher
+    timeframe bin in O(1)
+
+    Closed bins are kept in a CandleBuffer. A bin closes with the base bin stamped at
+    its own close time, or when a base bin of a later bin arrives after a gap.
+    aligned() maps them onto base timestamps without look-ahead: every base bin only
+    sees the higher timeframe bins that had closed by its own close.
+    """
+
+    def __init__(self, interval='1h', capacity=1000):
+        self.interval = interval_minutes(interval)
+        self.interval_ms = self.interval * 60 * 1000
+        self.bins = CandleBuffer(capacity, timeframe=self.interval)
+        self.last_base = None
+        self._open = None  # [timestamp, open, high, low, close, volume] of the unfinished bin
+
+    def __len__(self):
+        return len(self.bins)
+
+    def update(self, timestamp, open, high, low, close, volume) -> bool:
+        """
+        adds a closed base bin, bins not newer than the last one are ignored
+
+        :return: True if a higher timeframe bin closed
+        """
+        timestamp = timestamp_ms(timestamp)
+        if self.last_base is not None and timestamp <= self.last_base:
+            return False
+        self.last_base = timestamp
+
+        closed = False
+        label = -(-timestamp // self.interval_ms) * self.interval_ms
+        current = self._open
+        if current is not None and current[0] != label:
+            self.bins.append(*current)
+            current = None
+            closed = True
+
+        if current is None:
+            self._open = current = [label, open, high, low, close, volume]
+        else:
+            if high > current[2]:
+                current[2] = high
+            if low < current[3]:
+                current[3] = low
+            current[4] = close
+            current[5] += volume
+
+        if timestamp == label:
+            self.bins.append(*current)
+            self._open = None
+            closed = True
+        return closed
+
+    def extend(self, dates, open, high, low, close, volume) -> int:
+        """
+        adds many base bins at once, same result as calling update for each
+
+        :param dates: sorted epoch milliseconds
+        :return: number of higher timeframe bins closed
+        """
+        dates = np.asarray(dates, dtype=np.int64)
+        if self.last_base is not None:
+            skip = int(np.searchsorted(dates, self.last_base, side='right'))
+            dates, open, high, low, close, volume = (c[skip:] for c in (dates, open, high, low, close, volume))
+        if dates.shape[0] == 0:
+            return 0
+
+        # the first base bin joins the open bin the usual way, the rest are grouped at once
+        closed = int(self.update(dates[0], open[0], high[0], low[0], close[0], volume[0]))
+        if dates.shape[0] == 1:
+            return closed
+
+        labels, o, h, l, c, v = aggregate(dates[1:], open[1:], high[1:], low[1:], close[1:], volume[1:],
+                                          self.interval_ms)
+        current = self._open
+        first = 0
+        if current is not None and current[0] == labels[0]:
+            current[2] = max(current[2], h[0])
+            current[3] = min(current[3], l[0])
+            current[4] = c[0]
+            current[5] += v[0]
+            first = 1
+            if labels.shape[0] > 1 or dates[-1] == labels[0]:
+                self.bins.append(*current)
+                closed += 1
+                self._open = None
+        elif current is not None:
+            self.bins.append(*current)
+            closed += 1
+            self._open = None
+
+        last = labels.shape[0] - 1
+        for i in range(first, labels.shape[0]):
+            row = [int(labels[i]), o[i], h[i], l[i], c[i], v[i]]
+            if i == last and dates[-1] != labels[i]:
+                self._open = row
+            else:
+                self.bins.append(*row)
+                closed += 1
+
+        self.last_base = int(dates[-1])
+        return closed
+
+    def sync(self, candles) -> int:
+        """
+        adds the bins of a base CandleBuffer that are newer than the last one added
+
+        :return: number of higher timeframe bins closed
+        """
+        return self.extend(candles.dates(), *(candles.column(name) for name in CandleBuffer.COLUMNS))
+
+    def current(self) -> dict:
+        """
+        :return: the unfinished higher timeframe bin or None
+        """
+        if self._open is None:
+            return None
+        return dict(zip(('timestamp',) + CandleBuffer.COLUMNS, self._open))
+
+    def aligned(self, dates, name='close') -> np.ndarray:
+        """
+        the column of the last higher timeframe bin closed at each base timestamp,
+        forward filled, NaN before the first one
+
+        :param dates: base timestamps in epoch milliseconds
+        :param name: one of open/high/low/close/volume
+        """
+        return align(self.bins.dates(), self.bins.column(name), dates)
+
+    def dataframe(self) -> DataFrame:
+        return self.bins.dataframe()
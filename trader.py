@@ -1,79 +1,175 @@
+import json
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import METRICS
+
+
 class Trader():
-    def __init__(self, client, strategy, money_to_trade=100, leverage=5):
+    def __init__(self, client, strategy, money_to_trade=100, leverage=5, symbol=None, execution='sequential',
+                 positions=None):
+        """
+        :param execution: 'sequential' waits for every request in turn, 'netted' sends one
+            order per signal (a flip is a single order of twice the size) from a background
+            thread so the strategy loop is never blocked
+        :param positions: PositionBook fed by the private streams, positions are read from it
+            instead of Position_get once it is synced
+        """
         self.client = client
         self.strategy = strategy
-        # self.pair = pair
+        self.symbol = symbol or strategy.symbol
         self.money_to_trade = money_to_trade
         self.leverage = leverage
+        self.execution = execution
+        self.positions = positions
+
+        # (operation, seconds from submit to ack) of every exchange request in netted mode
+        self.latencies = deque(maxlen=1000)
+        # position as known from our own order acks, None when it has to be fetched
+        self.position = None
+        self._executor = None
+
+    def execute_trade(self, refresh=True):
+        started = time.perf_counter()
+        try:
+            return self._execute_trade(refresh, started)
+        finally:
+            METRICS.observe('tick_seconds', time.perf_counter() - started,
+                            symbol=self.symbol, timeframe=self.strategy.timeframe)
 
-    def execute_trade(self):
-        prediction = self.strategy.predict()
+    def _execute_trade(self, refresh, started):
+        try:
+            prediction = self.strategy.predict(refresh=refresh)
+        except Exception:
+            METRICS.inc('errors_total', stage='predict', symbol=self.symbol)
+            raise
 
+        predicted = time.perf_counter()
+        METRICS.inc('predictions_total', signal=prediction, symbol=self.symbol)
         print(f"Last prediction: {prediction}")
 
+        if self.execution == 'netted':
+            future = self.submit(prediction)
+            METRICS.observe('stage_seconds', time.perf_counter() - predicted, stage='orders',
+                            symbol=self.symbol, timeframe=self.strategy.timeframe)
+            return future
+
         try:
-            if prediction == 1:  # buy
+            self.position = None  # nothing tracks our own orders in this mode
 
-                res = self.client.Position.Position_get(
-                    filter="{\"symbol\":\"XBTUSD\"}",
-                    # filter="{\"symbol\":\"{}\"}".format(self.pair),
-                    columns="[\"currentQty\"]"
-                ).result()
+            if prediction == 1:  # buy
 
-                if res[0][0]['execSellQty'] > 0:
+                if self.current_qty() < 0:
                     close = self.client.Order.Order_closePosition(
-                        symbol="XBTUSD"
-                        # symbol=self.pair
+                        symbol=self.symbol
                     ).result()
 
                 buy = self.client.Order.Order_new(
-                    symbol="XBTUSD",
-                    # symbol=self.pair,
+                    symbol=self.symbol,
                     side="Buy",
                     orderQty=self.money_to_trade * self.leverage,
                 ).result()
 
             if prediction == 2:  # sell
 
-                res = self.client.Position.Position_get(
-                    filter="{\"symbol\":\"XBTUSD\"}",
-                    # filter="{\"symbol\":\"{}\"}".format(self.pair),
-                    columns="[\"currentQty\"]"
-                ).result()
-
-                if res[0][0]['execBuyQty'] > 0:
+                if self.current_qty() > 0:
                     close = self.client.Order.Order_closePosition(
-                        symbol="XBTUSD"
-                        # symbol=self.pair
+                        symbol=self.symbol
                     ).result()
 
                 sell = self.client.Order.Order_new(
-                    symbol="XBTUSD",
-                    # symbol=self.pair,
+                    symbol=self.symbol,
                     side="Sell",
                     orderQty=self.money_to_trade * self.leverage,
                 ).result()
 
             if prediction == 3:  # tp hit close any position
 
-                res = self.client.Position.Position_get(
-                    filter="{\"symbol\":\"XBTUSD\"}",
-                    columns="[\"currentQty\"]"
-                ).result()
-
-                if res[0][0]['currentQty'] != 0:
+                if self.current_qty() != 0:
                     close = self.client.Order.Order_closePosition(
-                        symbol="XBTUSD"
+                        symbol=self.symbol
                     ).result()
 
             # if prediction == 0:
-            #     res = self.client.Position.Position_get(
-            #         filter="{\"symbol\":\"XBTUSD\"}",
-            #         columns="[\"currentQty\"]"
-            #     ).result()
-            #     print(res[0][0]['currentQty'])
-
-        except Exception:
-            print("Something goes wrong!")
-
-        return
+            #     print(self.current_qty())
+
+        except Exception as e:
+            METRICS.inc('errors_total', stage='orders', symbol=self.symbol)
+            print(f"Something goes wrong! {e!r}")
+
+        METRICS.observe('stage_seconds', time.perf_counter() - predicted, stage='orders',
+                        symbol=self.symbol, timeframe=self.strategy.timeframe)
+
+    def submit(self, prediction):
+        """
+        queues the orders of a prediction and returns at once, requests of one trader
+        are still sent in order on its own thread
+
+        :return: Future of the order response, None when there is nothing to do
+        """
+        if prediction not in (1, 2, 3):
+            return None
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='orders-' + self.symbol)
+        return self._executor.submit(self._execute_netted, prediction)
+
+    def _request(self, operation, future):
+        sent = time.perf_counter()
+        res = future.result()
+        elapsed = time.perf_counter() - sent
+        self.latencies.append((operation, elapsed))
+        return res
+
+    def current_qty(self):
+        """
+        signed position in contracts, from the position book when there is one, else from
+        our own order acks, else from Position_get
+        """
+        if self.positions is not None and self.positions.synced:
+            return self.positions.current_qty(self.symbol)
+        if self.position is None:
+            res = self._request('Position_get', self.client.Position.Position_get(
+                filter=json.dumps({"symbol": self.symbol}),
+                columns=json.dumps(["currentQty"])
+            ))
+            self.position = res[0][0]['currentQty'] if res[0] else 0
+        return self.position
+
+    def _execute_netted(self, prediction):
+        try:
+            current = self.current_qty()
+            qty = self.money_to_trade * self.leverage
+            exec_inst = ''
+
+            if prediction == 1:  # buy, covering any short in the same order
+                side, qty = "Buy", qty + max(0, -current)
+            elif prediction == 2:  # sell, closing any long in the same order
+                side, qty = "Sell", qty + max(0, current)
+            elif current != 0:  # tp hit close any position
+                # Close can only reduce the position, a stale estimate never opens a reverse one
+                side, qty, exec_inst = ("Sell" if current > 0 else "Buy"), abs(current), 'Close'
+            else:
+                return None
+
+            res = self._request('Order_new', self.client.Order.Order_new(
+                symbol=self.symbol,
+                side=side,
+                orderQty=qty,
+                **({'execInst': exec_inst} if exec_inst else {})
+            ))
+            order = res[0]
+
+            filled = order.get('cumQty', qty) if isinstance(order, dict) else qty
+            if filled == qty:
+                self.position = current + (qty if side == "Buy" else -qty)
+            else:
+                self.position = None  # partially filled, ask the exchange next time
+
+            print(f"{side} {qty} {self.symbol} acked in {self.latencies[-1][1] * 1000:.1f}ms")
+            return order
+
+        except Exception as e:
+            self.position = None
+            METRICS.inc('errors_total', stage='orders', symbol=self.symbol)
+            print(f"Something goes wrong! {e!r}")
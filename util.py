@@ -1,70 +1,94 @@
 """
     defines utility functions to be used
 """
-from pandas import DatetimeIndex, merge, DataFrame, to_datetime
+from datetime import datetime, timezone
+
+import numpy as np
+from pandas import DatetimeIndex, DataFrame, to_datetime, date_range
+
 from configuration import TICKER_INTERVAL_MINUTES
+from timeframes import aggregate, align, dates_ms, interval_minutes
 
 
-def parse_dataframe(ticker: list) -> DataFrame:
+def _timestamps_ms(values: list) -> np.ndarray:
     """
-    builds dataframe based on the given trades
+    bin timestamps to epoch milliseconds in one vectorized conversion
 
-    :param ticker: see /trade/bucketed API
-    :return: DataFrame
+    :param values: datetimes (bravado), ISO 8601 strings (raw JSON) or epoch milliseconds
+    :return: int64 array
     """
+    first = values[0]
+    if isinstance(first, str):
+        # numpy parses ISO 8601 natively, it only rejects the trailing Z of UTC
+        return np.array([v[:-1] if v[-1] == 'Z' else v for v in values], dtype='datetime64[ms]').astype(np.int64)
+    if isinstance(first, datetime):
+        if first.tzinfo is None:
+            values = [v.replace(tzinfo=timezone.utc) for v in values]
+        return np.rint(np.array([v.timestamp() for v in values]) * 1000).astype(np.int64)
+    return np.asarray(values, dtype=np.int64)
 
-    cols = ['timestamp', 'symbol', 'open', 'high', 'low', 'close', 'trades', 'volume', 'vwap', 'lastSize', 'turnover', 'homeNotional', 'foreignNotional']
-    frame = DataFrame(ticker, columns=cols)
-
-    # drop unnecessary columns
-    frame.drop(['symbol', 'trades', 'vwap', 'lastSize', 'turnover', 'homeNotional', 'foreignNotional'], axis=1)
 
-    # rename timestamp column
-    frame = frame.rename(columns={'timestamp': 'date'})
-
-    # reformat date column
-    frame['date'] = to_datetime(frame['date'],
-                                unit='ms',
-                                utc=True,
-                                infer_datetime_format=True)
-
-    # group by index and aggregate results to eliminate duplicate ticks
-    frame = frame.groupby(by='date', as_index=False, sort=True).agg({
-        'open': 'first',
-        'high': 'max',
-        'low': 'min',
-        'close': 'last',
-        'volume': 'max',
-    })
+def parse_dataframe(ticker: list) -> DataFrame:
+    """
+    builds dataframe based on the given trades
 
-    frame.drop(frame.tail(1).index, inplace=True)  # eliminate partial candle
+    Only the OHLCV fields are read, straight into typed arrays. Bins are sorted and
+    duplicates merged only when the payload is not already strictly increasing.
 
-    return frame
+    :param ticker: see /trade/bucketed API
+    :return: DataFrame
+    """
+    n = len(ticker)
+    if n == 0:
+        return DataFrame({'date': to_datetime(np.empty(0, dtype=np.int64), unit='ms', utc=True),
+                          'open': [], 'high': [], 'low': [], 'close': [], 'volume': []})
+
+    dates = _timestamps_ms([row['timestamp'] for row in ticker])
+    columns = {name: np.array([row[name] for row in ticker], dtype=np.float64)
+               for name in ('open', 'high', 'low', 'close', 'volume')}
+
+    if n > 1 and not (dates[1:] > dates[:-1]).all():
+        # group by date to eliminate duplicate ticks: first open, max high and volume, min low, last close
+        order = np.argsort(dates, kind='stable')
+        dates = dates[order]
+        starts = np.flatnonzero(np.r_[True, dates[1:] != dates[:-1]])
+        ends = np.r_[starts[1:], n] - 1
+        columns = {name: values[order] for name, values in columns.items()}
+        columns['open'] = columns['open'][starts]
+        columns['high'] = np.fmax.reduceat(columns['high'], starts)
+        columns['low'] = np.fmin.reduceat(columns['low'], starts)
+        columns['close'] = columns['close'][ends]
+        columns['volume'] = np.fmax.reduceat(columns['volume'], starts)
+        dates = dates[starts]
+
+    # eliminate partial candle
+    frame = {'date': to_datetime(dates[:-1], unit='ms', utc=True)}
+    for name, values in columns.items():
+        frame[name] = values[:-1]
+
+    return DataFrame(frame, copy=False)
 
 
 def resample_to_interval(dataframe, interval):
-    if isinstance(interval, str):
-        interval = TICKER_INTERVAL_MINUTES[interval]
-
     """
         resamples the given dataframe to the desired interval. Please be aware you need to upscale this to join the results
         with the other dataframe
 
+    Bins are stamped with their close time like the exchange does, see timeframes.aggregate.
+    For live use keep a timeframes.TimeframeAggregator instead, it only processes new bins.
+
     :param dataframe: dataframe containing close/high/low/open/volume
     :param interval: to which ticker value in minutes would you like to resample it
     :return:
     """
-
-    df = dataframe.copy()
-    df = df.set_index(DatetimeIndex(df['date']))
-    ohlc_dict = {
-        'open': 'first',
-        'high': 'max',
-        'low': 'min',
-        'close': 'last',
-        'volume': 'sum'
-    }
-    df = df.resample(str(interval) + 'min').agg(ohlc_dict).dropna()
+    interval = interval_minutes(interval)
+    dates, open, high, low, close, volume = aggregate(
+        dates_ms(dataframe['date']),
+        *(dataframe[name].to_numpy(dtype=np.float64) for name in ('open', 'high', 'low', 'close', 'volume')),
+        interval_ms=interval * 60 * 1000)
+
+    index = DatetimeIndex(to_datetime(dates, unit='ms', utc=True))
+    df = DataFrame({'open': open, 'high': high, 'low': low, 'close': close, 'volume': volume}, index=index)
     df['date'] = df.index
 
     return df
@@ -74,32 +98,23 @@ def resampled_merge(original, resampled):
     """
     this method merges a resampled dataset back into the orignal data set
 
+    Every row gets the values of the last resampled bin closed at its own date, so no
+    row sees a bin that was still open at that time.
+
     :param original: the original non resampled dataset
     :param resampled:  the resampled dataset
     :return: the merged dataset
     """
+    dates = dates_ms(original['date'])
+    resampled_dates = dates_ms(resampled['date'])
+    resampled_interval = int(np.diff(resampled_dates).min() // 60000) if resampled_dates.shape[0] > 1 \
+        else compute_interval(resampled)
 
-    interval = int((original['date'] - original['date'].shift()).min().seconds / 60)
-    resampled_interval = compute_interval(resampled)
-
-    # no point in interpolating these colums
-    # resampled = resampled.drop(columns=['date', 'volume'])
-    resampled = resampled.drop(['date', 'volume'], axis=1)
+    columns = {}
+    for header in ('open', 'high', 'low', 'close'):
+        columns['resample_{}_{}'.format(resampled_interval, header)] = align(resampled_dates, resampled[header], dates)
 
-    # rename all the colums to the correct interval
-    for header in list(resampled):
-        # store the resampled columns in it
-        resampled['resample_{}_{}'.format(resampled_interval, header)] = resampled[header]
-
-    # drop columns which should not be joined
-    # resampled = resampled.drop(columns=['open', 'high', 'low', 'close'])
-    resampled = resampled.drop(['open', 'high', 'low', 'close'], axis=1)
-
-    resampled = resampled.resample(str(interval) + 'min').interpolate(method='nearest')
-    resampled['date'] = resampled.index
-    resampled.index = range(len(resampled))
-    dataframe = merge(original, resampled, on='date', how='left')
-    return dataframe
+    return original.assign(**columns)
 
 
 def compute_interval(dataframe: DataFrame, exchange_interval=False):
@@ -124,3 +139,32 @@ def compute_interval(dataframe: DataFrame, exchange_interval=False):
 
     return resampled_interval
 
+
+def synthetic_ohlcv(rows: int, seed=0, start='2018-01-01', interval=1) -> DataFrame:
+    """
+    deterministic random walk candles in the parse_dataframe layout, for benchmarks and parity checks
+
+    :param rows: number of candles
+    :param seed: random seed, the same seed always gives the same candles
+    :param start: date of the first candle
+    :param interval: minutes between candles
+    :return: DataFrame with date/open/high/low/close/volume
+    """
+    rng = np.random.default_rng(seed)
+    close = 10000 * np.exp(np.cumsum(rng.normal(0, 0.001, rows)))
+    open = np.empty(rows)
+    open[0] = close[0]
+    open[1:] = close[:-1]
+    spread = close * rng.random(rows) * 0.001
+    high = np.maximum(open, close) + spread
+    low = np.minimum(open, close) - spread
+    volume = rng.integers(1, 100000, rows).astype(float)
+
+    return DataFrame({
+        'date': date_range(start, periods=rows, freq='{}min'.format(interval), tz='UTC'),
+        'open': open,
+        'high': high,
+        'low': low,
+        'close': close,
+        'volume': volume,
+    })